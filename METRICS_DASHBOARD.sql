@@ -17,6 +17,80 @@ order by level;
 -- DateOps plans
 select count(*) as date_plans_total from date_plans;
 
+-- DateOps plans by city, last 30 days (canonical city_key; LUNA_CITY_KEYS, idx_date_plans_city_key)
+select city_key, count(*) as date_plans_30d, count(distinct user_id) as users_30d
+from date_plans
+where city_key is not null
+  and created_at >= now() - interval '30 days'
+group by city_key
+order by date_plans_30d desc
+limit 50;
+
+-- DateOps criteria mix, last 30 days (generated columns; idx_date_plans_criteria)
+select price_tier, noise_level, count(*) as date_plans_30d
+from date_plans
+where created_at >= now() - interval '30 days'
+group by price_tier, noise_level
+order by date_plans_30d desc;
+
+-- Top plan categories per city (idx_date_plans_city_category)
+select city_key, category, count(*) as date_plans
+from date_plans
+where city_key is not null and category is not null
+group by city_key, category
+order by city_key, date_plans desc;
+
+-- ------------------------------------------------------------
+-- Archetype cohorts
+-- Generated columns from schema.sql (communication_style, conflict_style, energy_level,
+-- schema_version, blind_spot_patterns); no archetype_json parsing. One row per user and
+-- level: the latest archetype, like the get_archetype_benchmarks cohort.
+-- ------------------------------------------------------------
+
+-- Style mix per level (idx_archetypes_user_level_latest, index-only)
+with latest as (
+  select distinct on (user_id, level) level, communication_style, conflict_style, energy_level
+  from archetypes
+  order by user_id, level, created_at desc
+)
+select level, communication_style, conflict_style, energy_level, count(*) as users,
+       round(100.0 * count(*) / sum(count(*)) over (partition by level), 1) as pct_of_level
+from latest
+group by level, communication_style, conflict_style, energy_level
+order by level, users desc;
+
+-- Communication style by weekly cohort (week of the user's first archetype)
+with first_arch as (
+  select distinct on (user_id) user_id, date_trunc('week', created_at) as cohort_week, communication_style
+  from archetypes
+  where level = 'lite'
+  order by user_id, created_at
+)
+select cohort_week::date, communication_style, count(*) as users
+from first_arch
+group by 1, 2
+order by 1 desc, users desc;
+
+-- Archetype schema versions still in storage (idx_archetypes_schema_version)
+select schema_version, count(*) as archetypes, max(created_at) as last_written
+from archetypes
+group by schema_version
+order by last_written desc;
+
+-- Most common blind-spot patterns (null where blind_spots was packed into content_blobs)
+select pattern, count(*) as archetypes
+from archetypes, unnest(blind_spot_patterns) as pattern
+group by pattern
+order by archetypes desc
+limit 50;
+
+-- Users sharing one blind-spot pattern, by conflict style (GIN: idx_archetypes_blind_spots)
+select conflict_style, count(distinct user_id) as users
+from archetypes
+where blind_spot_patterns @> array['cancels plans last minute']
+group by conflict_style
+order by users desc;
+
 -- ------------------------------------------------------------
 -- Activation / completion rates
 -- You must emit events via log_event() in SYSTEM_PROMPT.
@@ -0,0 +1,20 @@
+"""
+Single-process ASGI app: REST routes (openapi_wrapper) + MCP streamable HTTP (server).
+
+Both front-ends call the same luna.service.LunaService, so one process holds one
+Supabase client, one rate limiter, one gate cache and one spool.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port $PORT
+  - REST:  /api/...
+  - MCP:   /mcp
+"""
+
+from openapi_wrapper import create_app
+from server import mcp
+
+mcp_app = mcp.http_app(path="/mcp")
+
+# REST routes are registered first; everything else (i.e. /mcp) falls through to
+# the MCP transport. Its lifespan starts the MCP session manager.
+app = create_app(lifespan=mcp_app.lifespan)
+app.mount("/", mcp_app)
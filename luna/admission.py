@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .errors import LunaError
+
+# Priorities, most important first.
+HIGH = "high"      # user-visible writes (store_*, consent, opt-out): keep headroom
+NORMAL = "normal"  # reads: rejected once the soft limit is crossed
+LOW = "low"        # events / feedback: shed to the spool once the soft limit is crossed
+
+
+class AdmissionController:
+    """
+    Bounded executor for service calls that touch storage.
+
+    Calls run on a dedicated pool of `workers` threads instead of the event loop or the
+    framework's shared threadpool. `pending` (queued + running) and an EWMA of queue wait
+    decide admission before any work is done:
+
+      pending >= shed_pending, or wait >= shed_wait -> LOW is shed, NORMAL is rejected (OVERLOADED)
+      pending >= max_pending                        -> HIGH is rejected too
+      otherwise                                     -> admitted
+
+    so HIGH-priority writes keep the headroom between the soft and hard limits. The
+    wait signal only counts while work is pending; an idle pool is never "overloaded".
+    It also halves every `wait_half_life_seconds` without a new sample and resets once
+    the pool drains, so a past burst cannot keep shedding after the queue has cleared.
+    """
+    def __init__(
+        self,
+        *,
+        workers: int = 16,
+        max_pending: int = 128,
+        shed_pending: int = 64,
+        shed_wait_ms: float = 250.0,
+        ewma_alpha: float = 0.2,
+        wait_half_life_seconds: float = 1.0,
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.shed_pending = max(1, min(shed_pending, self.max_pending))
+        self.shed_wait_ms = max(0.0, shed_wait_ms)
+        self._alpha = min(1.0, max(0.01, ewma_alpha))
+        self.wait_half_life = max(0.01, wait_half_life_seconds)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="luna-db")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self._wait_ms = 0.0
+        self._wait_at = time.monotonic()
+        self.max_wait_ms = 0.0
+        self._counts: Dict[str, Dict[str, int]] = {p: {"admitted": 0, "shed": 0, "rejected": 0} for p in (HIGH, NORMAL, LOW)}
+
+    @property
+    def wait_ms(self) -> float:
+        """EWMA of queue wait, decayed by the time since the last sample."""
+        age = time.monotonic() - self._wait_at
+        return self._wait_ms * 0.5 ** (age / self.wait_half_life)
+
+    def _pressured(self) -> bool:
+        return self.pending >= self.shed_pending or (self.pending > 0 and self.shed_wait_ms > 0 and self.wait_ms >= self.shed_wait_ms)
+
+    def _admit(self, priority: str, can_shed: bool) -> str:
+        with self._lock:
+            full = self.pending >= self.max_pending
+            if priority != HIGH and (full or self._pressured()):
+                # Shedding costs no storage I/O, so LOW work is shed even when full.
+                decision = "shed" if priority == LOW and can_shed else "rejected"
+            elif full:
+                decision = "rejected"
+            else:
+                decision = "admitted"
+                self.pending += 1
+            self._counts[priority][decision] += 1
+            return decision
+
+    def _done(self) -> None:
+        with self._lock:
+            self.pending -= 1
+            if self.pending == 0:
+                self._wait_ms = 0.0  # drained: nobody is waiting any more
+
+    def _started(self, waited_ms: float) -> None:
+        with self._lock:
+            wait = self.wait_ms
+            self._wait_ms = wait + self._alpha * (waited_ms - wait)
+            self._wait_at = time.monotonic()
+            self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+
+    async def run(
+        self,
+        priority: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        shed: Optional[Callable[[], Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        Run fn(*args, **kwargs) on the pool if admitted. When LOW work is shed, `shed()`
+        runs instead, in a default-executor thread rather than the saturated pool (it
+        may write the local spool, but must not touch storage); without `shed` the call
+        is rejected like NORMAL work.
+        """
+        decision = self._admit(priority, shed is not None)
+        if decision == "shed":
+            return await asyncio.to_thread(shed)  # type: ignore[arg-type]
+        if decision == "rejected":
+            raise LunaError(
+                "OVERLOADED",
+                "Server is busy. Try again shortly.",
+                {"priority": priority, "pending": self.pending, "wait_ms": round(self.wait_ms, 1)},
+                retryable=True,
+            )
+        queued = time.monotonic()
+        ctx = contextvars.copy_context()
+
+        def call() -> Any:
+            waited = (time.monotonic() - queued) * 1000
+            self._started(waited)
+            try:
+                return ctx.run(fn, *args, **kwargs)
+            finally:
+                self._done()
+
+        future = self._pool.submit(call)
+        # Cancelled while still queued: call() never runs, so settle the count here.
+        future.add_done_callback(lambda f: self._done() if f.cancelled() else None)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "shed_pending": self.shed_pending,
+                "wait_ms": round(self.wait_ms, 1),
+                "max_wait_ms": round(self.max_wait_ms, 1),
+                "pressured": self._pressured(),
+                "counts": {p: dict(c) for p, c in self._counts.items()},
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=False)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from .util import stable_hash, stable_json_dumps
+
+# A top-level field moved out of a stored document is replaced by {"$blob": <hash>}.
+# The Pydantic models never produce a dict with this key for a field, so it is unambiguous.
+BLOB_REF = "$blob"
+
+
+def pack_document(doc: Dict[str, Any], *, scope: str, min_bytes: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Split large top-level values (long strings, sub-documents, lists) out of `doc`.
+    Returns (packed_doc, {hash: value}). Hashes are scoped (per user) so a blob is
+    only ever shared between versions of the same user's documents.
+    """
+    if min_bytes <= 0:
+        return doc, {}
+    packed: Dict[str, Any] = {}
+    blobs: Dict[str, Any] = {}
+    for key, value in doc.items():
+        if value and isinstance(value, (str, dict, list)):
+            encoded = stable_json_dumps(value)
+            if len(encoded.encode("utf-8")) >= min_bytes:
+                h = stable_hash(scope, encoded)
+                blobs[h] = value
+                packed[key] = {BLOB_REF: h}
+                continue
+        packed[key] = value
+    return packed, blobs
+
+
+def _ref(value: Any) -> Any:
+    if isinstance(value, dict) and len(value) == 1 and BLOB_REF in value:
+        return value[BLOB_REF]
+    return None
+
+
+def blob_refs(docs: Iterable[Dict[str, Any]]) -> Set[str]:
+    refs: Set[str] = set()
+    for doc in docs:
+        for value in (doc or {}).values():
+            h = _ref(value)
+            if h:
+                refs.add(h)
+    return refs
+
+
+def unpack_document(doc: Dict[str, Any], blobs: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of pack_document. Refs with no blob are left in place (never raises)."""
+    if not doc:
+        return doc
+    out: Dict[str, Any] = {}
+    for key, value in doc.items():
+        h = _ref(value)
+        out[key] = blobs[h] if h and h in blobs else value
+    return out
+
+
+def blob_rows(user_id: str, blobs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"hash": h, "user_id": user_id, "body": v, "size_bytes": len(stable_json_dumps(v).encode("utf-8"))}
+        for h, v in blobs.items()
+    ]
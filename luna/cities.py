@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, Mapping, Optional
+
+# Canonical key -> aliases. Keys are stable identifiers stored in date_plans.city_key;
+# aliases are matched after normalization (see normalize_city), so case, accents,
+# punctuation and "St." / "Saint" spelling do not need their own entries.
+CITY_ALIASES: Dict[str, Iterable[str]] = {
+    "new-york": ("new york", "new york city", "nyc", "ny ny", "manhattan", "brooklyn", "queens", "the bronx", "bronx"),
+    "los-angeles": ("los angeles", "la", "l a", "lax", "hollywood", "santa monica"),
+    "san-francisco": ("san francisco", "sf", "san fran", "frisco", "bay area"),
+    "chicago": ("chicago", "chi", "chi town", "chitown"),
+    "boston": ("boston", "cambridge ma", "somerville"),
+    "washington-dc": ("washington dc", "washington d c", "dc", "d c", "district of columbia"),
+    "seattle": ("seattle",),
+    "austin": ("austin", "atx"),
+    "houston": ("houston", "htx"),
+    "dallas": ("dallas", "dfw", "fort worth"),
+    "miami": ("miami", "miami beach"),
+    "atlanta": ("atlanta", "atl"),
+    "denver": ("denver",),
+    "philadelphia": ("philadelphia", "philly", "phl"),
+    "portland-or": ("portland or", "portland oregon", "pdx"),
+    "portland-me": ("portland me", "portland maine"),
+    "san-diego": ("san diego", "sd"),
+    "las-vegas": ("las vegas", "vegas", "lv"),
+    "nashville": ("nashville",),
+    "new-orleans": ("new orleans", "nola"),
+    "minneapolis": ("minneapolis", "mpls", "twin cities", "saint paul"),
+    "phoenix": ("phoenix", "phx", "scottsdale"),
+    "detroit": ("detroit",),
+    "toronto": ("toronto", "the 6ix", "yyz"),
+    "vancouver": ("vancouver", "yvr"),
+    "montreal": ("montreal",),
+    "mexico-city": ("mexico city", "cdmx", "ciudad de mexico"),
+    "london": ("london", "ldn"),
+    "paris": ("paris",),
+    "berlin": ("berlin",),
+    "madrid": ("madrid",),
+    "barcelona": ("barcelona", "bcn"),
+    "amsterdam": ("amsterdam", "ams"),
+    "dublin": ("dublin",),
+    "sydney": ("sydney", "syd"),
+    "melbourne": ("melbourne", "melb"),
+    "tokyo": ("tokyo",),
+    "singapore": ("singapore", "sg"),
+    "sao-paulo": ("sao paulo", "sampa"),
+}
+
+# Trailing state / country words that do not change which city is meant (tried after
+# the full text, so aliases like "portland or" still win).
+_US_STATES = (
+    "al ak az ar ca co ct de dc fl ga hi id il in ia ks ky la me md ma mi mn ms mo mt ne nv nh nj nm "
+    "ny nc nd oh ok or pa ri sc sd tn tx ut vt va wa wv wi wy"
+).split()
+_REGION_SUFFIXES = tuple(_US_STATES) + (
+    "usa", "us", "united states", "united states of america", "america",
+    "uk", "united kingdom", "england", "canada", "on", "bc", "qc", "australia", "au",
+)
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_SAINT = re.compile(r"\bst\b")
+
+
+def normalize_city(text: str) -> str:
+    """Lowercase, accents stripped, punctuation -> spaces, "St." -> "saint"."""
+    t = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    t = t.replace("&", " and ")
+    t = " ".join(_NON_WORD.sub(" ", t).split())
+    return _SAINT.sub("saint", t)
+
+
+def _strip_region(norm: str) -> str:
+    for suffix in sorted(_REGION_SUFFIXES, key=len, reverse=True):
+        if norm.endswith(" " + suffix):
+            return norm[: -len(suffix) - 1]
+    return norm
+
+
+class CityIndex:
+    """
+    Free-text city -> canonical city key (date_plans.city_key).
+
+    Lookup order: the normalized text, the same without a trailing state / country, then
+    the part before the first comma ("Brooklyn, NY" -> "brooklyn"), each against the
+    alias table. Unknown cities fall back to a slug of that part without a trailing state
+    or country, so "Reno, NV", "reno nv" and "Reno" share a key. Results are memoized
+    per raw input (`cache_size`).
+    """
+    def __init__(self, aliases: Optional[Mapping[str, Iterable[str]]] = None, *, cache_size: int = 10_000):
+        self._alias: Dict[str, str] = {}
+        self.add_aliases(CITY_ALIASES)
+        if aliases:
+            self.add_aliases(aliases)
+        self.key = lru_cache(maxsize=max(1, cache_size))(self._key)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: int) -> "CityIndex":
+        """Built-in table extended with a JSON file of {"canonical-key": ["alias", ...]}."""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def add_aliases(self, aliases: Mapping[str, Iterable[str]]) -> None:
+        for key, names in aliases.items():
+            self._alias[normalize_city(key.replace("-", " "))] = key
+            for name in names:
+                self._alias[normalize_city(name)] = key
+
+    def _key(self, city: str) -> str:
+        norm = normalize_city(city)
+        head = normalize_city(city.split(",", 1)[0])
+        for candidate in (norm, _strip_region(norm), head):
+            key = self._alias.get(candidate)
+            if key:
+                return key
+        return _strip_region(head).replace(" ", "-") or "unknown"
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import re
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple, get_args, get_type_hints
+
+from .models import ArchetypeProfile
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+
+# Categorical axes and their allowed values, straight from the Pydantic Literals.
+_HINTS = get_type_hints(ArchetypeProfile)
+AXES: Dict[str, Tuple[str, ...]] = {
+    axis: get_args(_HINTS[axis]) for axis in ("energy_level", "communication_style", "conflict_style")
+}
+LEVELS: Tuple[str, ...] = ("lite", "deep")
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_label(text: str) -> str:
+    return _WS.sub(" ", (text or "").strip().lower())[:120]
+
+
+class CohortStats:
+    """
+    Columnar, append-only encoding of stored archetypes for aggregate benchmarks.
+
+    One row per (user_id, level): a re-stored archetype overwrites its row in place, and
+    remove(user_id) blanks the user's rows (level code -1, excluded from every query).
+      - categorical axes + level -> int8 code columns
+      - trait scores             -> float32 matrix (rows x trait vocabulary), NaN = absent
+      - blind_spots.patterns     -> bool matrix (rows x pattern vocabulary)
+    Arrays grow by doubling, so appends are amortized O(1) and queries are vectorized
+    column scans. Aggregate self-knowledge only: nothing here compares users to each other.
+    """
+    def __init__(self, *, initial_capacity: int = 1024, max_traits: int = 512, max_patterns: int = 2048):
+        if np is None:
+            raise RuntimeError("numpy not installed. Add `numpy` to requirements.txt.")
+        self.max_traits = max_traits
+        self.max_patterns = max_patterns
+        self._lock = threading.Lock()
+        self._n = 0
+        self._cap = max(16, initial_capacity)
+        self._rows: Dict[Tuple[str, str], int] = {}
+        self._codes = {axis: np.full(self._cap, -1, dtype=np.int8) for axis in (*AXES, "level")}
+        self._traits: Dict[str, int] = {}
+        self._trait_mat = np.full((self._cap, 16), np.nan, dtype=np.float32)
+        self._patterns: Dict[str, int] = {}
+        self._pattern_mat = np.zeros((self._cap, 32), dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ---- ingest ----
+
+    def _grow_rows(self) -> None:
+        new_cap = self._cap * 2
+        for axis, col in self._codes.items():
+            grown = np.full(new_cap, -1, dtype=np.int8)
+            grown[: self._cap] = col
+            self._codes[axis] = grown
+        tm = np.full((new_cap, self._trait_mat.shape[1]), np.nan, dtype=np.float32)
+        tm[: self._cap] = self._trait_mat
+        self._trait_mat = tm
+        pm = np.zeros((new_cap, self._pattern_mat.shape[1]), dtype=bool)
+        pm[: self._cap] = self._pattern_mat
+        self._pattern_mat = pm
+        self._cap = new_cap
+
+    def _trait_col(self, label: str) -> Optional[int]:
+        col = self._traits.get(label)
+        if col is not None:
+            return col
+        if len(self._traits) >= self.max_traits:
+            return None
+        col = len(self._traits)
+        if col >= self._trait_mat.shape[1]:
+            tm = np.full((self._cap, self._trait_mat.shape[1] * 2), np.nan, dtype=np.float32)
+            tm[:, : self._trait_mat.shape[1]] = self._trait_mat
+            self._trait_mat = tm
+        self._traits[label] = col
+        return col
+
+    def _pattern_col(self, pattern: str) -> Optional[int]:
+        col = self._patterns.get(pattern)
+        if col is not None:
+            return col
+        if len(self._patterns) >= self.max_patterns:
+            return None
+        col = len(self._patterns)
+        if col >= self._pattern_mat.shape[1]:
+            pm = np.zeros((self._cap, self._pattern_mat.shape[1] * 2), dtype=bool)
+            pm[:, : self._pattern_mat.shape[1]] = self._pattern_mat
+            self._pattern_mat = pm
+        self._patterns[pattern] = col
+        return col
+
+    def add(self, user_id: str, level: str, archetype: Dict[str, Any]) -> None:
+        with self._lock:
+            key = (str(user_id), level)
+            row = self._rows.get(key)
+            if row is None:
+                if self._n >= self._cap:
+                    self._grow_rows()
+                row = self._n
+                self._n += 1
+                self._rows[key] = row
+            else:
+                self._trait_mat[row, :] = np.nan
+                self._pattern_mat[row, :] = False
+
+            self._codes["level"][row] = LEVELS.index(level) if level in LEVELS else -1
+            for axis, values in AXES.items():
+                v = archetype.get(axis)
+                self._codes[axis][row] = values.index(v) if v in values else -1
+
+            for t in archetype.get("traits") or []:
+                label = normalize_label(t.get("label", ""))
+                score = t.get("score")
+                if not label or score is None:
+                    continue
+                col = self._trait_col(label)
+                if col is not None:
+                    self._trait_mat[row, col] = float(score)
+
+            for p in (archetype.get("blind_spots") or {}).get("patterns") or []:
+                pattern = normalize_label(p)
+                if not pattern:
+                    continue
+                col = self._pattern_col(pattern)
+                if col is not None:
+                    self._pattern_mat[row, col] = True
+
+    def remove(self, user_id: str) -> int:
+        """Drop a user (opt-out / purge) from every aggregate; returns rows removed."""
+        with self._lock:
+            rows = [self._rows.pop(key) for key in [k for k in self._rows if k[0] == str(user_id)]]
+            for row in rows:
+                for col in self._codes.values():
+                    col[row] = -1
+                self._trait_mat[row, :] = np.nan
+                self._pattern_mat[row, :] = False
+            return len(rows)
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Bulk load rows shaped like the archetypes table (user_id, level, archetype_json),
+        oldest first: the last row per (user_id, level) wins.
+        """
+        n = 0
+        for r in rows:
+            self.add(r["user_id"], r["level"], r.get("archetype_json") or {})
+            n += 1
+        return n
+
+    # ---- queries ----
+
+    def _mask(self, level: Optional[str]) -> Any:
+        if level in LEVELS:
+            return self._codes["level"][: self._n] == LEVELS.index(level)
+        return self._codes["level"][: self._n] >= 0  # removed rows have level -1
+
+    def distribution(self, axis: str, *, level: Optional[str] = None) -> Dict[str, Any]:
+        values = AXES[axis]
+        with self._lock:
+            codes = self._codes[axis][: self._n][self._mask(level)]
+        codes = codes[codes >= 0]
+        counts = np.bincount(codes.astype(np.int64), minlength=len(values))
+        total = int(counts.sum())
+        return {
+            "total": total,
+            "counts": {v: int(c) for v, c in zip(values, counts)},
+            "share": {v: (round(float(c) / total, 4) if total else 0.0) for v, c in zip(values, counts)},
+        }
+
+    def trait_percentile(self, label: str, score: float, *, level: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Mid-rank percentile of `score` among stored scores for this trait label."""
+        label = normalize_label(label)
+        with self._lock:
+            col = self._traits.get(label)
+            if col is None:
+                return None
+            scores = self._trait_mat[: self._n, col][self._mask(level)]
+        scores = scores[~np.isnan(scores)]
+        n = int(scores.size)
+        if n == 0:
+            return None
+        below = int(np.count_nonzero(scores < score))
+        equal = int(np.count_nonzero(scores == score))
+        return {"label": label, "n": n, "percentile": round(100.0 * (below + 0.5 * equal) / n, 1)}
+
+    def blind_spot_cooccurrence(self, pattern: str, *, top: int = 5, level: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Patterns most often listed alongside `pattern`, with conditional share."""
+        pattern = normalize_label(pattern)
+        with self._lock:
+            col = self._patterns.get(pattern)
+            if col is None:
+                return None
+            width = len(self._patterns)
+            mat = self._pattern_mat[: self._n, :width][self._mask(level)]
+            names = list(self._patterns)
+        having = mat[:, col]
+        n = int(np.count_nonzero(having))
+        if n == 0:
+            return None
+        co = mat[having].sum(axis=0)
+        co[col] = 0
+        order = np.argsort(-co, kind="stable")[:top]
+        return {
+            "pattern": pattern,
+            "n": n,
+            "co_occurs_with": [
+                {"pattern": names[i], "count": int(co[i]), "share": round(float(co[i]) / n, 4)}
+                for i in order if co[i] > 0
+            ],
+        }
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+def parse_costs(spec: str) -> Dict[str, float]:
+    """"store_archetype=3,log_event=0.5" -> {"store_archetype": 3.0, "log_event": 0.5}."""
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        name, _, value = part.partition("=")
+        out[name.strip()] = float(value)
+    return out
+
+
+class CostModel:
+    """
+    Rate-limit cost of one call: (base + payload) * stress.
+
+      base    : the call site's cost (2 for stores, 1 otherwise), or an override from
+                `op_costs` (LUNA_RATE_COSTS)
+      payload : one extra token per `bytes_per_token` of JSON beyond `free_bytes`,
+                so a 2.5 KB archetype costs more than a 200-byte one (0 = off)
+      stress  : >= 1, from the health prober's cached state (no I/O per call):
+                DB latency over `latency_ms` scales it by latency / latency_ms, a
+                half-open breaker doubles it, an open breaker sets it to `max_stress`,
+                and a spool deeper than `spool_records` scales it by depth / spool_records.
+                The largest factor wins, capped at `max_stress`.
+
+    The stress factor is recomputed at most every `refresh_seconds` from the latest
+    probe, so limits tighten within one probe interval of trouble and relax the same
+    way once the signals clear.
+    """
+    def __init__(
+        self,
+        signals: Optional[Callable[[], Dict[str, Any]]] = None,
+        *,
+        op_costs: Optional[Dict[str, float]] = None,
+        free_bytes: int = 1024,
+        bytes_per_token: int = 1024,
+        latency_ms: float = 500.0,
+        spool_records: int = 200,
+        max_stress: float = 4.0,
+        refresh_seconds: float = 1.0,
+    ):
+        self._signals = signals
+        self.op_costs = dict(op_costs or {})
+        self.free_bytes = max(0, free_bytes)
+        self.bytes_per_token = max(0, bytes_per_token)
+        self.latency_ms = max(0.0, latency_ms)
+        self.spool_records = max(0, spool_records)
+        self.max_stress = max(1.0, max_stress)
+        self.refresh = max(0.0, refresh_seconds)
+        self._lock = threading.Lock()
+        self._at = 0.0
+        self._factors: Dict[str, float] = {"latency": 1.0, "breaker": 1.0, "spool": 1.0}
+        self.stress = 1.0
+
+    def payload_bytes(self, payload: Any) -> int:
+        if payload is None or self.bytes_per_token <= 0:
+            return 0
+        if isinstance(payload, str):
+            return len(payload.encode("utf-8"))
+        return len(json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8"))
+
+    def cost(self, op: str, base: float, payload: Any = None) -> float:
+        cost = self.op_costs.get(op, base)
+        if self.bytes_per_token > 0:
+            extra = self.payload_bytes(payload) - self.free_bytes
+            if extra > 0:
+                cost += math.ceil(extra / self.bytes_per_token)
+        return cost * self.current_stress()
+
+    def current_stress(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._at < self.refresh:
+                return self.stress
+            self._at = now
+        factors = self._compute()
+        with self._lock:
+            self._factors = factors
+            self.stress = min(self.max_stress, max(factors.values()))
+            return self.stress
+
+    def _compute(self) -> Dict[str, float]:
+        factors = {"latency": 1.0, "breaker": 1.0, "spool": 1.0}
+        if self._signals is None:
+            return factors
+        try:
+            snap = self._signals()
+        except Exception:
+            return factors
+        latency = snap.get("db_latency_ms")
+        if self.latency_ms > 0 and latency and latency > self.latency_ms:
+            factors["latency"] = latency / self.latency_ms
+        breaker = snap.get("breaker")
+        if breaker == "open":
+            factors["breaker"] = self.max_stress
+        elif breaker == "half_open":
+            factors["breaker"] = 2.0
+        records = (snap.get("spool") or {}).get("records") or 0
+        if self.spool_records > 0 and records > self.spool_records:
+            factors["spool"] = records / self.spool_records
+        return {k: round(min(self.max_stress, v), 2) for k, v in factors.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        stress = self.current_stress()
+        with self._lock:
+            return {
+                "stress": round(stress, 2),
+                "factors": dict(self._factors),
+                "op_costs": dict(self.op_costs),
+                "free_bytes": self.free_bytes,
+                "bytes_per_token": self.bytes_per_token,
+                "latency_ms": self.latency_ms,
+                "spool_records": self.spool_records,
+                "max_stress": self.max_stress,
+            }
@@ -2,16 +2,23 @@
 from __future__ import annotations
 
 import os
+import threading
 import time
-from typing import Any, Dict, Optional, Callable, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Callable, Tuple
 
+from .blobs import blob_refs, blob_rows, pack_document, unpack_document
 from .errors import LunaError
-from .util import utc_now_iso
+from .util import SimpleTTLCache, utc_now_iso
 
-try:
-    from supabase import create_client  # type: ignore
-except Exception as e:  # pragma: no cover
-    create_client = None  # type: ignore
+
+def _load_create_client() -> Callable[..., Any]:
+    # Imported lazily: the supabase SDK is the heaviest import in the process and
+    # nothing needs it until the first DB call (or the background warm-up).
+    try:
+        from supabase import create_client  # type: ignore
+    except Exception:  # pragma: no cover
+        raise RuntimeError("supabase client not installed. Add `supabase` to requirements.txt.")
+    return create_client
 
 
 def _retry(fn: Callable[[], Any], *, attempts: int = 3, base_delay: float = 0.25, max_delay: float = 2.0) -> Any:
@@ -27,13 +34,32 @@ def _retry(fn: Callable[[], Any], *, attempts: int = 3, base_delay: float = 0.25
     raise last  # type: ignore
 
 
+# Tables whose JSON column may hold content_blobs refs
+_JSON_FIELDS = {"archetypes": "archetype_json", "date_plans": "plan_json"}
+# Primary key column where it is not `id`
+_ROW_KEYS = {"content_blobs": "hash"}
+
+
 class SupabaseDB:
-    def __init__(self, url: str, key: str):
-        if create_client is None:
-            raise RuntimeError("supabase client not installed. Add `supabase` to requirements.txt.")
+    def __init__(self, url: str, key: str, *, blob_min_bytes: int = 0):
         self.url = url
         self.key = key
-        self.sb = create_client(url, key)
+        self._sb: Any = None
+        self._sb_lock = threading.Lock()
+        # Content-addressed storage of large JSON fields (0 = off; needs content_blobs table)
+        self.blob_min_bytes = blob_min_bytes
+        self._blob_cache = SimpleTTLCache(ttl_seconds=600, max_items=5_000)
+        # (url, key) -> client; replaceable before first use (luna.faults.FaultyDB wraps it)
+        self.client_factory: Callable[[str, str], Any] = lambda url, key: _load_create_client()(url, key)
+
+    @property
+    def sb(self) -> Any:
+        """Supabase client, built on first use so boot never waits on the SDK or network."""
+        if self._sb is None:
+            with self._sb_lock:
+                if self._sb is None:
+                    self._sb = self.client_factory(self.url, self.key)
+        return self._sb
 
     def ping(self) -> bool:
         # Lightweight read from schema_version
@@ -58,6 +84,31 @@ class SupabaseDB:
         except Exception as e:
             raise LunaError("DB_UPSERT_USER_FAILED", "Unable to create/update user", {"cause": str(e)}, retryable=True)
 
+    def find_user(self, user_ref: str) -> Optional[str]:
+        """user_id for `user_ref`, or None if it was never seen. Read-only (no upsert)."""
+        def _do():
+            res = self.sb.table("users").select("id").eq("chatgpt_user_ref", user_ref).limit(1).execute()
+            return res.data[0]["id"] if res.data else None
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_READ_FAILED", "Unable to look up user", {"cause": str(e)}, retryable=True)
+
+    def touch_users(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Batched last_seen_at update: rows are {"chatgpt_user_ref", "last_seen_at"}.
+        One statement for the whole batch; updated_at is left alone (it tracks
+        profile changes, not visits).
+        """
+        if not rows:
+            return
+        def _do():
+            self.sb.table("users").upsert(rows, on_conflict="chatgpt_user_ref").execute()
+        try:
+            _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_TOUCH_USERS_FAILED", "Unable to update last_seen_at", {"cause": str(e), "count": len(rows)}, retryable=True)
+
     def set_opt_out(self, user_id: str, opt_out: bool) -> None:
         def _do():
             self.sb.table("users").update({"data_opt_out": opt_out, "updated_at": utc_now_iso()}).eq("id", user_id).execute()
@@ -66,7 +117,113 @@ class SupabaseDB:
         except Exception as e:
             raise LunaError("DB_OPT_OUT_FAILED", "Unable to update opt-out", {"cause": str(e)}, retryable=True)
 
-    def insert_archetype(self, *, user_id: str, level: str, source_hash: str, archetype_json: Dict[str, Any], model_version: Optional[str] = None) -> None:
+    def set_consent(self, user_id: str, consent_version: str) -> None:
+        def _do():
+            self.sb.table("users").update({"consent_version": consent_version, "updated_at": utc_now_iso()}).eq("id", user_id).execute()
+        try:
+            _retry(_do, attempts=3)
+        except Exception as e:
+            raise LunaError("DB_CONSENT_FAILED", "Unable to record consent", {"cause": str(e)}, retryable=True)
+
+    def get_user_gate(self, user_id: str) -> Dict[str, Any]:
+        """
+        Gate fields (data_opt_out, consent_version) for a user. Raises on failure so
+        callers can decide whether to fail open or closed.
+        """
+        res = self.sb.table("users").select("data_opt_out,consent_version").eq("id", user_id).limit(1).execute()
+        return res.data[0] if res.data else {}
+
+    # ---- purge on opt-out ----
+
+    def mark_purge(self, user_id: str, *, requested_at: Optional[str], completed_at: Optional[str]) -> None:
+        """Persist purge progress on the users row (requested_at=None clears a cancelled purge)."""
+        def _do():
+            self.sb.table("users").update(
+                {"purge_requested_at": requested_at, "purge_completed_at": completed_at}
+            ).eq("id", user_id).execute()
+        try:
+            _retry(_do, attempts=3)
+        except Exception as e:
+            raise LunaError("DB_PURGE_STATE_FAILED", "Unable to record purge state", {"cause": str(e)}, retryable=True)
+
+    def get_purge_state(self, user_id: str) -> Dict[str, Any]:
+        res = self.sb.table("users").select("purge_requested_at,purge_completed_at").eq("id", user_id).limit(1).execute()
+        return res.data[0] if res.data else {}
+
+    def list_pending_purges(self, *, limit: int = 100) -> List[Dict[str, Any]]:
+        """Users whose purge was requested but not finished (resumed after a restart)."""
+        def _do():
+            res = (
+                self.sb.table("users").select("id,purge_requested_at")
+                .not_.is_("purge_requested_at", "null").is_("purge_completed_at", "null")
+                .order("purge_requested_at").limit(limit).execute()
+            )
+            return res.data or []
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_READ_FAILED", "Unable to list pending purges", {"cause": str(e)}, retryable=True)
+
+    def delete_user_rows(self, table: str, *, user_id: str, limit: int) -> int:
+        """
+        Delete up to `limit` rows of `table` for one user; returns how many went.
+        Select-then-delete by key keeps each statement small (no long table locks).
+        """
+        key = _ROW_KEYS.get(table, "id")
+        def _do():
+            res = self.sb.table(table).select(key).eq("user_id", user_id).limit(limit).execute()
+            keys = [r[key] for r in res.data or []]
+            if keys:
+                self.sb.table(table).delete().in_(key, keys).execute()
+            if table == "content_blobs":
+                for h in keys:
+                    self._blob_cache.pop(h)
+            return len(keys)
+        try:
+            return _retry(_do, attempts=3)
+        except Exception as e:
+            raise LunaError("DB_PURGE_FAILED", f"Unable to purge {table}", {"cause": str(e)}, retryable=True)
+
+    # ---- content-addressed JSON bodies ----
+
+    def _pack(self, user_id: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Move large top-level fields of `doc` into content_blobs; return the packed doc.
+        Every referenced blob is upserted on every write (existing hashes are left alone):
+        a purge may have deleted it since it was last written, from any worker.
+        """
+        packed, blobs = pack_document(doc, scope=user_id, min_bytes=self.blob_min_bytes)
+        if blobs:
+            self.sb.table("content_blobs").upsert(
+                blob_rows(user_id, blobs), on_conflict="hash", ignore_duplicates=True
+            ).execute()
+        return packed
+
+    def _unpack_rows(self, rows: List[Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
+        """Reassemble `field` of each row; one blob query for all refs not already cached."""
+        refs = blob_refs(r.get(field) or {} for r in rows)
+        if not refs:
+            return rows
+        blobs: Dict[str, Any] = {}
+        missing = []
+        for h in refs:
+            v = self._blob_cache.get(h)
+            if v is None:
+                missing.append(h)
+            else:
+                blobs[h] = v
+        if missing:
+            res = self.sb.table("content_blobs").select("hash,body").in_("hash", missing).execute()
+            for b in res.data or []:
+                blobs[b["hash"]] = b["body"]
+                self._blob_cache.set(b["hash"], b["body"])
+        for r in rows:
+            if r.get(field):
+                r[field] = unpack_document(r[field], blobs)
+        return rows
+
+    def insert_archetype(self, *, user_id: str, level: str, source_hash: str, archetype_json: Dict[str, Any], model_version: Optional[str] = None) -> Optional[str]:
+        """Idempotent upsert; returns the row id when PostgREST echoes it back."""
         row = {
             "user_id": user_id,
             "level": level,
@@ -75,21 +232,189 @@ class SupabaseDB:
             "model_version": model_version,
         }
         def _do():
-            self.sb.table("archetypes").upsert(row, on_conflict="user_id,level,source_hash").execute()
+            stored = {**row, "archetype_json": self._pack(user_id, archetype_json)}
+            res = self.sb.table("archetypes").upsert(stored, on_conflict="user_id,level,source_hash").execute()
+            return res.data[0].get("id") if res.data else None
         try:
-            _retry(_do, attempts=3)
+            return _retry(_do, attempts=3)
         except Exception as e:
             raise LunaError("DB_STORE_ARCHETYPE_FAILED", "Unable to store archetype", {"cause": str(e)}, retryable=True)
 
-    def insert_date_plan(self, *, user_id: str, source_hash: str, city: str, plan_json: Dict[str, Any]) -> None:
-        row = {"user_id": user_id, "source_hash": source_hash, "city": city, "plan_json": plan_json}
+    def insert_date_plan(
+        self,
+        *,
+        user_id: str,
+        source_hash: str,
+        city: str,
+        plan_json: Dict[str, Any],
+        simhash: Optional[int] = None,
+        city_key: Optional[str] = None,
+    ) -> Optional[str]:
+        """Idempotent upsert; returns the row id when PostgREST echoes it back."""
+        row: Dict[str, Any] = {"user_id": user_id, "source_hash": source_hash, "city": city, "plan_json": plan_json}
+        # Optional columns are only sent when set, so older schemas keep working.
+        if simhash is not None:
+            row["simhash"] = simhash
+        if city_key is not None:
+            row["city_key"] = city_key
         def _do():
-            self.sb.table("date_plans").upsert(row, on_conflict="user_id,source_hash").execute()
+            stored = {**row, "plan_json": self._pack(user_id, plan_json)}
+            res = self.sb.table("date_plans").upsert(stored, on_conflict="user_id,source_hash").execute()
+            return res.data[0].get("id") if res.data else None
         try:
-            _retry(_do, attempts=3)
+            return _retry(_do, attempts=3)
+        except Exception as e:
+            raise LunaError("DB_STORE_DATEPLAN_FAILED", "Unable to store date plan", {"cause": str(e)}, retryable=True)
+
+    def replace_date_plan(
+        self, *, plan_id: str, user_id: str, source_hash: str, city: str, plan_json: Dict[str, Any], simhash: int,
+        city_key: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Overwrite a near-duplicate plan in place, source_hash (and city_key, when given)
+        included, and make it the user's newest. Returns None when the row no longer exists (e.g. purged) or another
+        of the user's rows already has this source_hash, so the caller upserts instead.
+        """
+        def _do():
+            taken = (
+                self.sb.table("date_plans").select("id")
+                .eq("user_id", user_id).eq("source_hash", source_hash).limit(1).execute().data
+            )
+            if taken and taken[0]["id"] != plan_id:
+                return None
+            fields = {
+                "source_hash": source_hash, "city": city, "plan_json": self._pack(user_id, plan_json),
+                "simhash": simhash, "created_at": utc_now_iso(),
+            }
+            if city_key is not None:
+                fields["city_key"] = city_key
+            res = (
+                self.sb.table("date_plans")
+                .update(fields)
+                .eq("id", plan_id)
+                .eq("user_id", user_id)
+                .execute()
+            )
+            return res.data[0].get("id") if res.data else None
+        try:
+            return _retry(_do, attempts=3)
         except Exception as e:
             raise LunaError("DB_STORE_DATEPLAN_FAILED", "Unable to store date plan", {"cause": str(e)}, retryable=True)
 
+    def recent_plan_fingerprints(self, *, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Newest plans' (id, city, city_key, simhash); served by idx_date_plans_user_simhash."""
+        def _do():
+            res = (
+                self.sb.table("date_plans")
+                .select("id,city,city_key,simhash")
+                .eq("user_id", user_id)
+                .order("created_at", desc=True)
+                .limit(limit)
+                .execute()
+            )
+            return res.data or []
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_READ_FAILED", "Unable to read date plan fingerprints", {"cause": str(e)}, retryable=True)
+
+    def date_plans_missing_city_key(self, *, limit: int = 500) -> List[Dict[str, Any]]:
+        """Backfill helper: (id, city) of plans stored before city_key existed."""
+        def _do():
+            res = self.sb.table("date_plans").select("id,city").is_("city_key", "null").limit(limit).execute()
+            return res.data or []
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_READ_FAILED", "Unable to read date plans", {"cause": str(e)}, retryable=True)
+
+    def set_city_key(self, *, city_key: str, plan_ids: List[str]) -> None:
+        def _do():
+            self.sb.table("date_plans").update({"city_key": city_key}).in_("id", plan_ids).execute()
+        try:
+            _retry(_do, attempts=3)
+        except Exception as e:
+            raise LunaError("DB_STORE_DATEPLAN_FAILED", "Unable to update date plans", {"cause": str(e)}, retryable=True)
+
+    # ---- single-call store RPCs (rpc.sql) ----
+
+    def _store_tx(self, fn: str, params: Dict[str, Any], *, user_id: Optional[str], doc_param: str, code: str, what: str) -> Dict[str, Any]:
+        """
+        One round-trip, one transaction: user upsert, gate, idempotent upsert, event.
+        Large fields are packed into content_blobs only when the user id is already
+        known (hashes are scoped per user); otherwise they are stored inline. All
+        referenced blobs travel with the call; the RPC skips hashes it already has.
+        """
+        blobs: Dict[str, Any] = {}
+        if user_id and self.blob_min_bytes > 0:
+            params[doc_param], blobs = pack_document(params[doc_param], scope=user_id, min_bytes=self.blob_min_bytes)
+        params["p_blobs"] = blob_rows(user_id or "", blobs)
+        def _do():
+            res = self.sb.rpc(fn, params).execute()
+            return res.data
+        try:
+            data = _retry(_do, attempts=3)
+        except Exception as e:
+            raise LunaError(code, f"Unable to store {what}", {"cause": str(e)}, retryable=True)
+        out = data[0] if isinstance(data, list) else data
+        return out or {}
+
+    def store_archetype_tx(
+        self,
+        *,
+        user_ref: str,
+        level: str,
+        source_hash: str,
+        archetype_json: Dict[str, Any],
+        model_version: Optional[str] = None,
+        event: Optional[Dict[str, Any]] = None,
+        require_consent: bool = False,
+        user_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """luna_store_archetype: {"user_id", "id", "stored", "reason", "data_opt_out", "consent_version"}."""
+        params = {
+            "p_user_ref": user_ref,
+            "p_level": level,
+            "p_source_hash": source_hash,
+            "p_archetype_json": archetype_json,
+            "p_model_version": model_version,
+            "p_event": event,
+            "p_require_consent": require_consent,
+        }
+        return self._store_tx("luna_store_archetype", params, user_id=user_id, doc_param="p_archetype_json", code="DB_STORE_ARCHETYPE_FAILED", what="archetype")
+
+    def store_date_plan_tx(
+        self,
+        *,
+        user_ref: str,
+        source_hash: str,
+        city: str,
+        plan_json: Dict[str, Any],
+        event: Optional[Dict[str, Any]] = None,
+        require_consent: bool = False,
+        user_id: Optional[str] = None,
+        simhash: Optional[int] = None,
+        max_distance: Optional[int] = None,
+        city_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        luna_store_date_plan: same result shape as store_archetype_tx, plus "replaced"
+        when a recent plan within `max_distance` bits of `simhash` was overwritten.
+        """
+        params: Dict[str, Any] = {
+            "p_user_ref": user_ref,
+            "p_source_hash": source_hash,
+            "p_city": city,
+            "p_plan_json": plan_json,
+            "p_event": event,
+            "p_require_consent": require_consent,
+        }
+        # Optional arguments are only sent when set (PostgREST matches functions by argument names).
+        for name, value in (("p_simhash", simhash), ("p_max_distance", max_distance), ("p_city_key", city_key)):
+            if value is not None:
+                params[name] = value
+        return self._store_tx("luna_store_date_plan", params, user_id=user_id, doc_param="p_plan_json", code="DB_STORE_DATEPLAN_FAILED", what="date plan")
+
     def insert_event(self, *, user_id: str, event_name: str, event_id: str, properties: Dict[str, Any], occurred_at: str) -> None:
         row = {"user_id": user_id, "event_name": event_name, "event_id": event_id, "properties": properties, "occurred_at": occurred_at}
         def _do():
@@ -101,6 +426,22 @@ class SupabaseDB:
             # swallow: metrics should never break UX
             return
 
+    def insert_events(self, *, rows: List[Dict[str, Any]]) -> List[str]:
+        """
+        Bulk insert for event batches (one round-trip). Duplicate (user_id, event_id)
+        pairs are ignored; returns the event_ids actually inserted (ON CONFLICT DO
+        NOTHING returns only new rows). Unlike insert_event this raises, so callers can spool.
+        """
+        if not rows:
+            return []
+        def _do():
+            res = self.sb.table("event_log").upsert(rows, on_conflict="user_id,event_id", ignore_duplicates=True).execute()
+            return [r["event_id"] for r in res.data or []]
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_STORE_EVENTS_FAILED", "Unable to store events", {"cause": str(e), "count": len(rows)}, retryable=True)
+
     def insert_feedback(self, *, user_id: str, date_plan_id: Optional[str], rating: Optional[int], tags: Optional[list], notes: Optional[str]) -> None:
         row = {"user_id": user_id, "date_plan_id": date_plan_id, "rating": rating, "tags": tags, "notes": notes}
         def _do():
@@ -110,6 +451,107 @@ class SupabaseDB:
         except Exception:
             return
 
+    def get_criteria_insights(self, *, city_key: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """Aggregates for one city (criteria_insights primary-key prefix; maintained by trigger)."""
+        def _do():
+            res = (
+                self.sb.table("criteria_insights")
+                .select("category,noise_level,price_tier,feedback_count,rating_count,rating_sum,tag_counts")
+                .eq("city_key", city_key)
+                .order("feedback_count", desc=True)
+                .limit(limit)
+                .execute()
+            )
+            return res.data or []
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_READ_FAILED", "Unable to read criteria insights", {"cause": str(e)}, retryable=True)
+
+    def get_latest_archetype(self, *, user_id: str, level: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        def _do():
+            q = self.sb.table("archetypes").select("archetype_json,created_at,level").eq("user_id", user_id)
+            if level:
+                q = q.eq("level", level)
+            res = q.order("created_at", desc=True).limit(1).execute()
+            return self._unpack_rows(res.data, "archetype_json")[0] if res.data else None
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_READ_FAILED", "Unable to read archetype", {"cause": str(e)}, retryable=True)
+
+    def get_latest_date_plan(self, *, user_id: str) -> Optional[Dict[str, Any]]:
+        def _do():
+            res = self.sb.table("date_plans").select("id,city,plan_json,created_at").eq("user_id", user_id).order("created_at", desc=True).limit(1).execute()
+            return self._unpack_rows(res.data, "plan_json")[0] if res.data else None
+        try:
+            return _retry(_do, attempts=2)
+        except Exception as e:
+            raise LunaError("DB_READ_FAILED", "Unable to read date plan", {"cause": str(e)}, retryable=True)
+
+    def iter_archetypes(self, *, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Archetype rows (id, user_id, level, archetype_json, created_at) of users who have
+        not opted out, oldest first, keyset-paginated on (created_at, id): consumers that
+        keep the last row per (user_id, level) end up with the latest version, like
+        get_latest_archetype. Opted-out users' rows stay out even before a purge runs.
+        """
+        after: Optional[Tuple[str, str]] = None
+        while True:
+            def _do():
+                q = (
+                    self.sb.table("archetypes")
+                    .select("id,user_id,level,archetype_json,created_at,users!inner(data_opt_out)")
+                    .eq("users.data_opt_out", False)
+                )
+                if after is not None:
+                    ts, row_id = after
+                    q = q.or_(f'created_at.gt."{ts}",and(created_at.eq."{ts}",id.gt.{row_id})')
+                rows = q.order("created_at").order("id").limit(page_size).execute().data or []
+                for r in rows:
+                    r.pop("users", None)
+                return self._unpack_rows(rows, "archetype_json")
+            try:
+                page = _retry(_do, attempts=3)
+            except Exception as e:
+                raise LunaError("DB_READ_FAILED", "Unable to read archetypes", {"cause": str(e)}, retryable=True)
+            yield from page
+            if len(page) < page_size:
+                return
+            after = (page[-1]["created_at"], page[-1]["id"])
+
+    def iter_user_rows(
+        self,
+        table: str,
+        *,
+        user_id: str,
+        time_column: str = "created_at",
+        after: Optional[Tuple[str, str]] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Every row of `table` for one user, oldest first, keyset-paginated on
+        (time_column, id) so it rides the (user_id, <time>) index and holds one page
+        in memory. `after` resumes strictly after a (time, id) position.
+        """
+        json_field = _JSON_FIELDS.get(table)
+        while True:
+            def _do():
+                q = self.sb.table(table).select("*").eq("user_id", user_id)
+                if after is not None:
+                    ts, row_id = after
+                    q = q.or_(f'{time_column}.gt."{ts}",and({time_column}.eq."{ts}",id.gt.{row_id})')
+                rows = q.order(time_column).order("id").limit(page_size).execute().data or []
+                return self._unpack_rows(rows, json_field) if json_field else rows
+            try:
+                page = _retry(_do, attempts=3)
+            except Exception as e:
+                raise LunaError("DB_READ_FAILED", f"Unable to read {table}", {"cause": str(e)}, retryable=True)
+            yield from page
+            if len(page) < page_size:
+                return
+            after = (page[-1][time_column], page[-1]["id"])
+
     def get_latest(self, *, user_id: str) -> Dict[str, Any]:
         """
         Returns latest archetype (lite/deep) and most recent date plan count.
@@ -117,7 +559,7 @@ class SupabaseDB:
         out: Dict[str, Any] = {}
         def _do_arche(level: str):
             res = self.sb.table("archetypes").select("archetype_json,created_at,level").eq("user_id", user_id).eq("level", level).order("created_at", desc=True).limit(1).execute()
-            return res.data[0] if res.data else None
+            return self._unpack_rows(res.data, "archetype_json")[0] if res.data else None
 
         def _do_plans():
             res = self.sb.table("date_plans").select("id", count="exact").eq("user_id", user_id).execute()
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import contextvars
+import inspect
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from .db import SupabaseDB
+from .errors import LunaError
+
+# Storage methods the injector can target (the SupabaseDB / MemoryDB interface).
+STORAGE_METHODS = frozenset({
+    "ping", "upsert_user", "find_user", "touch_users", "set_opt_out", "set_consent", "get_user_gate",
+    "insert_archetype", "insert_date_plan", "insert_event", "insert_events", "insert_feedback",
+    "get_latest_archetype", "get_latest_date_plan", "iter_archetypes", "iter_user_rows", "get_latest",
+    "mark_purge", "get_purge_state", "list_pending_purges", "delete_user_rows",
+    "store_archetype_tx", "store_date_plan_tx", "replace_date_plan", "recent_plan_fingerprints",
+    "get_criteria_insights",
+})
+
+# What the real SupabaseDB returns instead of raising for best-effort methods.
+_SWALLOWED: Dict[str, Any] = {"ping": False, "insert_event": None, "insert_feedback": None, "get_latest": {}}
+
+_RULE_KEYS = {
+    "latency_ms", "latency_dist", "jitter_ms", "sigma",
+    "error_rate", "timeout_rate", "timeout_ms",
+    "outage", "outage_start_s", "outage_duration_s",
+}
+
+# Storage method currently running on this thread (read by the client-level proxy).
+_current_method: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("luna_fault_method", default=None)
+
+
+def _traced_iter(method: str, gen: Iterator[Any]) -> Iterator[Any]:
+    """Re-enter `method` around each step of a generator method (its body runs lazily)."""
+    try:
+        while True:
+            token = _current_method.set(method)
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                _current_method.reset(token)
+            yield item
+    finally:
+        close = getattr(gen, "close", None)
+        if close is not None:
+            close()
+
+
+class InjectedFault(Exception):
+    """Raised by the injector; looks like a transport error to the storage layer."""
+
+
+class InjectedTimeout(InjectedFault, TimeoutError):
+    pass
+
+
+class FaultInjector:
+    """
+    Latency / error / timeout / outage injection for storage calls, for local
+    degraded-mode testing. Never enable in production.
+
+    Scenario (JSON, from LUNA_FAULTS inline or LUNA_FAULTS_FILE):
+      {
+        "seed": 7,
+        "rules": {
+          "*":                {"latency_ms": 30, "latency_dist": "lognormal", "sigma": 0.6},
+          "insert_archetype": {"error_rate": 0.2, "timeout_rate": 0.05, "timeout_ms": 2000},
+          "insert_events":    {"outage_start_s": 20, "outage_duration_s": 30}
+        }
+      }
+    A method's rule is merged over "*". Fields:
+      latency_ms / latency_dist  fixed | uniform (+/- jitter_ms) | exponential (mean) | lognormal (median, sigma)
+      error_rate                 probability of an immediate failure
+      timeout_rate / timeout_ms  probability of hanging timeout_ms, then failing
+      outage                     true = every call fails
+      outage_start_s / outage_duration_s  fail every call in this window (seconds since start)
+    """
+    def __init__(self, rules: Dict[str, Dict[str, Any]], *, seed: Optional[int] = None):
+        for method, rule in rules.items():
+            if method != "*" and method not in STORAGE_METHODS:
+                raise ValueError(f"Unknown storage method in fault rules: {method}")
+            unknown = set(rule) - _RULE_KEYS
+            if unknown:
+                raise ValueError(f"Unknown fault rule fields for {method}: {', '.join(sorted(unknown))}")
+        self.rules = rules
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def load(cls, raw: str = "", path: str = "") -> Optional["FaultInjector"]:
+        """Build from an inline JSON scenario or a scenario file; None when neither is set."""
+        raw = (raw or "").strip()
+        path = (path or "").strip()
+        if not raw and path:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = f.read()
+        if not raw:
+            return None
+        spec = json.loads(raw)
+        return cls(spec.get("rules") or {}, seed=spec.get("seed"))
+
+    def rule_for(self, method: str) -> Dict[str, Any]:
+        return {**self.rules.get("*", {}), **self.rules.get(method, {})}
+
+    def _count(self, method: str, what: str) -> None:
+        with self._lock:
+            per = self._counts.setdefault(method, {})
+            per[what] = per.get(what, 0) + 1
+
+    def _latency_s(self, rule: Dict[str, Any]) -> float:
+        base = float(rule.get("latency_ms", 0.0))
+        if base <= 0:
+            return 0.0
+        dist = rule.get("latency_dist", "fixed")
+        with self._lock:
+            if dist == "uniform":
+                jitter = float(rule.get("jitter_ms", base / 2))
+                ms = self._rng.uniform(base - jitter, base + jitter)
+            elif dist == "exponential":
+                ms = self._rng.expovariate(1.0 / base)
+            elif dist == "lognormal":
+                ms = self._rng.lognormvariate(math.log(base), float(rule.get("sigma", 0.5)))
+            else:
+                ms = base
+        return max(0.0, ms) / 1000.0
+
+    def in_outage(self, rule: Dict[str, Any]) -> bool:
+        if rule.get("outage"):
+            return True
+        start = rule.get("outage_start_s")
+        if start is None:
+            return False
+        elapsed = time.monotonic() - self._started
+        return float(start) <= elapsed < float(start) + float(rule.get("outage_duration_s", math.inf))
+
+    def apply(self, method: str) -> None:
+        """Sleep and/or raise for one call of `method` according to its rule."""
+        rule = self.rule_for(method)
+        if not rule:
+            return
+        self._count(method, "calls")
+        delay = self._latency_s(rule)
+        if delay:
+            time.sleep(delay)
+        if self.in_outage(rule):
+            self._count(method, "outage")
+            raise InjectedFault(f"injected outage: {method}")
+        with self._lock:
+            roll = self._rng.random()
+        timeout_rate = float(rule.get("timeout_rate", 0.0))
+        if roll < timeout_rate:
+            self._count(method, "timeouts")
+            time.sleep(float(rule.get("timeout_ms", 5000)) / 1000.0)
+            raise InjectedTimeout(f"injected timeout: {method}")
+        if roll < timeout_rate + float(rule.get("error_rate", 0.0)):
+            self._count(method, "errors")
+            raise InjectedFault(f"injected error: {method}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "elapsed_s": round(time.monotonic() - self._started, 1),
+                "methods": {m: dict(c) for m, c in self._counts.items()},
+            }
+
+
+class _FaultyBuilder:
+    """Proxy over a PostgREST query builder: faults fire at execute()."""
+    def __init__(self, inner: Any, injector: FaultInjector, table: str):
+        self._inner = inner
+        self._injector = injector
+        self._table = table
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._inner, name)
+        if name == "execute":
+            def execute(*args: Any, **kwargs: Any) -> Any:
+                self._injector.apply(_current_method.get() or self._table)
+                return attr(*args, **kwargs)
+            return execute
+        if not callable(attr):
+            return attr
+
+        def chain(*args: Any, **kwargs: Any) -> Any:
+            out = attr(*args, **kwargs)
+            return _FaultyBuilder(out, self._injector, self._table) if hasattr(out, "execute") else out
+        return chain
+
+
+class FaultyClient:
+    """Proxy over the Supabase client so injected failures hit inside SupabaseDB's retry loop."""
+    def __init__(self, inner: Any, injector: FaultInjector):
+        self._inner = inner
+        self._injector = injector
+
+    def table(self, name: str) -> _FaultyBuilder:
+        return _FaultyBuilder(self._inner.table(name), self._injector, name)
+
+    def rpc(self, name: str, *args: Any, **kwargs: Any) -> _FaultyBuilder:
+        return _FaultyBuilder(self._inner.rpc(name, *args, **kwargs), self._injector, name)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+class FaultyDB:
+    """
+    Wraps a storage backend with a FaultInjector.
+
+    - SupabaseDB: its client is wrapped in a FaultyClient (through `client_factory`, or
+      in place once built), so faults surface as transport errors inside `_retry` and
+      exercise the real backoff -> LunaError -> spool path.
+    - Other backends (MemoryDB): faults are applied per method call and surface the way
+      SupabaseDB's would after retries (retryable LunaError, or swallowed for best-effort
+      methods).
+    """
+    def __init__(self, db: Any, injector: FaultInjector):
+        self._db = db
+        self.injector = injector
+        self._client_level = isinstance(db, SupabaseDB)
+        if self._client_level:
+            with db._sb_lock:
+                if db._sb is not None:
+                    db._sb = FaultyClient(db._sb, injector)
+                make_client = db.client_factory
+                db.client_factory = lambda url, key: FaultyClient(make_client(url, key), injector)
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._db, name)
+        if name not in STORAGE_METHODS:
+            return attr
+        if self._client_level:
+            def traced(*args: Any, **kwargs: Any) -> Any:
+                token = _current_method.set(name)
+                try:
+                    out = attr(*args, **kwargs)
+                finally:
+                    _current_method.reset(token)
+                return _traced_iter(name, out) if inspect.isgenerator(out) else out
+            return traced
+
+        def faulty(*args: Any, **kwargs: Any) -> Any:
+            try:
+                self.injector.apply(name)
+            except InjectedFault as e:
+                if name in _SWALLOWED:
+                    return _SWALLOWED[name]
+                raise LunaError("DB_FAULT_INJECTED", str(e), {"method": name}, retryable=True)
+            return attr(*args, **kwargs)
+        return faulty
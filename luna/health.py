@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .util import utc_now_iso
+
+
+class HealthProber:
+    """
+    Background DB prober. Health endpoints read `snapshot()` from memory instead of
+    pinging on every hit, so load balancers polling health cost no DB traffic and
+    answer instantly even during an outage.
+
+    Breaker state is derived from consecutive probe failures:
+      closed  -> last probe ok
+      open    -> failure_threshold or more consecutive failures
+      half_open -> failing, but below the threshold
+    """
+    def __init__(
+        self,
+        ping: Optional[Callable[[], bool]],
+        *,
+        interval_seconds: float = 10.0,
+        failure_threshold: int = 3,
+        on_success: Optional[Callable[[], Any]] = None,
+        spool_stats: Optional[Callable[[], Dict[str, int]]] = None,
+    ):
+        self._ping = ping
+        self.interval = max(0.5, interval_seconds)
+        self.failure_threshold = max(1, failure_threshold)
+        self._on_success = on_success
+        self._spool_stats = spool_stats
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.db_ok: Optional[bool] = None
+        self.latency_ms: Optional[float] = None
+        self.consecutive_failures = 0
+        self.last_probe_at: Optional[str] = None
+        self.last_success_at: Optional[str] = None
+        self.spool: Dict[str, int] = {}
+
+    @property
+    def breaker(self) -> str:
+        if self.consecutive_failures == 0:
+            return "closed"
+        if self.consecutive_failures >= self.failure_threshold:
+            return "open"
+        return "half_open"
+
+    def probe(self, *, replay: bool = True) -> bool:
+        """Run one live probe now and update the cached state (replay=False skips on_success)."""
+        ok = False
+        t0 = time.monotonic()
+        if self._ping is not None:
+            try:
+                ok = bool(self._ping())
+            except Exception:
+                ok = False
+        latency = round((time.monotonic() - t0) * 1000, 1)
+        self.record(ok, latency)
+        if ok and replay and self._on_success is not None:
+            try:
+                self._on_success()
+            except Exception:
+                pass
+        self._refresh_spool()
+        return ok
+
+    def record(self, ok: bool, latency_ms: Optional[float]) -> None:
+        now = utc_now_iso()
+        with self._lock:
+            self.db_ok = ok
+            self.latency_ms = latency_ms
+            self.last_probe_at = now
+            if ok:
+                self.consecutive_failures = 0
+                self.last_success_at = now
+            else:
+                self.consecutive_failures += 1
+
+    def _refresh_spool(self) -> None:
+        if self._spool_stats is None:
+            return
+        try:
+            self.spool = self._spool_stats()
+        except Exception:
+            pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "db_ok": self.db_ok,
+                "db_latency_ms": self.latency_ms,
+                "breaker": self.breaker,
+                "consecutive_failures": self.consecutive_failures,
+                "last_probe_at": self.last_probe_at,
+                "last_success_at": self.last_success_at,
+                "spool": dict(self.spool),
+            }
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="luna-health-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.probe()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Awaitable, Callable, Dict, MutableMapping, Optional
+
+from .errors import error_payload
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+
+class BodySizeLimitMiddleware:
+    """
+    Pure ASGI guard that rejects request bodies over `max_bytes` with 413 before any
+    JSON parsing or Pydantic validation runs.
+
+    - A declared Content-Length over the limit is refused without reading the body.
+    - Chunked / undeclared bodies are counted as they stream in and cut off at the limit.
+    Covers every route of the app it wraps (REST and, in asgi.py, the mounted MCP transport),
+    so a hostile client can cost at most `max_bytes` of reading per request.
+    """
+    def __init__(self, app: Callable[..., Awaitable[None]], *, max_bytes: int, overrides: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        # path prefix -> limit, longest prefix wins (e.g. a larger cap for batch endpoints)
+        self.overrides = dict(sorted((overrides or {}).items(), key=lambda kv: -len(kv[0])))
+
+    def limit_for(self, path: str) -> int:
+        for prefix, limit in self.overrides.items():
+            if path.startswith(prefix):
+                return limit
+        return self.max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self.limit_for(scope.get("path", ""))
+        if limit <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers") or []:
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    await _reject(send, limit)
+                    return
+                break
+
+        received = 0
+        rejected = False
+        started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Answer now and tell the app the client went away; frameworks wrap
+                    # errors raised while reading the body, so raising here would not do.
+                    rejected = True
+                    if not started:
+                        await _reject(send, limit)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+
+async def _reject(send: Send, limit: int) -> None:
+    body = json.dumps(
+        error_payload("PAYLOAD_TOO_LARGE", f"Request body exceeds {limit} bytes.", details={"max_bytes": limit})
+    ).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("ascii")), (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, TextIO
+
+from .util import stable_json_dumps
+
+
+class JsonRecordFormatter(logging.Formatter):
+    """
+    Structured records carry a dict as `record.msg`; serialize those as one JSON line.
+    Anything else falls back to the plain `%(message)s` format.
+    """
+    def __init__(self) -> None:
+        super().__init__("%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, dict):
+            payload = dict(record.msg)
+            if "ts" not in payload:
+                payload["ts"] = datetime.fromtimestamp(record.created, timezone.utc).isoformat()
+            return stable_json_dumps(payload)
+        return super().format(record)
+
+
+class _FlushMarker:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+
+class BatchingQueueHandler(logging.Handler):
+    """
+    Non-blocking log handler.
+    emit() only hands the record to a bounded queue; a background thread formats
+    and writes records in batches. When the queue is full the record is dropped
+    and counted, so logging never adds I/O latency to a request.
+    """
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        *,
+        max_queue: int = 10_000,
+        batch_size: int = 256,
+        flush_interval: float = 0.25,
+    ):
+        super().__init__()
+        self.stream = stream or sys.stderr
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval)
+        self.setFormatter(JsonRecordFormatter())
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_queue))
+        self._stop = threading.Event()
+        self._dropped = 0
+        self._dropped_reported = 0
+        self._written = 0
+        self._thread = threading.Thread(target=self._run, name="luna-log-writer", daemon=True)
+        self._thread.start()
+
+    # ---- hot path ----
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
+
+    # ---- background writer ----
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._write_batch([])
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Any]) -> None:
+        lines: List[str] = []
+        markers: List[_FlushMarker] = []
+        for item in batch:
+            if isinstance(item, _FlushMarker):
+                markers.append(item)
+                continue
+            try:
+                lines.append(self.format(item))
+            except Exception:
+                self.handleError(item)
+
+        dropped = self._dropped
+        if dropped > self._dropped_reported:
+            lines.append(stable_json_dumps({
+                "event": "log_dropped",
+                "count": dropped - self._dropped_reported,
+                "total": dropped,
+            }))
+            self._dropped_reported = dropped
+
+        if lines:
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+                self._written += len(lines)
+            except Exception:
+                pass
+        for m in markers:
+            m.done.set()
+
+    # ---- lifecycle ----
+    def flush(self, timeout: float = 2.0) -> None:
+        """Block until everything queued before this call has been written."""
+        if not self._thread.is_alive():
+            return
+        marker = _FlushMarker()
+        try:
+            self._q.put(marker, timeout=timeout)
+        except queue.Full:
+            return
+        marker.done.wait(timeout)
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join(timeout=2.0)
+        # Write whatever is still queued on the caller's thread.
+        rest: List[Any] = []
+        while True:
+            try:
+                rest.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        self._write_batch(rest)
+        super().close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._q.qsize(),
+            "dropped": self._dropped,
+            "written": self._written,
+        }
+
+
+def install_queue_logging(
+    level: str = "INFO",
+    *,
+    stream: Optional[TextIO] = None,
+    max_queue: int = 10_000,
+    batch_size: int = 256,
+    flush_interval: float = 0.25,
+) -> BatchingQueueHandler:
+    """
+    Replacement for logging.basicConfig(): route the root logger through a
+    BatchingQueueHandler. Idempotent; logging.shutdown() (atexit) flushes it.
+    """
+    root = logging.getLogger()
+    root.setLevel(level)
+    for h in root.handlers:
+        if isinstance(h, BatchingQueueHandler):
+            return h
+    handler = BatchingQueueHandler(
+        stream,
+        max_queue=max_queue,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+    )
+    root.addHandler(handler)
+    return handler
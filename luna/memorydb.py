@@ -0,0 +1,431 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .similarity import hamming
+from .util import utc_now_iso
+
+
+class MemoryDB:
+    """
+    In-process stand-in for SupabaseDB (same methods, same return shapes) for load
+    tests and local runs without Supabase. Select it with LUNA_DB_BACKEND=memory.
+
+    Rows live in plain dicts keyed like the real unique constraints, so upserts are
+    idempotent the same way. `latency_ms` adds a fixed sleep per call to approximate
+    a network round-trip. Nothing is persisted.
+    """
+    def __init__(self, *, latency_ms: float = 0.0):
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self._lock = threading.Lock()
+        self.users: Dict[str, Dict[str, Any]] = {}       # chatgpt_user_ref -> row
+        self._user_ids: Dict[str, str] = {}                # id -> chatgpt_user_ref
+        self.archetypes: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.date_plans: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.events: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.feedback: List[Dict[str, Any]] = []
+        # user_id -> rows, so per-user reads stay O(rows of that user) under load
+        self._archetypes_by_user: Dict[str, List[Dict[str, Any]]] = {}
+        self._plans_by_user: Dict[str, List[Dict[str, Any]]] = {}
+        # (city_key, category, noise_level, price_tier) -> aggregate row (schema.sql trigger)
+        self.criteria_insights: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+
+    def _io(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def ping(self) -> bool:
+        self._io()
+        return True
+
+    def upsert_user(self, user_ref: str) -> str:
+        self._io()
+        now = utc_now_iso()
+        with self._lock:
+            row = self._user_row(user_ref, now)
+            row["last_seen_at"] = now
+            row["updated_at"] = now
+            return row["id"]
+
+    def _user_row(self, user_ref: str, now: str) -> Dict[str, Any]:
+        row = self.users.get(user_ref)
+        if row is None:
+            row = {"id": str(uuid.uuid4()), "chatgpt_user_ref": user_ref, "data_opt_out": False, "consent_version": None, "created_at": now, "last_seen_at": now}
+            self.users[user_ref] = row
+            self._user_ids[row["id"]] = user_ref
+        return row
+
+    def find_user(self, user_ref: str) -> Optional[str]:
+        self._io()
+        with self._lock:
+            row = self.users.get(user_ref)
+            return row["id"] if row is not None else None
+
+    def touch_users(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        self._io()
+        with self._lock:
+            for r in rows:
+                row = self.users.get(r["chatgpt_user_ref"])
+                if row is not None:
+                    row["last_seen_at"] = r["last_seen_at"]
+
+    def _user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ref = self._user_ids.get(user_id)
+        return self.users.get(ref) if ref is not None else None
+
+    def set_opt_out(self, user_id: str, opt_out: bool) -> None:
+        self._io()
+        with self._lock:
+            row = self._user(user_id)
+            if row is not None:
+                row["data_opt_out"] = opt_out
+                row["updated_at"] = utc_now_iso()
+
+    def set_consent(self, user_id: str, consent_version: str) -> None:
+        self._io()
+        with self._lock:
+            row = self._user(user_id)
+            if row is not None:
+                row["consent_version"] = consent_version
+                row["updated_at"] = utc_now_iso()
+
+    def get_user_gate(self, user_id: str) -> Dict[str, Any]:
+        self._io()
+        with self._lock:
+            row = self._user(user_id)
+            if row is None:
+                return {}
+            return {"data_opt_out": row["data_opt_out"], "consent_version": row["consent_version"]}
+
+    def mark_purge(self, user_id: str, *, requested_at: Optional[str], completed_at: Optional[str]) -> None:
+        self._io()
+        with self._lock:
+            row = self._user(user_id)
+            if row is not None:
+                row["purge_requested_at"] = requested_at
+                row["purge_completed_at"] = completed_at
+
+    def get_purge_state(self, user_id: str) -> Dict[str, Any]:
+        self._io()
+        with self._lock:
+            row = self._user(user_id)
+            if row is None:
+                return {}
+            return {"purge_requested_at": row.get("purge_requested_at"), "purge_completed_at": row.get("purge_completed_at")}
+
+    def list_pending_purges(self, *, limit: int = 100) -> List[Dict[str, Any]]:
+        self._io()
+        with self._lock:
+            rows = [
+                {"id": r["id"], "purge_requested_at": r["purge_requested_at"]}
+                for r in self.users.values()
+                if r.get("purge_requested_at") and not r.get("purge_completed_at")
+            ]
+        return sorted(rows, key=lambda r: r["purge_requested_at"])[:limit]
+
+    def delete_user_rows(self, table: str, *, user_id: str, limit: int) -> int:
+        self._io()
+        with self._lock:
+            if table == "archetypes":
+                rows = self._archetypes_by_user.get(user_id, [])
+                gone = rows[:limit]
+                del rows[:limit]
+                for r in gone:
+                    self.archetypes.pop((r["user_id"], r["level"], r["source_hash"]), None)
+                return len(gone)
+            if table == "date_plans":
+                rows = self._plans_by_user.get(user_id, [])
+                gone = rows[:limit]
+                del rows[:limit]
+                for r in gone:
+                    self.date_plans.pop((r["user_id"], r["source_hash"]), None)
+                return len(gone)
+            if table == "feedback":
+                gone = [r for r in self.feedback if r["user_id"] == user_id][:limit]
+                ids = {r["id"] for r in gone}
+                self.feedback = [r for r in self.feedback if r["id"] not in ids]
+                for r in gone:
+                    self._feedback_insight(user_id, r["date_plan_id"], r["rating"], r["tags"], sign=-1)
+                return len(gone)
+            if table == "event_log":
+                keys = [k for k in self.events if k[0] == user_id][:limit]
+                for k in keys:
+                    del self.events[k]
+                return len(keys)
+            return 0
+
+    def insert_archetype(self, *, user_id: str, level: str, source_hash: str, archetype_json: Dict[str, Any], model_version: Optional[str] = None) -> Optional[str]:
+        self._io()
+        with self._lock:
+            return self._put_archetype(user_id, level, source_hash, archetype_json, model_version)
+
+    def _put_archetype(self, user_id: str, level: str, source_hash: str, archetype_json: Dict[str, Any], model_version: Optional[str]) -> str:
+        key = (user_id, level, source_hash)
+        row = self.archetypes.get(key)
+        if row is None:
+            row = {"id": str(uuid.uuid4()), "user_id": user_id, "level": level, "source_hash": source_hash, "created_at": utc_now_iso()}
+            self.archetypes[key] = row
+            self._archetypes_by_user.setdefault(user_id, []).append(row)
+        row.update({"archetype_json": archetype_json, "model_version": model_version})
+        return row["id"]
+
+    def insert_date_plan(
+        self,
+        *,
+        user_id: str,
+        source_hash: str,
+        city: str,
+        plan_json: Dict[str, Any],
+        simhash: Optional[int] = None,
+        city_key: Optional[str] = None,
+    ) -> Optional[str]:
+        self._io()
+        with self._lock:
+            return self._put_date_plan(user_id, source_hash, city, plan_json, simhash, city_key)
+
+    def _put_date_plan(
+        self, user_id: str, source_hash: str, city: str, plan_json: Dict[str, Any], simhash: Optional[int] = None, city_key: Optional[str] = None
+    ) -> str:
+        key = (user_id, source_hash)
+        row = self.date_plans.get(key)
+        if row is None:
+            row = {"id": str(uuid.uuid4()), "user_id": user_id, "source_hash": source_hash, "created_at": utc_now_iso()}
+            self.date_plans[key] = row
+            self._plans_by_user.setdefault(user_id, []).append(row)
+        row.update({"city": city, "city_key": city_key, "plan_json": plan_json, "simhash": simhash})
+        return row["id"]
+
+    def replace_date_plan(
+        self, *, plan_id: str, user_id: str, source_hash: str, city: str, plan_json: Dict[str, Any], simhash: int,
+        city_key: Optional[str] = None,
+    ) -> Optional[str]:
+        self._io()
+        with self._lock:
+            return self._replace_date_plan(plan_id, user_id, source_hash, city, plan_json, simhash, city_key)
+
+    def _replace_date_plan(
+        self, plan_id: str, user_id: str, source_hash: str, city: str, plan_json: Dict[str, Any], simhash: int,
+        city_key: Optional[str] = None,
+    ) -> Optional[str]:
+        taken = self.date_plans.get((user_id, source_hash))
+        if taken is not None and taken["id"] != plan_id:
+            return None
+        for row in self._plans_by_user.get(user_id, []):
+            if row["id"] == plan_id:
+                self.date_plans.pop((user_id, row["source_hash"]), None)
+                row.update({"source_hash": source_hash, "city": city, "plan_json": plan_json, "simhash": simhash, "created_at": utc_now_iso()})
+                if city_key is not None:
+                    row["city_key"] = city_key
+                self.date_plans[(user_id, source_hash)] = row
+                return plan_id
+        return None
+
+    def recent_plan_fingerprints(self, *, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        self._io()
+        with self._lock:
+            rows = sorted(self._plans_by_user.get(user_id, []), key=lambda r: r["created_at"], reverse=True)[:limit]
+            return [{"id": r["id"], "city": r["city"], "city_key": r.get("city_key"), "simhash": r.get("simhash")} for r in rows]
+
+    # ---- rpc.sql equivalents: one simulated round-trip, atomic under the lock ----
+
+    def _store_tx(self, user_ref: str, require_consent: bool, event: Optional[Dict[str, Any]], put: Any, replace: Any = None) -> Dict[str, Any]:
+        self._io()
+        with self._lock:
+            user = self._user_row(user_ref, utc_now_iso())
+            reason = None
+            if user["data_opt_out"]:
+                reason = "opted_out"
+            elif require_consent and not user["consent_version"]:
+                reason = "consent_required"
+            row_id = None
+            replaced = False
+            if reason is None and replace is not None:
+                row_id = replace(user["id"])
+                replaced = row_id is not None
+            if reason is None and not replaced:
+                row_id = put(user["id"])
+                if event:
+                    self._put_events([{**event, "user_id": user["id"], "occurred_at": event.get("occurred_at") or utc_now_iso()}])
+            return {
+                "user_id": user["id"], "id": row_id, "stored": reason is None, "reason": reason, "replaced": replaced,
+                "data_opt_out": user["data_opt_out"], "consent_version": user["consent_version"],
+            }
+
+    def store_archetype_tx(
+        self,
+        *,
+        user_ref: str,
+        level: str,
+        source_hash: str,
+        archetype_json: Dict[str, Any],
+        model_version: Optional[str] = None,
+        event: Optional[Dict[str, Any]] = None,
+        require_consent: bool = False,
+        user_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return self._store_tx(user_ref, require_consent, event, lambda uid: self._put_archetype(uid, level, source_hash, archetype_json, model_version))
+
+    def store_date_plan_tx(
+        self,
+        *,
+        user_ref: str,
+        source_hash: str,
+        city: str,
+        plan_json: Dict[str, Any],
+        event: Optional[Dict[str, Any]] = None,
+        require_consent: bool = False,
+        user_id: Optional[str] = None,
+        simhash: Optional[int] = None,
+        max_distance: Optional[int] = None,
+        city_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        replace = None
+        if simhash is not None and max_distance is not None:
+            def replace(uid: str) -> Optional[str]:
+                recent = sorted(self._plans_by_user.get(uid, []), key=lambda r: r["created_at"], reverse=True)[:20]
+                near = [
+                    (hamming(simhash, r["simhash"]), r["id"]) for r in recent
+                    if (r["city_key"] == city_key if city_key and r.get("city_key") else r["city"] == city)
+                    and r.get("simhash") is not None and hamming(simhash, r["simhash"]) <= max_distance
+                ]
+                return self._replace_date_plan(min(near)[1], uid, source_hash, city, plan_json, simhash, city_key) if near else None
+        return self._store_tx(
+            user_ref, require_consent, event,
+            lambda uid: self._put_date_plan(uid, source_hash, city, plan_json, simhash, city_key),
+            replace,
+        )
+
+    def insert_event(self, *, user_id: str, event_name: str, event_id: str, properties: Dict[str, Any], occurred_at: str) -> None:
+        self.insert_events(rows=[{"user_id": user_id, "event_name": event_name, "event_id": event_id, "properties": properties, "occurred_at": occurred_at}])
+
+    def insert_events(self, *, rows: List[Dict[str, Any]]) -> List[str]:
+        if not rows:
+            return []
+        self._io()
+        with self._lock:
+            return self._put_events(rows)
+
+    def _put_events(self, rows: List[Dict[str, Any]]) -> List[str]:
+        inserted = []
+        for r in rows:
+            if (r["user_id"], r["event_id"]) not in self.events:
+                self.events[(r["user_id"], r["event_id"])] = {"id": str(uuid.uuid4()), "created_at": utc_now_iso(), **r}
+                inserted.append(r["event_id"])
+        return inserted
+
+    def insert_feedback(self, *, user_id: str, date_plan_id: Optional[str], rating: Optional[int], tags: Optional[list], notes: Optional[str]) -> None:
+        self._io()
+        with self._lock:
+            self.feedback.append({
+                "id": str(uuid.uuid4()), "user_id": user_id, "date_plan_id": date_plan_id,
+                "rating": rating, "tags": tags, "notes": notes, "created_at": utc_now_iso(),
+            })
+            self._feedback_insight(user_id, date_plan_id, rating, tags)
+
+    def _feedback_insight(self, user_id: str, date_plan_id: Optional[str], rating: Optional[int], tags: Optional[list], sign: int = 1) -> None:
+        """Mirror of the luna_feedback_insight trigger (sign=-1: the row was deleted)."""
+        if not date_plan_id or (rating is None and not tags):
+            return
+        plan = next((r for r in self._plans_by_user.get(user_id, []) if r["id"] == date_plan_id), None)
+        crit = (plan or {}).get("plan_json", {}).get("primary_criteria")
+        if not crit:
+            return
+        key = (
+            plan["city_key"] if plan.get("city_key") else plan["city"].strip().lower(),  # type: ignore[index]
+            " ".join(str(crit.get("category") or "").lower().split()),
+            crit.get("noise_level") or "",
+            crit.get("price_tier") or "",
+        )
+        if sign < 0 and key not in self.criteria_insights:
+            return
+        row = self.criteria_insights.setdefault(key, {"feedback_count": 0, "rating_count": 0, "rating_sum": 0, "tag_counts": {}})
+        row["feedback_count"] = max(0, row["feedback_count"] + sign)
+        if rating is not None:
+            row["rating_count"] = max(0, row["rating_count"] + sign)
+            row["rating_sum"] = max(0, row["rating_sum"] + sign * rating)
+        for t in tags or []:
+            t = str(t).strip().lower()
+            if t and len(t) <= 40:
+                n = row["tag_counts"].get(t, 0) + sign
+                if n > 0:
+                    row["tag_counts"][t] = n
+                else:
+                    row["tag_counts"].pop(t, None)
+        if row["feedback_count"] == 0:
+            del self.criteria_insights[key]
+
+    def get_criteria_insights(self, *, city_key: str, limit: int = 200) -> List[Dict[str, Any]]:
+        self._io()
+        with self._lock:
+            rows = [
+                {"category": k[1], "noise_level": k[2], "price_tier": k[3], **{f: (dict(v) if f == "tag_counts" else v) for f, v in row.items()}}
+                for k, row in self.criteria_insights.items() if k[0] == city_key
+            ]
+        return sorted(rows, key=lambda r: -r["feedback_count"])[:limit]
+
+    def _latest(self, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return max(rows, key=lambda r: r["created_at"]) if rows else None
+
+    def get_latest_archetype(self, *, user_id: str, level: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        self._io()
+        with self._lock:
+            rows = [r for r in self._archetypes_by_user.get(user_id, []) if not level or r["level"] == level]
+            row = self._latest(rows)
+            return {k: row[k] for k in ("archetype_json", "created_at", "level")} if row else None
+
+    def get_latest_date_plan(self, *, user_id: str) -> Optional[Dict[str, Any]]:
+        self._io()
+        with self._lock:
+            row = self._latest(self._plans_by_user.get(user_id, []))
+            return {k: row[k] for k in ("id", "city", "plan_json", "created_at")} if row else None
+
+    def iter_archetypes(self, *, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            rows = sorted(
+                (r for r in self.archetypes.values() if not (self._user(r["user_id"]) or {}).get("data_opt_out")),
+                key=lambda r: (r["created_at"], r["id"]),
+            )
+        for r in rows:
+            yield {k: r[k] for k in ("id", "user_id", "level", "archetype_json", "created_at")}
+
+    def iter_user_rows(
+        self,
+        table: str,
+        *,
+        user_id: str,
+        time_column: str = "created_at",
+        after: Optional[Tuple[str, str]] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        self._io()
+        with self._lock:
+            if table == "archetypes":
+                rows = list(self._archetypes_by_user.get(user_id, []))
+            elif table == "date_plans":
+                rows = list(self._plans_by_user.get(user_id, []))
+            elif table == "feedback":
+                rows = [r for r in self.feedback if r["user_id"] == user_id]
+            elif table == "event_log":
+                rows = [r for (uid, _), r in self.events.items() if uid == user_id]
+            else:
+                rows = []
+            rows = [dict(r) for r in rows]
+        rows.sort(key=lambda r: (r.get(time_column) or "", r.get("id") or ""))
+        for r in rows:
+            if after is not None and (r.get(time_column) or "", r.get("id") or "") <= after:
+                continue
+            yield r
+
+    def get_latest(self, *, user_id: str) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "latest_lite": self.get_latest_archetype(user_id=user_id, level="lite"),
+            "latest_deep": self.get_latest_archetype(user_id=user_id, level="deep"),
+        }
+        with self._lock:
+            out["date_plan_count"] = len(self._plans_by_user.get(user_id, []))
+        return out
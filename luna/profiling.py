@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+from .errors import LunaError
+from .util import utc_now_iso
+
+# Trim these prefixes from frame filenames in collapsed stacks / reports.
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_MARKERS = ("site-packages" + os.sep, "dist-packages" + os.sep)
+
+
+def _short(filename: str) -> str:
+    if filename.startswith(_ROOT):
+        return filename[len(_ROOT):]
+    for m in _MARKERS:
+        i = filename.rfind(m)
+        if i >= 0:
+            return filename[i + len(m):]
+    return os.path.basename(filename)
+
+
+def _frame_label(code: Any) -> str:
+    # No ';' (collapsed-stack separator); the trailing count is split on the last space.
+    return f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampler: every `interval` seconds a daemon thread reads
+    sys._current_frames() and counts each thread's stack. No tracing hooks are
+    installed, so the profiled code runs at full speed; the cost is one stack walk
+    per thread per sample, on the sampler's own thread.
+
+    Output is collapsed stacks ("thread;outer;...;inner <count>"), the input format
+    of flamegraph.pl, speedscope and inferno.
+    """
+    def __init__(self, *, interval_seconds: float = 0.01, max_depth: int = 128):
+        self.interval = max(0.001, interval_seconds)
+        self.max_depth = max(1, max_depth)
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def sample_once(self, skip_ident: Optional[int] = None) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip_ident:
+                continue
+            labels: List[str] = []
+            f = frame
+            while f is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(f.f_code))
+                f = f.f_back
+            labels.append(names.get(ident, f"thread-{ident}").replace(";", ",").replace(" ", "_"))
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float, stop: Optional[threading.Event] = None) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        stop = stop or threading.Event()
+        while not stop.is_set() and time.monotonic() < deadline:
+            self.sample_once(skip_ident=me)
+            stop.wait(self.interval)
+
+    def collapsed(self) -> Iterable[str]:
+        for stack, n in sorted(self.stacks.items()):
+            yield f"{stack} {n}\n"
+
+    def top(self, n: int = 20) -> Dict[str, List[Dict[str, Any]]]:
+        """Hottest frames: `self` = sampled on top of the stack, `total` = anywhere on it."""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # drop the thread name
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return {
+            "self": [{"frame": k, "samples": v} for k, v in own.most_common(n)],
+            "total": [{"frame": k, "samples": v} for k, v in total.most_common(n)],
+        }
+
+
+class _ToolStats:
+    def __init__(self, window: int = 256):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def add(self, ms: float, ok: bool) -> None:
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.recent.append(ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+
+        def pct(p: float) -> Optional[float]:
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 2) if recent else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.calls, 2) if self.calls else None,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class Profiler:
+    """
+    On-demand profiling for a running worker. Nothing here costs anything until it
+    is asked for: the sampler thread exists only while a sample runs, tracemalloc
+    starts on the first memory snapshot (or at boot when `tracemalloc_frames` > 0),
+    and only the service methods named in `tools` are wrapped with a timer.
+
+    Files go to `out_dir`:
+      sample-*.collapsed    collapsed stacks from the sampler (flamegraph-ready)
+      tool-*.prof           cProfile captures of armed tool calls (pstats / snakeviz)
+      mem-*.txt             tracemalloc top allocators + growth since the previous snapshot
+      mem-*.tracemalloc     the raw snapshot (tracemalloc.Snapshot.load)
+    """
+    def __init__(self, out_dir: str, *, tools: Iterable[str] = (), tracemalloc_frames: int = 0):
+        self.out_dir = out_dir
+        self.tools = tuple(tools)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _ToolStats] = {}
+        self._armed: Dict[str, int] = {}
+        # cProfile hooks are per-interpreter on 3.12+: one capture at a time.
+        self._capture = threading.Lock()
+        self._sampler: Optional[SamplingProfiler] = None
+        self._sample_thread: Optional[threading.Thread] = None
+        self._sample_stop = threading.Event()
+        self._last_sample: Optional[Dict[str, Any]] = None
+        self._mem_prev: Optional[tracemalloc.Snapshot] = None
+        self._files: Deque[str] = deque(maxlen=50)
+        if tracemalloc_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(tracemalloc_frames)
+
+    def _path(self, kind: str, ext: str, name: str = "") -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        tag = f"-{name}" if name else ""
+        path = os.path.join(self.out_dir, f"{kind}{tag}-{stamp}-{os.getpid()}-{int(time.monotonic() * 1000) % 1000:03d}.{ext}")
+        self._files.append(path)
+        return path
+
+    # ---- sampling ----
+
+    def start_sampling(self, seconds: float, *, interval_ms: float = 10.0) -> Dict[str, Any]:
+        """Sample every thread for `seconds` in the background; the file is written when it ends."""
+        seconds = min(max(0.1, seconds), 600.0)
+        with self._lock:
+            if self._sample_thread is not None and self._sample_thread.is_alive():
+                raise LunaError("PROFILE_BUSY", "A sampling profile is already running.", {"running": self._last_sample})
+            sampler = SamplingProfiler(interval_seconds=interval_ms / 1000.0)
+            path = self._path("sample", "collapsed")
+            self._sample_stop.clear()
+            self._sampler = sampler
+            self._last_sample = {"status": "running", "started_at": utc_now_iso(), "seconds": seconds, "interval_ms": interval_ms, "file": path}
+            self._sample_thread = threading.Thread(target=self._run_sample, args=(sampler, seconds, path), name="luna-profiler", daemon=True)
+            self._sample_thread.start()
+            return dict(self._last_sample)
+
+    def stop_sampling(self) -> None:
+        self._sample_stop.set()
+
+    def _run_sample(self, sampler: SamplingProfiler, seconds: float, path: str) -> None:
+        t0 = time.monotonic()
+        sampler.run(seconds, self._sample_stop)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(sampler.collapsed())
+        with self._lock:
+            self._last_sample = {
+                **(self._last_sample or {}),
+                "status": "done",
+                "finished_at": utc_now_iso(),
+                "elapsed_s": round(time.monotonic() - t0, 2),
+                "samples": sampler.samples,
+                "top": sampler.top(15),
+            }
+
+    # ---- memory ----
+
+    def memory_snapshot(self, *, top: int = 25, frames: int = 1) -> Dict[str, Any]:
+        """
+        Top allocators now, plus growth since the previous snapshot. If tracemalloc is
+        not tracing yet it is started here and this snapshot becomes the baseline.
+        """
+        started = False
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+            started = True
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        key = "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+        current, peak = tracemalloc.get_traced_memory()
+        allocators = [_stat_row(s) for s in snap.statistics(key)[:top]]
+        growth = [_stat_row(s) for s in snap.compare_to(self._mem_prev, key)[:top]] if self._mem_prev else []
+        with self._lock:
+            self._mem_prev = snap
+            txt = self._path("mem", "txt")
+            raw = self._path("mem", "tracemalloc")
+        snap.dump(raw)
+        with open(txt, "w", encoding="utf-8") as f:
+            f.write(f"# {utc_now_iso()} traced={current} peak={peak}\n# top allocators\n")
+            f.writelines(f"{r['size_kb']:>12.1f} KiB {r['count']:>9} blocks  {r['where']}\n" for r in allocators)
+            if growth:
+                f.write("# growth since previous snapshot\n")
+                f.writelines(f"{r['size_diff_kb']:>+12.1f} KiB {r['count_diff']:>+9} blocks  {r['where']}\n" for r in growth)
+        return {
+            "tracing_started": started,
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": allocators[:10],
+            "growth": growth[:10],
+            "files": [txt, raw],
+        }
+
+    def stop_tracemalloc(self) -> None:
+        tracemalloc.stop()
+        with self._lock:
+            self._mem_prev = None
+
+    # ---- tool timing ----
+
+    def arm(self, tool: str, calls: int = 1) -> Dict[str, Any]:
+        """cProfile the next `calls` calls of a wrapped tool (one .prof file each)."""
+        if tool not in self.tools:
+            raise LunaError("PROFILE_TOOL_NOT_WRAPPED", f"{tool} is not in LUNA_PROFILE_TOOLS.", {"tools": list(self.tools)})
+        with self._lock:
+            self._armed[tool] = max(1, min(calls, 100))
+            return {"tool": tool, "armed_calls": self._armed[tool]}
+
+    def wrap(self, name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Time every call of `fn`; run it under cProfile while `name` is armed."""
+        stats = self._stats.setdefault(name, _ToolStats())
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            prof = self._take_capture(name)
+            ok = False
+            t0 = time.perf_counter()
+            try:
+                if prof is not None:
+                    prof.enable()
+                out = fn(*args, **kwargs)
+                ok = True
+                return out
+            finally:
+                if prof is not None:
+                    prof.disable()
+                ms = (time.perf_counter() - t0) * 1000
+                with self._lock:
+                    stats.add(ms, ok)
+                if prof is not None:
+                    try:
+                        prof.dump_stats(self._path("tool", "prof", name))
+                    finally:
+                        self._capture.release()
+
+        timed.__name__ = getattr(fn, "__name__", name)
+        timed.__doc__ = getattr(fn, "__doc__", None)
+        return timed
+
+    def _take_capture(self, name: str) -> Optional[cProfile.Profile]:
+        if not self._armed.get(name):
+            return None
+        if not self._capture.acquire(blocking=False):
+            return None  # another capture in flight; time this call only
+        with self._lock:
+            left = self._armed.get(name, 0)
+            if left <= 0:
+                self._capture.release()
+                return None
+            if left == 1:
+                self._armed.pop(name, None)
+            else:
+                self._armed[name] = left - 1
+        return cProfile.Profile()
+
+    # ---- status ----
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "out_dir": self.out_dir,
+                "sample": dict(self._last_sample) if self._last_sample else None,
+                "tracemalloc": tracemalloc.is_tracing(),
+                "tools": {name: s.snapshot() for name, s in self._stats.items()},
+                "armed": dict(self._armed),
+                "recent_files": list(self._files),
+            }
+
+
+def _stat_row(s: Any) -> Dict[str, Any]:
+    frames = [f"{_short(fr.filename)}:{fr.lineno}" for fr in s.traceback]
+    row = {"where": " <- ".join(reversed(frames)) if len(frames) > 1 else frames[0], "size_kb": round(s.size / 1024, 1), "count": s.count}
+    if hasattr(s, "size_diff"):
+        row["size_diff_kb"] = round(s.size_diff / 1024, 1)
+        row["count_diff"] = s.count_diff
+    return row
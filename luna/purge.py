@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from .util import SimpleTTLCache, utc_now_iso
+
+# Children first; content_blobs last (archetype / plan rows reference its hashes).
+PURGE_TABLES = ("event_log", "feedback", "date_plans", "archetypes", "content_blobs")
+
+
+class PurgeWorker:
+    """
+    Background deletion of a user's stored rows after they opt out.
+
+    One job per user, run on a single background thread: each table is emptied in
+    batches of `batch_size` with a `pause_seconds` sleep between statements, so a
+    heavy user never turns into one long, lock-holding DELETE. Progress lives on the
+    users row (purge_requested_at / purge_completed_at); unfinished jobs are picked
+    up again on start, and deleting "the next batch" is naturally resumable.
+    While `healthy()` is false (breaker not closed) the worker backs off instead of
+    adding load to a struggling database. `on_done(user_id)` runs after each finished
+    purge (in-memory state derived from the deleted rows).
+    """
+    def __init__(
+        self,
+        db: Any,
+        *,
+        batch_size: int = 200,
+        pause_seconds: float = 0.2,
+        backoff_seconds: float = 5.0,
+        healthy: Optional[Callable[[], bool]] = None,
+        on_done: Optional[Callable[[str], Any]] = None,
+    ):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.pause = max(0.0, pause_seconds)
+        self.backoff = max(0.1, backoff_seconds)
+        self._healthy = healthy
+        self._on_done = on_done
+        self._lock = threading.Lock()
+        self._queue: Deque[str] = deque()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._done = SimpleTTLCache(ttl_seconds=3600, max_items=10_000)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- foreground API ----
+
+    def enqueue(self, user_id: str, requested_at: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            job = self._jobs.get(user_id)
+            if job is None or job["status"] == "cancelling":
+                job = {
+                    "status": "queued",
+                    "requested_at": requested_at or utc_now_iso(),
+                    "persisted": bool(requested_at),
+                    "deleted": {t: 0 for t in PURGE_TABLES},
+                    "completed_at": None,
+                    "last_error": None,
+                }
+                self._jobs[user_id] = job
+                self._queue.append(user_id)
+        self._wake.set()
+        return dict(job)
+
+    def cancel(self, user_id: str) -> None:
+        """Opted back in: stop deleting and clear the persisted request."""
+        with self._lock:
+            job = self._jobs.get(user_id)
+            self._jobs[user_id] = {"status": "cancelling", "deleted": job["deleted"] if job else {}}
+            self._queue.append(user_id)
+        self._done.pop(user_id)
+        self._wake.set()
+
+    def status(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(user_id)
+            if job is not None:
+                return _public(job)
+        done = self._done.get(user_id)
+        if done is not None:
+            return done
+        try:
+            state = self.db.get_purge_state(user_id)
+        except Exception:
+            return None
+        if state.get("purge_completed_at"):
+            return {"status": "done", "requested_at": state.get("purge_requested_at"), "completed_at": state["purge_completed_at"]}
+        if state.get("purge_requested_at"):
+            return {"status": "queued", "requested_at": state["purge_requested_at"]}
+        return None
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    # ---- worker ----
+
+    def run_job(self, user_id: str) -> bool:
+        """Advance one job to completion (or cancellation). False = retry later."""
+        with self._lock:
+            job = self._jobs.get(user_id)
+        if job is None:
+            return True
+        try:
+            if job["status"] == "cancelling":
+                self.db.mark_purge(user_id, requested_at=None, completed_at=None)
+                with self._lock:
+                    if self._jobs.get(user_id) is job:
+                        del self._jobs[user_id]
+                return True
+            if not job["persisted"]:
+                self.db.mark_purge(user_id, requested_at=job["requested_at"], completed_at=None)
+                job["persisted"] = True
+            job["status"] = "running"
+            for table in PURGE_TABLES:
+                while True:
+                    if self._stop.is_set() or self._jobs.get(user_id) is not job:
+                        return True  # shutting down or cancelled; resumed / cleared later
+                    if self._healthy is not None and not self._healthy():
+                        self._stop.wait(self.backoff)
+                        continue
+                    n = self.db.delete_user_rows(table, user_id=user_id, limit=self.batch_size)
+                    job["deleted"][table] += n
+                    if n < self.batch_size:
+                        break
+                    self._stop.wait(self.pause)
+            job["completed_at"] = utc_now_iso()
+            self.db.mark_purge(user_id, requested_at=job["requested_at"], completed_at=job["completed_at"])
+        except Exception as e:
+            job["status"] = "retrying"
+            job["last_error"] = str(e)[:200]
+            return False
+        job["status"] = "done"
+        with self._lock:
+            if self._jobs.get(user_id) is job:
+                del self._jobs[user_id]
+        self._done.set(user_id, _public(job))
+        if self._on_done is not None:
+            try:
+                self._on_done(user_id)
+            except Exception:
+                pass
+        return True
+
+    def resume(self) -> int:
+        """Re-enqueue purges a previous process requested but did not finish."""
+        try:
+            rows = self.db.list_pending_purges()
+        except Exception:
+            return 0
+        for r in rows:
+            self.enqueue(r["id"], requested_at=r.get("purge_requested_at"))
+        return len(rows)
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="luna-purge", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self) -> None:
+        self.resume()
+        while not self._stop.is_set():
+            with self._lock:
+                user_id = self._queue.popleft() if self._queue else None
+            if user_id is None:
+                self._wake.wait(60)
+                self._wake.clear()
+                continue
+            if not self.run_job(user_id):
+                with self._lock:
+                    self._queue.append(user_id)
+                self._stop.wait(self.backoff)
+
+
+def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": job.get("status"),
+        "requested_at": job.get("requested_at"),
+        "completed_at": job.get("completed_at"),
+        "deleted": dict(job.get("deleted") or {}),
+        **({"last_error": job["last_error"]} if job.get("last_error") else {}),
+    }
@@ -1,11 +1,10 @@
 \
 from __future__ import annotations
 
+import threading
 import time
 from dataclasses import dataclass
-from typing import Dict, Optional
-
-from .util import clamp_int
+from typing import Any, Dict, Iterable, List
 
 
 @dataclass
@@ -23,19 +22,44 @@ class RateLimiter:
         self.rate = max(1, rate_per_minute) / 60.0
         self.burst = max(1, burst)
         self._buckets: Dict[str, Bucket] = {}
+        # Service calls run on a thread pool; refill + take must be atomic per bucket.
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, cost: float = 1) -> bool:
+        # Fractional costs are fine; anything above the burst is charged as the burst
+        # (otherwise it could never pass).
+        cost = min(max(float(cost), 0.1), float(self.burst))
+        now = time.time()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = Bucket(tokens=float(self.burst), last=now)
+                self._buckets[key] = b
+            # refill
+            elapsed = max(0.0, now - b.last)
+            b.tokens = min(float(self.burst), b.tokens + elapsed * self.rate)
+            b.last = now
+            if b.tokens >= cost:
+                b.tokens -= cost
+                return True
+            return False
 
-    def allow(self, key: str, cost: int = 1) -> bool:
-        cost = clamp_int(cost, 1, 50)
+    def dump(self) -> List[List[Any]]:
+        """[key, tokens, last] for buckets that are not already full again (warm-state snapshots)."""
         now = time.time()
-        b = self._buckets.get(key)
-        if b is None:
-            b = Bucket(tokens=float(self.burst), last=now)
-            self._buckets[key] = b
-        # refill
-        elapsed = max(0.0, now - b.last)
-        b.tokens = min(float(self.burst), b.tokens + elapsed * self.rate)
-        b.last = now
-        if b.tokens >= cost:
-            b.tokens -= cost
-            return True
-        return False
+        with self._lock:
+            return [
+                [k, round(b.tokens, 3), b.last]
+                for k, b in self._buckets.items()
+                if b.tokens + (now - b.last) * self.rate < self.burst
+            ]
+
+    def load(self, entries: Iterable[List[Any]]) -> int:
+        """Restore dump() output. Buckets already used in this process are kept as they are."""
+        n = 0
+        with self._lock:
+            for key, tokens, last in entries:
+                if key not in self._buckets:
+                    self._buckets[key] = Bucket(tokens=min(float(tokens), float(self.burst)), last=float(last))
+                    n += 1
+        return n
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+
+from .health import HealthProber
+from .util import SimpleTTLCache
+
+# Served by a replica unless the user is pinned (or no replica is healthy).
+READ_METHODS = frozenset({
+    "get_latest", "get_latest_archetype", "get_latest_date_plan",
+    "iter_user_rows", "iter_archetypes", "get_criteria_insights",
+})
+# Writes that pin their user to the primary; the user id is the `user_id` kwarg, the
+# first positional argument, or (store RPCs, upsert_user) taken from the result.
+_PIN_ARG0 = frozenset({"set_opt_out", "set_consent", "mark_purge"})
+_PIN_KWARG = frozenset({
+    "insert_archetype", "insert_date_plan", "replace_date_plan", "insert_event",
+    "insert_feedback", "delete_user_rows",
+})
+_PIN_RESULT = frozenset({"upsert_user", "store_archetype_tx", "store_date_plan_tx"})
+
+
+class ReplicaRouter:
+    """
+    Routes reads to healthy read replicas, everything else to the primary.
+
+    Read-your-writes: a write pins its user to the primary for `pin_seconds`, so a
+    snapshot read right after store_* never sees a lagging replica. Each replica has
+    its own background HealthProber; only replicas whose last probe succeeded take
+    reads (round-robin). A replica read that fails is retried on the primary and
+    counts as a failed probe, so a dead replica drops out without waiting for the
+    next probe. Opt-out and consent gates are always read on the primary.
+
+    Pins are per process: keep `pin_seconds` above the replicas' usual lag, and run one
+    worker per instance with users routed to a fixed instance, or a read served by
+    another worker can miss the write.
+    """
+    def __init__(
+        self,
+        primary: Any,
+        replicas: List[Any],
+        *,
+        pin_seconds: float = 5.0,
+        probe_seconds: float = 10.0,
+        failure_threshold: int = 1,
+    ):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.pin_seconds = max(0.0, pin_seconds)
+        self._pins = SimpleTTLCache(ttl_seconds=max(1, int(round(self.pin_seconds))), max_items=100_000)
+        self.probers = [
+            HealthProber(r.ping, interval_seconds=probe_seconds, failure_threshold=failure_threshold)
+            for r in self.replicas
+        ]
+        self._rr = itertools.count()
+        self._lock = threading.Lock()
+        self._counts = {"replica": 0, "primary_pinned": 0, "primary_fallback": 0, "replica_errors": 0}
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.primary, name)
+        if name in READ_METHODS and self.replicas:
+            return self._read(name)
+        if name in _PIN_ARG0 or name in _PIN_KWARG or name in _PIN_RESULT:
+            return self._write(name, attr)
+        return attr
+
+    # ---- routing ----
+
+    def pin(self, user_id: Optional[str]) -> None:
+        if user_id and self.pin_seconds > 0:
+            self._pins.set(user_id, True)
+
+    def pinned(self, user_id: Optional[str]) -> bool:
+        return bool(user_id) and bool(self._pins.get(user_id))  # type: ignore[arg-type]
+
+    def _pick(self) -> Optional[int]:
+        healthy = [i for i, p in enumerate(self.probers) if p.db_ok and p.breaker == "closed"]
+        if not healthy:
+            return None
+        return healthy[next(self._rr) % len(healthy)]
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counts[key] += 1
+
+    def _read(self, name: str) -> Any:
+        def read(*args: Any, **kwargs: Any) -> Any:
+            if self.pinned(kwargs.get("user_id")):
+                self._count("primary_pinned")
+                return getattr(self.primary, name)(*args, **kwargs)
+            i = self._pick()
+            if i is None:
+                self._count("primary_fallback")
+                return getattr(self.primary, name)(*args, **kwargs)
+            if name.startswith("iter_"):
+                # Generators fail mid-stream, not here: no per-call failover.
+                self._count("replica")
+                return getattr(self.replicas[i], name)(*args, **kwargs)
+            try:
+                out = getattr(self.replicas[i], name)(*args, **kwargs)
+            except Exception:
+                self._count("replica_errors")
+                self.probers[i].record(False, None)
+                return getattr(self.primary, name)(*args, **kwargs)
+            self._count("replica")
+            return out
+        return read
+
+    def _write(self, name: str, fn: Any) -> Any:
+        def write(*args: Any, **kwargs: Any) -> Any:
+            user_id = args[0] if name in _PIN_ARG0 and args else kwargs.get("user_id")
+            self.pin(user_id)  # covers reads that race the write
+            out = fn(*args, **kwargs)
+            if name in _PIN_RESULT:
+                user_id = out.get("user_id") if isinstance(out, dict) else out
+            self.pin(user_id)  # the window starts at commit
+            return out
+        return write
+
+    # ---- lifecycle / status ----
+
+    def start(self) -> None:
+        for p in self.probers:
+            p.probe()
+            p.start()
+
+    def stop(self) -> None:
+        for p in self.probers:
+            p.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "pin_seconds": self.pin_seconds,
+            "replicas": [
+                {"url": getattr(r, "url", None), **{k: p.snapshot()[k] for k in ("db_ok", "db_latency_ms", "breaker", "last_probe_at")}}
+                for r, p in zip(self.replicas, self.probers)
+            ],
+            "reads": counts,
+        }
@@ -0,0 +1,1538 @@
+"""
+Shared service core.
+
+server.py (MCP tools) and openapi_wrapper.py (REST routes) are thin adapters over
+LunaService: gating, rate limiting, storage and spool replay live here once, so
+both front-ends can run in one process against one DB client, limiter and spool.
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import base64
+import itertools
+import hmac
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from .admission import HIGH, LOW, NORMAL, AdmissionController
+from .cities import CityIndex
+from .cohort import AXES, CohortStats
+from .costs import CostModel, parse_costs
+from .db import SupabaseDB
+from .errors import LunaError
+from .faults import FaultInjector, FaultyDB
+from .health import HealthProber
+from .memorydb import MemoryDB
+from .models import ArchetypeProfile, DateOpsPlan, LunaEvent, model_dump
+from .profiling import Profiler
+from .purge import PurgeWorker
+from .similarity import PlanFingerprints, plan_fingerprint
+from .snapshot import WarmState
+from .ratelimit import RateLimiter
+from .replicas import ReplicaRouter
+from .spool import Spooler
+from .users import UserDirectory
+from .util import SimpleTTLCache, env_bool, looks_like_specific_venue, stable_hash_json, stable_json_dumps, utc_now_iso
+
+
+@dataclass
+class ServiceConfig:
+    supabase_url: str = ""
+    supabase_key: str = ""
+    spool_dir: str = "/tmp/luna_spool"
+    rate_per_minute: int = 60
+    rate_burst: int = 30
+    # Adaptive limiter costs (see luna/costs.py): base cost per call site (overridable per
+    # op, e.g. "store_archetype=3,log_event=0.5"), +1 token per rate_cost_bytes_per_token
+    # of payload beyond rate_cost_free_bytes, all times a stress factor (>= 1) from DB
+    # latency, breaker state and spool depth. rate_costs_adaptive=False = fixed costs.
+    rate_costs_adaptive: bool = True
+    rate_costs: str = ""
+    rate_cost_free_bytes: int = 1024
+    rate_cost_bytes_per_token: int = 1024
+    rate_stress_latency_ms: float = 500.0
+    rate_stress_spool_records: int = 200
+    rate_stress_max: float = 4.0
+    require_consent: bool = False
+    # Opt-out / consent are read fresh for every write by default (0). A TTL > 0 caches
+    # them per process: fewer reads, but an opt-out or consent change made through
+    # another worker is only seen here once the entry expires.
+    gate_ttl_seconds: int = 0
+    max_batch_events: int = 50
+    # Rate-limit tokens charged per event in a batch (a lone log_event costs 1)
+    event_batch_weight: float = 0.25
+    # Default for store_* responses: ack + IDs + source hash only (callers can override)
+    compact_responses: bool = False
+    # Readiness flips true once warm-up finishes, or after this many seconds regardless
+    # (a slow Supabase must not keep the instance out of rotation; writes spool).
+    warmup_timeout_seconds: float = 3.0
+    health_probe_seconds: float = 10.0
+    breaker_failure_threshold: int = 3
+    # users.last_seen_at is tracked in memory and flushed in one batch this often
+    last_seen_flush_seconds: float = 60.0
+    # Archetype cohort benchmarks (needs numpy); aggregates over fewer rows are withheld
+    cohort_stats: bool = True
+    cohort_min_size: int = 20
+    # Store top-level JSON fields at least this large once in content_blobs (0 = off)
+    blob_min_bytes: int = 0
+    # "supabase" (default) or "memory": in-process MemoryDB for load tests / local runs
+    db_backend: str = "supabase"
+    memory_db_latency_ms: float = 0.0
+    # Fault-injection scenario (inline JSON or a file path); empty = off. Never in production.
+    faults: str = ""
+    faults_file: str = ""
+    # Rows fetched per keyset page by data export (memory per export is one page)
+    export_page_size: int = 500
+    # Delete a user's stored rows in the background after they opt out (needs the
+    # users.purge_* columns from schema.sql). Batches are small and throttled.
+    purge_on_opt_out: bool = False
+    purge_batch_size: int = 200
+    purge_pause_seconds: float = 0.2
+    # Admin-only profiling surface (REST /api/admin/*); empty token = endpoints off.
+    admin_token: str = ""
+    profile_dir: str = "/tmp/luna_profiles"
+    # Service methods (= tool names) timed per call and cProfile-able on demand
+    profile_tools: Tuple[str, ...] = ()
+    # > 0 starts tracemalloc at boot with this many frames per allocation (has overhead)
+    tracemalloc_frames: int = 0
+    # Storage calls run on a bounded pool (0 = inline on the caller, no admission control).
+    # Past db_shed_pending queued+running calls (or db_shed_wait_ms average queue wait)
+    # events / feedback go to the spool and reads get OVERLOADED; store_* writes keep
+    # the headroom up to db_max_pending.
+    db_workers: int = 16
+    db_max_pending: int = 128
+    db_shed_pending: int = 64
+    db_shed_wait_ms: float = 250.0
+    # store_* in one transactional round-trip via the rpc.sql functions (apply it first)
+    store_rpc: bool = False
+    # A new DateOps plan within this many SimHash bits (of 64) of one of the user's 20
+    # newest same-city plans overwrites it instead of adding a row (-1 = off; needs
+    # date_plans.simhash from schema.sql). 6 catches rewordings, not category changes.
+    plan_dedup_distance: int = -1
+    # Store a canonical city key with each plan (date_plans.city_key from schema.sql), so
+    # "NYC" / "New York" / "new york, ny" aggregate together. Extra aliases: a JSON file
+    # of {"canonical-key": ["alias", ...]} merged over the built-in table.
+    city_keys: bool = False
+    city_aliases_file: str = ""
+    # Snapshot warm caches (user ids, gates, limiter buckets, plan
+    # fingerprints) to this local file every interval and on shutdown; restored on
+    # warm-up if younger than warm_state_max_age_seconds. Empty = off.
+    warm_state_path: str = ""
+    warm_state_interval_seconds: float = 60.0
+    warm_state_max_age_seconds: float = 900.0
+    # Read replicas (Supabase replica API URLs; same key unless read_replica_key is set).
+    # Reads go to a healthy replica unless the user wrote within read_pin_seconds.
+    read_replica_urls: Tuple[str, ...] = ()
+    read_replica_key: str = ""
+    read_pin_seconds: float = 5.0
+    # get_criteria_insights: ratings / tags per (city, category, noise, price), kept by the
+    # criteria_insights trigger from schema.sql. Groups with fewer ratings are withheld.
+    criteria_insights: bool = False
+    insights_min_count: int = 5
+
+    @classmethod
+    def from_env(cls) -> "ServiceConfig":
+        return cls(
+            supabase_url=os.getenv("SUPABASE_URL", ""),
+            supabase_key=os.getenv("SUPABASE_SERVICE_ROLE_KEY", "") or os.getenv("SUPABASE_KEY", ""),
+            spool_dir=os.getenv("LUNA_SPOOL_DIR", "/tmp/luna_spool"),
+            rate_per_minute=int(os.getenv("LUNA_RATE_LIMIT_PER_MIN", "60")),
+            rate_burst=int(os.getenv("LUNA_RATE_LIMIT_BURST", "30")),
+            rate_costs_adaptive=env_bool("LUNA_RATE_COSTS_ADAPTIVE", True),
+            rate_costs=os.getenv("LUNA_RATE_COSTS", ""),
+            rate_cost_free_bytes=int(os.getenv("LUNA_RATE_COST_FREE_BYTES", "1024")),
+            rate_cost_bytes_per_token=int(os.getenv("LUNA_RATE_COST_BYTES_PER_TOKEN", "1024")),
+            rate_stress_latency_ms=float(os.getenv("LUNA_RATE_STRESS_LATENCY_MS", "500")),
+            rate_stress_spool_records=int(os.getenv("LUNA_RATE_STRESS_SPOOL_RECORDS", "200")),
+            rate_stress_max=float(os.getenv("LUNA_RATE_STRESS_MAX", "4")),
+            require_consent=env_bool("LUNA_REQUIRE_CONSENT", False),
+            gate_ttl_seconds=int(os.getenv("LUNA_GATE_TTL_SECONDS", "0")),
+            max_batch_events=int(os.getenv("LUNA_MAX_BATCH_EVENTS", "50")),
+            event_batch_weight=float(os.getenv("LUNA_EVENT_BATCH_WEIGHT", "0.25")),
+            compact_responses=env_bool("LUNA_COMPACT_RESPONSES", False),
+            warmup_timeout_seconds=float(os.getenv("LUNA_WARMUP_TIMEOUT_SECONDS", "3")),
+            health_probe_seconds=float(os.getenv("LUNA_HEALTH_PROBE_SECONDS", "10")),
+            breaker_failure_threshold=int(os.getenv("LUNA_BREAKER_FAILURES", "3")),
+            last_seen_flush_seconds=float(os.getenv("LUNA_LAST_SEEN_FLUSH_SECONDS", "60")),
+            cohort_stats=env_bool("LUNA_COHORT_STATS", True),
+            cohort_min_size=int(os.getenv("LUNA_COHORT_MIN_SIZE", "20")),
+            blob_min_bytes=int(os.getenv("LUNA_BLOB_MIN_BYTES", "0")),
+            db_backend=os.getenv("LUNA_DB_BACKEND", "supabase").strip().lower(),
+            memory_db_latency_ms=float(os.getenv("LUNA_MEMORY_DB_LATENCY_MS", "0")),
+            faults=os.getenv("LUNA_FAULTS", ""),
+            faults_file=os.getenv("LUNA_FAULTS_FILE", ""),
+            export_page_size=int(os.getenv("LUNA_EXPORT_PAGE_SIZE", "500")),
+            purge_on_opt_out=env_bool("LUNA_PURGE_ON_OPT_OUT", False),
+            purge_batch_size=int(os.getenv("LUNA_PURGE_BATCH_SIZE", "200")),
+            purge_pause_seconds=float(os.getenv("LUNA_PURGE_PAUSE_SECONDS", "0.2")),
+            admin_token=os.getenv("LUNA_ADMIN_TOKEN", ""),
+            profile_dir=os.getenv("LUNA_PROFILE_DIR", "/tmp/luna_profiles"),
+            profile_tools=tuple(t.strip() for t in os.getenv("LUNA_PROFILE_TOOLS", "").split(",") if t.strip()),
+            tracemalloc_frames=int(os.getenv("LUNA_TRACEMALLOC_FRAMES", "0")),
+            db_workers=int(os.getenv("LUNA_DB_WORKERS", "16")),
+            db_max_pending=int(os.getenv("LUNA_DB_MAX_PENDING", "128")),
+            db_shed_pending=int(os.getenv("LUNA_DB_SHED_PENDING", "64")),
+            db_shed_wait_ms=float(os.getenv("LUNA_DB_SHED_WAIT_MS", "250")),
+            store_rpc=env_bool("LUNA_STORE_RPC", False),
+            plan_dedup_distance=int(os.getenv("LUNA_PLAN_DEDUP_DISTANCE", "-1")),
+            city_keys=env_bool("LUNA_CITY_KEYS", False),
+            city_aliases_file=os.getenv("LUNA_CITY_ALIASES_FILE", ""),
+            warm_state_path=os.getenv("LUNA_WARM_STATE_PATH", ""),
+            warm_state_interval_seconds=float(os.getenv("LUNA_WARM_STATE_INTERVAL_SECONDS", "60")),
+            warm_state_max_age_seconds=float(os.getenv("LUNA_WARM_STATE_MAX_AGE_SECONDS", "900")),
+            read_replica_urls=tuple(u.strip() for u in os.getenv("LUNA_READ_REPLICA_URLS", "").split(",") if u.strip()),
+            read_replica_key=os.getenv("LUNA_READ_REPLICA_KEY", ""),
+            read_pin_seconds=float(os.getenv("LUNA_READ_PIN_SECONDS", "5")),
+            criteria_insights=env_bool("LUNA_CRITERIA_INSIGHTS", False),
+            insights_min_count=max(1, int(os.getenv("LUNA_INSIGHTS_MIN_COUNT", "5"))),
+        )
+
+
+@dataclass
+class ServiceResult:
+    """Front-end neutral result: `body` is the structured payload, the rest is metadata."""
+    body: Dict[str, Any]
+    widget_view: str
+    warnings: List[str] = field(default_factory=list)
+    drained: int = 0
+
+
+class LunaService:
+    def __init__(self, config: ServiceConfig, *, db: Optional[SupabaseDB] = None):
+        self.config = config
+        self.db = db
+        if self.db is None and config.db_backend == "memory":
+            self.db = MemoryDB(latency_ms=config.memory_db_latency_ms)  # type: ignore[assignment]
+        elif self.db is None and config.supabase_url and config.supabase_key:
+            # Cheap: the Supabase client itself is built lazily (see SupabaseDB.sb).
+            self.db = SupabaseDB(config.supabase_url, config.supabase_key, blob_min_bytes=config.blob_min_bytes)
+        # Local degraded-mode testing only (see luna/faults.py).
+        self.faults = FaultInjector.load(config.faults, config.faults_file)
+        if self.faults is not None and self.db is not None:
+            self.db = FaultyDB(self.db, self.faults)  # type: ignore[assignment]
+        self.replicas: Optional[ReplicaRouter] = None
+        if config.read_replica_urls and isinstance(self.db, (SupabaseDB, FaultyDB)):
+            key = config.read_replica_key or config.supabase_key
+            self.replicas = ReplicaRouter(
+                self.db,
+                [SupabaseDB(url, key, blob_min_bytes=config.blob_min_bytes) for url in config.read_replica_urls],
+                pin_seconds=config.read_pin_seconds,
+                probe_seconds=config.health_probe_seconds,
+            )
+            self.db = self.replicas  # type: ignore[assignment]
+        self.spool = Spooler(spool_dir=config.spool_dir)
+        self.limiter = RateLimiter(rate_per_minute=config.rate_per_minute, burst=config.rate_burst)
+        self.costs: Optional[CostModel] = None
+        if config.rate_costs_adaptive:
+            self.costs = CostModel(
+                lambda: self.prober.snapshot(),
+                op_costs=parse_costs(config.rate_costs),
+                free_bytes=config.rate_cost_free_bytes,
+                bytes_per_token=config.rate_cost_bytes_per_token,
+                latency_ms=config.rate_stress_latency_ms,
+                spool_records=config.rate_stress_spool_records,
+                max_stress=config.rate_stress_max,
+            )
+        self._gates = SimpleTTLCache(ttl_seconds=max(0, config.gate_ttl_seconds))
+        # city_key -> criteria_insights rows; aggregates move slowly, one read per city per minute
+        self._insights = SimpleTTLCache(ttl_seconds=60, max_items=2_000)
+        self.users: Optional[UserDirectory] = None
+        if self.db is not None:
+            self.users = UserDirectory(self.db, flush_seconds=config.last_seen_flush_seconds)
+        self.cohort: Optional[CohortStats] = None
+        self._cohort_loaded = False
+        if config.cohort_stats:
+            try:
+                self.cohort = CohortStats()
+            except RuntimeError:
+                self.cohort = None
+        # Probes the DB in the background; a successful probe also replays the spool.
+        self.prober = HealthProber(
+            self.db.ping if self.db else None,
+            interval_seconds=config.health_probe_seconds,
+            failure_threshold=config.breaker_failure_threshold,
+            on_success=lambda: self.drain_spool(force=True),
+            spool_stats=self.spool.stats,
+        )
+        self.cities: Optional[CityIndex] = None
+        if config.city_keys:
+            self.cities = CityIndex.from_file(config.city_aliases_file) if config.city_aliases_file else CityIndex()
+        # Per-user fingerprints of recent plans (legacy path; rpc.sql searches in-database).
+        self.plan_index: Optional[PlanFingerprints] = None
+        if config.plan_dedup_distance >= 0 and self.db is not None and not config.store_rpc:
+            self.plan_index = PlanFingerprints(self._plan_fingerprints)
+        self.purger: Optional[PurgeWorker] = None
+        if config.purge_on_opt_out and self.db is not None:
+            self.purger = PurgeWorker(
+                self.db,
+                batch_size=config.purge_batch_size,
+                pause_seconds=config.purge_pause_seconds,
+                healthy=lambda: self.prober.breaker == "closed",
+                on_done=self.cohort.remove if self.cohort is not None else None,
+            )
+        self.admission: Optional[AdmissionController] = None
+        if config.db_workers > 0:
+            self.admission = AdmissionController(
+                workers=config.db_workers,
+                max_pending=config.db_max_pending,
+                shed_pending=config.db_shed_pending,
+                shed_wait_ms=config.db_shed_wait_ms,
+            )
+        # Off (None) unless an admin token, timed tools or boot-time tracemalloc is configured.
+        self.profiler: Optional[Profiler] = None
+        if config.admin_token or config.profile_tools or config.tracemalloc_frames > 0:
+            self.profiler = Profiler(config.profile_dir, tools=config.profile_tools, tracemalloc_frames=config.tracemalloc_frames)
+            for name in config.profile_tools:
+                method = getattr(self, name, None)
+                if name.startswith("_") or not callable(method):
+                    raise ValueError(f"Unknown tool in LUNA_PROFILE_TOOLS: {name}")
+                # Instance attribute shadows the method: MCP and REST both go through it.
+                setattr(self, name, self.profiler.wrap(name, method))
+        self.warm_state: Optional[WarmState] = None
+        if config.warm_state_path:
+            self.warm_state = self._build_warm_state()
+        self._created = time.monotonic()
+        self._warm_thread: Optional[threading.Thread] = None
+        self._warm_done = threading.Event()
+        self._warm_db_ok: Optional[bool] = None
+        self._warm_ms: Optional[float] = None
+
+    # ----------------------------
+    # Warm-up / readiness
+    # ----------------------------
+
+    def start_warmup(self) -> None:
+        """
+        Kick off background warm-up (idempotent): build the DB client, open its
+        connection pool with a first probe, create the spool dir, then leave the
+        health prober running. Never blocks the caller.
+        """
+        if self._warm_thread is not None:
+            return
+        self._warm_thread = threading.Thread(target=self._warmup, name="luna-warmup", daemon=True)
+        self._warm_thread.start()
+
+    def _build_warm_state(self) -> WarmState:
+        ws = WarmState(
+            self.config.warm_state_path,
+            interval_seconds=self.config.warm_state_interval_seconds,
+            max_age_seconds=self.config.warm_state_max_age_seconds,
+        )
+        ws.register("limiter", self.limiter.dump, lambda state, age: self.limiter.load(state))
+        if self.config.gate_ttl_seconds > 0:
+            ws.register("gates", self._gates.dump, self._gates.load)
+        if self.users is not None:
+            ws.register("users", self.users.dump, self.users.load)
+        if self.plan_index is not None:
+            index = self.plan_index
+            ws.register("plan_fingerprints", index.dump, lambda state, age: index.load(state))
+        return ws
+
+    def _warmup(self) -> None:
+        t0 = time.monotonic()
+        try:
+            self.spool.ensure_dir()
+        except Exception:
+            pass
+        if self.warm_state:
+            # Before the first probe: a redeploy starts with the old process's caches.
+            self.warm_state.restore()
+            self.warm_state.start()
+        self._warm_db_ok = self.prober.probe() if self.db else False
+        self._warm_ms = round((time.monotonic() - t0) * 1000, 1)
+        self._warm_done.set()
+        if self.db:
+            self.prober.start()
+        if self.users:
+            self.users.start()
+        if self.replicas:
+            self.replicas.start()
+        if self.purger:
+            self.purger.start()
+        self._load_cohort()
+
+    def _load_cohort(self) -> None:
+        """Backfill cohort stats from storage (warm-up thread). New archetypes are appended on store."""
+        if self.cohort is None or self.db is None or self._cohort_loaded:
+            return
+        try:
+            self.cohort.extend(self.db.iter_archetypes())
+            self._cohort_loaded = True
+        except Exception:
+            return
+
+    def shutdown(self) -> None:
+        """Flush in-memory state that would otherwise be lost (last_seen stamps, warm-state snapshot)."""
+        if self.users:
+            self.users.stop()
+        if self.purger:
+            # Unfinished purges are persisted and resumed by the next process.
+            self.purger.stop()
+        if self.admission:
+            self.admission.shutdown()
+        if self.warm_state:
+            self.warm_state.stop()  # final snapshot for the next process
+        if self.replicas:
+            self.replicas.stop()
+
+    def liveness(self) -> Dict[str, Any]:
+        """Process is up. No I/O."""
+        return {"type": "luna_live", "ok": True, "uptime_s": round(time.monotonic() - self._created, 3)}
+
+    def readiness(self) -> Dict[str, Any]:
+        """Ready to take traffic: warm-up finished, or its timeout elapsed. No I/O."""
+        timed_out = (time.monotonic() - self._created) >= self.config.warmup_timeout_seconds
+        return {
+            "type": "luna_ready",
+            "ready": self._warm_done.is_set() or timed_out,
+            "warmed": self._warm_done.is_set(),
+            "db_configured": bool(self.db),
+            "db_ok": self._warm_db_ok,
+            "warmup_ms": self._warm_ms,
+        }
+
+    # ----------------------------
+    # Plumbing
+    # ----------------------------
+
+    def require_db(self) -> SupabaseDB:
+        if self.db is None:
+            raise LunaError("DB_NOT_CONFIGURED", "Supabase not configured. Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY.")
+        return self.db
+
+    async def run(self, op: str, *args: Any, **kwargs: Any) -> ServiceResult:
+        """
+        Front-end entry point for operations that touch storage: runs `op` on the
+        bounded DB pool under admission control (see luna/admission.py). Shed
+        events / feedback are spooled without any storage I/O.
+        """
+        fn = getattr(self, op)
+        if self.admission is None:
+            return fn(*args, **kwargs)
+        shed_name = _SHED_OPS.get(op)
+        shed = (lambda: getattr(self, shed_name)(*args, **kwargs)) if shed_name else None
+        return await self.admission.run(_OP_PRIORITY.get(op, NORMAL), fn, *args, shed=shed, **kwargs)
+
+    def require_profiler(self, token: Optional[str]) -> Profiler:
+        """Admin gate: unknown unless LUNA_ADMIN_TOKEN is set and matches."""
+        if not self.config.admin_token or self.profiler is None:
+            raise LunaError("NOT_FOUND", "Not found.")
+        if not token or not hmac.compare_digest(token.encode("utf-8"), self.config.admin_token.encode("utf-8")):
+            raise LunaError("FORBIDDEN", "Admin token required.")
+        return self.profiler
+
+    def check_rate_limit(self, user_ref: str, cost: float = 1, *, op: str = "", payload: Any = None) -> None:
+        """Charge `cost` (the call site's base cost), scaled by the cost model when enabled."""
+        if self.costs is not None:
+            cost = self.costs.cost(op, cost, payload)
+        if not self.limiter.allow(user_ref, cost=cost):
+            details = {"cost": round(cost, 2)}
+            if self.costs is not None:
+                details["stress"] = self.costs.stress
+            raise LunaError("RATE_LIMITED", "Too many requests. Try again in a minute.", details, retryable=True)
+
+    def ensure_user(self, user_ref: str) -> str:
+        """user_ref -> user_id. Cached per process; last_seen_at writes are coalesced."""
+        self.require_db()
+        assert self.users is not None
+        return self.users.resolve(user_ref)
+
+    def lookup_user(self, user_ref: str) -> Optional[str]:
+        """user_ref -> user_id for an existing user, None otherwise. Read-only."""
+        self.require_db()
+        assert self.users is not None
+        return self.users.lookup(user_ref)
+
+    def user_gate(self, user_id: str) -> Dict[str, Any]:
+        """
+        Gate fields (data_opt_out, consent_version), read from the primary on every call
+        unless gate_ttl_seconds > 0. Best-effort: a failed lookup yields {} and is not cached.
+        """
+        cache = self.config.gate_ttl_seconds > 0
+        if cache:
+            cached = self._gates.get(user_id)
+            if cached is not None:
+                return cached
+        try:
+            gate = self.require_db().get_user_gate(user_id)
+        except Exception:
+            return {}
+        if cache:
+            self._gates.set(user_id, gate)
+        return gate
+
+    def _update_gate(self, user_id: str, **fields: Any) -> None:
+        if self.config.gate_ttl_seconds <= 0:
+            return
+        gate = dict(self._gates.get(user_id) or {})
+        gate.update(fields)
+        self._gates.set(user_id, gate)
+
+    def storage_block_reason(self, gate: Dict[str, Any]) -> Optional[str]:
+        if gate.get("data_opt_out"):
+            return "opted_out"
+        if self.config.require_consent and not gate.get("consent_version"):
+            return "consent_required"
+        return None
+
+    def spool_apply(self, kind: str, payload: Dict[str, Any]) -> None:
+        """
+        Replayer for auto-healing queue. This MUST be deterministic and safe to repeat.
+        """
+        d = self.require_db()
+        if kind == "archetype_tx":
+            d.store_archetype_tx(**payload)  # gates inside the transaction
+            return
+        if kind == "dateplan_tx":
+            d.store_date_plan_tx(**payload)
+            return
+        if kind == "dateplan_replace":
+            if self.purger is not None and self.user_gate(payload["user_id"]).get("data_opt_out"):
+                return
+            if d.replace_date_plan(**{k: payload[k] for k in ("plan_id", "user_id", "source_hash", "city", "plan_json", "simhash")}, city_key=payload.get("city_key")) is None:
+                d.insert_date_plan(**{k: v for k, v in payload.items() if k != "plan_id"})
+            return
+        if kind in ("shed_events", "shed_feedback"):
+            # Shed under load before the user was resolved: resolve and gate now.
+            user_id = self.ensure_user(payload["user_ref"])
+            if self.user_gate(user_id).get("data_opt_out"):
+                return
+            if kind == "shed_events":
+                d.insert_events(rows=[{**r, "user_id": user_id} for r in payload["rows"]])
+            else:
+                d.insert_feedback(user_id=user_id, **{k: payload.get(k) for k in ("date_plan_id", "rating", "tags", "notes")})
+            return
+        if self.purger is not None and kind not in ("optout", "consent"):
+            # Queued before the user opted out: replaying would re-create purged rows.
+            rows = payload.get("rows") or [payload]
+            if self.user_gate(rows[0].get("user_id", "")).get("data_opt_out"):
+                return
+        if kind == "archetype":
+            d.insert_archetype(**payload)
+        elif kind == "dateplan":
+            d.insert_date_plan(**payload)
+        elif kind == "optout":
+            d.set_opt_out(payload["user_id"], payload["opt_out"])
+        elif kind == "consent":
+            d.set_consent(payload["user_id"], payload["consent_version"])
+        elif kind == "event":
+            d.insert_event(**payload)
+        elif kind == "events":
+            d.insert_events(**payload)
+        elif kind == "feedback":
+            d.insert_feedback(**payload)
+        else:
+            # unknown record type: drop
+            return
+
+    def drain_spool(self, max_records: int = 100, *, force: bool = False) -> int:
+        """
+        Best-effort drain; never throw. Cheap after requests that spooled nothing (see
+        Spooler.drain); `force` always scans for segments (background prober).
+        """
+        if self.db is None:
+            return 0
+        try:
+            return self.spool.drain(self.spool_apply, max_records=max_records, force=force)
+        except Exception:
+            return 0
+
+    # ----------------------------
+    # Operations
+    # ----------------------------
+
+    def health(self, *, deep: bool = False) -> ServiceResult:
+        """
+        Answered from the background prober's cached state (no I/O). deep=True runs
+        a live probe first; callers route that through run() so the ping stays off the
+        event loop. Spool replay is left to the background prober.
+        """
+        if deep and self.db:
+            self.prober.probe(replay=False)
+        snap = self.prober.snapshot()
+        return ServiceResult(
+            body={
+                "type": "luna_health",
+                "ok": bool(snap["db_ok"]),
+                "db_configured": bool(self.db),
+                "ready": self.readiness()["ready"],
+                "spool_dir": str(self.spool.dir),
+                **snap,
+                # Loud on purpose: injected faults must never go unnoticed.
+                **({"faults": self.faults.stats()} if self.faults is not None else {}),
+                **({"admission": self.admission.stats()} if self.admission is not None else {}),
+                **({"rate_costs": self.costs.stats()} if self.costs is not None else {}),
+                **({"warm_state": self.warm_state.stats()} if self.warm_state is not None else {}),
+                **({"read_replicas": self.replicas.stats()} if self.replicas is not None else {}),
+            },
+            widget_view="health",
+        )
+
+    def accept_consent(self, user_ref: str, consent_version: str) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="accept_consent")
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+        warnings: List[str] = []
+        try:
+            d.set_consent(user_id, consent_version)
+        except LunaError as e:
+            self.spool.enqueue("consent", {"user_id": user_id, "consent_version": consent_version}, error=e.message)
+            warnings.append("spooled_write")
+        self._update_gate(user_id, consent_version=consent_version)
+        return ServiceResult(
+            body={"type": "luna_consent", "status": "accepted", "consent_version": consent_version},
+            widget_view="consent",
+            warnings=warnings,
+            drained=self.drain_spool(),
+        )
+
+    def set_opt_out(self, user_ref: str, opt_out: bool) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="set_opt_out")
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+        warnings: List[str] = []
+        try:
+            d.set_opt_out(user_id, opt_out)
+        except LunaError as e:
+            self.spool.enqueue("optout", {"user_id": user_id, "opt_out": opt_out}, error=e.message)
+            warnings.append("spooled_write")
+        self._update_gate(user_id, data_opt_out=opt_out)
+        body: Dict[str, Any] = {"type": "luna_opt_out", "opt_out": opt_out}
+        if self.plan_index is not None and opt_out:
+            self.plan_index.forget(user_id)
+        if self.cohort is not None:
+            self._sync_cohort(user_id, opt_out)
+        if self.purger is not None:
+            if opt_out:
+                body["purge"] = self.purger.enqueue(user_id)["status"]
+            else:
+                self.purger.cancel(user_id)
+        return ServiceResult(
+            body=body,
+            widget_view="settings",
+            warnings=warnings,
+            drained=self.drain_spool(),
+        )
+
+    def _sync_cohort(self, user_id: str, opt_out: bool) -> None:
+        """Opted-out users leave the benchmarks at once; opting back in restores their latest rows."""
+        assert self.cohort is not None
+        self.cohort.remove(user_id)
+        if opt_out:
+            return
+        for level in ("lite", "deep"):
+            try:
+                row = self.require_db().get_latest_archetype(user_id=user_id, level=level)
+            except Exception:
+                continue
+            if row:
+                self.cohort.add(user_id, level, row.get("archetype_json") or {})
+
+    def store_archetype(
+        self,
+        user_ref: str,
+        archetype: ArchetypeProfile,
+        *,
+        compact: Optional[bool] = None,
+        projection: Optional[List[str]] = None,
+    ) -> ServiceResult:
+        compact = self.config.compact_responses if compact is None else compact
+        archetype_dict = model_dump(archetype)
+        self.check_rate_limit(user_ref, cost=2, op="store_archetype", payload=archetype_dict)
+        d = self.require_db()
+
+        def _body(**fields: Any) -> Dict[str, Any]:
+            body = {"type": "luna_archetype", **fields}
+            if wants_field("profile", compact, projection):
+                body["profile"] = archetype_dict
+            return shape_body(body, compact=compact, projection=projection)
+
+        def _blocked(reason: str) -> ServiceResult:
+            return ServiceResult(
+                body=_body(stored=False, reason=reason),
+                widget_view="archetype_card",
+                warnings=[reason] if reason == "consent_required" else [],
+            )
+
+        # Deterministic idempotency key: hash of structured payload (not raw transcript)
+        source_hash = stable_hash_json(f"{user_ref}:{archetype.level}", archetype_dict)
+        spooled = ServiceResult(
+            body=_body(stored=False, source_hash=source_hash),
+            widget_view="archetype_card",
+            warnings=["spooled_write"],
+        )
+        event = {
+            "event_name": "archetype_stored",
+            "event_id": f"archetype:{source_hash}",
+            "properties": {"level": archetype.level, "source": archetype.source},
+            "occurred_at": utc_now_iso(),
+        }
+
+        if self.config.store_rpc:
+            tx = self._store_tx("archetype_tx", user_ref, {
+                "level": archetype.level,
+                "source_hash": source_hash,
+                "archetype_json": archetype_dict,
+                "model_version": archetype.model_version,
+                "event": event,
+            })
+            if tx is None:
+                return spooled
+            if tx.get("reason"):
+                return _blocked(tx["reason"])
+            user_id, archetype_id = tx["user_id"], tx.get("id")
+            drained = self.drain_spool()
+        else:
+            user_id = self.ensure_user(user_ref)
+            reason = self.storage_block_reason(self.user_gate(user_id))
+            if reason:
+                return _blocked(reason)
+            payload = {
+                "user_id": user_id,
+                "level": archetype.level,
+                "source_hash": source_hash,
+                "archetype_json": archetype_dict,
+                "model_version": archetype.model_version,
+            }
+            try:
+                archetype_id = d.insert_archetype(**payload)
+            except LunaError as e:
+                # auto-healing fallback
+                self.spool.enqueue("archetype", payload, error=e.message)
+                return spooled
+            drained = self.drain_spool()
+            # best-effort metrics
+            d.insert_event(user_id=user_id, **event)
+
+        if self.cohort is not None:
+            self.cohort.add(user_id, archetype.level, archetype_dict)
+
+        return ServiceResult(
+            body=_body(
+                stored=True,
+                archetype_id=archetype_id,
+                source_hash=source_hash,
+                card_copy=archetype.share_card_copy,
+            ),
+            widget_view="archetype_card",
+            drained=drained,
+        )
+
+    def store_dateops_plan(
+        self,
+        user_ref: str,
+        city: str,
+        plan: DateOpsPlan,
+        *,
+        compact: Optional[bool] = None,
+        projection: Optional[List[str]] = None,
+    ) -> ServiceResult:
+        compact = self.config.compact_responses if compact is None else compact
+        plan_dict = model_dump(plan)
+        self.check_rate_limit(user_ref, cost=2, op="store_dateops_plan", payload=plan_dict)
+        d = self.require_db()
+
+        def _body(with_plan: bool = True, **fields: Any) -> Dict[str, Any]:
+            body = {"type": "luna_dateops", **fields}
+            if with_plan and wants_field("plan", compact, projection):
+                body["plan"] = plan_dict
+            return shape_body(body, compact=compact, projection=projection)
+
+        def _blocked(reason: str) -> ServiceResult:
+            return ServiceResult(
+                body=_body(stored=False, reason=reason),
+                widget_view="dateops_plan",
+                warnings=[reason] if reason == "consent_required" else [],
+            )
+
+        user_id: Optional[str] = None
+        if not self.config.store_rpc:
+            user_id = self.ensure_user(user_ref)
+            reason = self.storage_block_reason(self.user_gate(user_id))
+            if reason:
+                return _blocked(reason)
+
+        suspicious = venue_name_fields(plan)
+        if suspicious:
+            return ServiceResult(
+                body=_body(
+                    with_plan=False,
+                    stored=False,
+                    reason="venue_name_detected",
+                    fields=suspicious,
+                    instructions="Regenerate using ONLY generic criteria. No business names, no URLs, no @handles, no apostrophes.",
+                ),
+                widget_view="dateops_plan",
+                warnings=["venue_name_detected"],
+            )
+
+        source_hash = stable_hash_json(f"{user_ref}:dateops:{city}", plan_dict)
+        city_key = self.cities.key(city) if self.cities is not None else None
+        dedup = self.config.plan_dedup_distance >= 0
+        simhash = plan_fingerprint(plan_dict) if dedup else None
+        spooled = ServiceResult(
+            body=_body(stored=False, source_hash=source_hash),
+            widget_view="dateops_plan",
+            warnings=["spooled_write"],
+        )
+        event = {
+            "event_name": "dateops_stored",
+            "event_id": f"dateops:{source_hash}",
+            "properties": {"city": city, **({"city_key": city_key} if city_key else {})},
+            "occurred_at": utc_now_iso(),
+        }
+
+        if user_id is None:
+            # rpc.sql path: the gate is checked inside the same transaction as the write
+            args = {"source_hash": source_hash, "city": city, "plan_json": plan_dict, "event": event}
+            if city_key:
+                args["city_key"] = city_key
+            if dedup:
+                args.update(simhash=simhash, max_distance=self.config.plan_dedup_distance)
+            tx = self._store_tx("dateplan_tx", user_ref, args)
+            if tx is None:
+                return spooled
+            if tx.get("reason"):
+                return _blocked(tx["reason"])
+            plan_id = tx.get("id")
+            replaced = bool(tx.get("replaced"))
+            drained = self.drain_spool()
+        else:
+            put = self._put_date_plan(user_id, source_hash, city, plan_dict, simhash, city_key)
+            if put is None:
+                return spooled
+            plan_id, replaced = put
+            drained = self.drain_spool()
+            if not replaced:
+                # best-effort metrics (a replaced near-duplicate is not a new plan)
+                d.insert_event(user_id=user_id, **event)
+
+        fields: Dict[str, Any] = {"stored": True, "plan_id": plan_id, "city": city, "source_hash": source_hash}
+        if city_key:
+            fields["city_key"] = city_key
+        if replaced:
+            fields["replaced"] = True
+        # Rendering is the most expensive part of the response; skip it unless asked for.
+        if wants_field("display_text", compact, projection):
+            fields["display_text"] = render_dateops_markdown(plan_dict, city)
+        return ServiceResult(body=_body(**fields), widget_view="dateops_plan", drained=drained)
+
+    def _put_date_plan(
+        self, user_id: str, source_hash: str, city: str, plan_dict: Dict[str, Any], simhash: Optional[int], city_key: Optional[str]
+    ) -> Optional[Tuple[Optional[str], bool]]:
+        """
+        Legacy-path write: overwrite a near-duplicate of a recent plan when dedup is on,
+        otherwise upsert. Returns (plan_id, replaced), or None once the write was spooled.
+        """
+        d = self.require_db()
+        payload = {"user_id": user_id, "source_hash": source_hash, "city": city, "plan_json": plan_dict}
+        if simhash is not None:
+            payload["simhash"] = simhash
+        if city_key is not None:
+            payload["city_key"] = city_key
+        match = None
+        match_city = city_key or city  # "Brooklyn, NY" and "NYC" are the same city once keyed
+        if self.plan_index is not None and simhash is not None:
+            try:
+                match = self.plan_index.nearest(user_id, match_city, simhash, max_distance=self.config.plan_dedup_distance)
+            except Exception:
+                match = None  # fingerprints unavailable: store as a new plan
+        try:
+            plan_id = None
+            if match is not None:
+                plan_id = d.replace_date_plan(
+                    plan_id=match[0], user_id=user_id, source_hash=source_hash, city=city, plan_json=plan_dict, simhash=simhash,
+                    city_key=city_key,
+                )
+            replaced = plan_id is not None
+            if not replaced:
+                plan_id = d.insert_date_plan(**payload)
+        except LunaError as e:
+            if match is not None:
+                self.spool.enqueue("dateplan_replace", {**payload, "plan_id": match[0]}, error=e.message)
+            else:
+                self.spool.enqueue("dateplan", payload, error=e.message)
+            return None
+        if self.plan_index is not None and plan_id:
+            self.plan_index.add(user_id, plan_id, match_city, simhash)  # type: ignore[arg-type]
+        return plan_id, replaced
+
+    def _plan_fingerprints(self, user_id: str) -> List[Dict[str, Any]]:
+        """PlanFingerprints loader: stored plans keyed by canonical city when city keys are on."""
+        rows = self.require_db().recent_plan_fingerprints(user_id=user_id)
+        if self.cities is None:
+            return rows
+        cities = self.cities
+        return [{**r, "city": r.get("city_key") or cities.key(r.get("city") or "")} for r in rows]
+
+    def _store_tx(self, kind: str, user_ref: str, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        LUNA_STORE_RPC path: one rpc.sql call upserts the user, checks consent / opt-out,
+        upserts the row and logs the event in a single transaction. Returns the RPC
+        result ({"user_id", "id", "stored", "reason", ...}), or None once the call has
+        been spooled for replay.
+        """
+        d = self.require_db()
+        assert self.users is not None
+        payload = {"user_ref": user_ref, "require_consent": self.config.require_consent, **args}
+        store = d.store_archetype_tx if kind == "archetype_tx" else d.store_date_plan_tx
+        try:
+            tx = store(user_id=self.users.cached(user_ref), **payload)
+        except LunaError as e:
+            self.spool.enqueue(kind, payload, error=e.message)
+            return None
+        self.users.remember(user_ref, tx["user_id"])
+        self._update_gate(tx["user_id"], data_opt_out=bool(tx.get("data_opt_out")), consent_version=tx.get("consent_version"))
+        return tx
+
+    def log_event(self, user_ref: str, event: LunaEvent) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="log_event", payload=event.properties)
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+
+        if self.user_gate(user_id).get("data_opt_out"):
+            return ServiceResult(
+                body={"type": "luna_event", "ok": True, "stored": False, "reason": "opted_out"},
+                widget_view="event_ack",
+            )
+
+        payload = {
+            "user_id": user_id,
+            "event_name": event.event_name,
+            "event_id": event.event_id,
+            "properties": event.properties,
+            "occurred_at": event.occurred_at or utc_now_iso(),
+        }
+        try:
+            d.insert_event(**payload)
+        except Exception as e:
+            self.spool.enqueue("event", payload, error=str(e))
+
+        return ServiceResult(
+            body={"type": "luna_event", "ok": True, "stored": True, "event_id": event.event_id},
+            widget_view="event_ack",
+            drained=self.drain_spool(),
+        )
+
+    def log_events(self, user_ref: str, events: List[LunaEvent]) -> ServiceResult:
+        """
+        Batch variant of log_event: one limiter charge (by weight), one user upsert,
+        one bulk insert. Per-event status is one of stored / duplicate / spooled / skipped;
+        duplicate covers repeats within the batch and event_ids already logged.
+        """
+        n = len(events)
+        if n > self.config.max_batch_events:
+            raise LunaError(
+                "BATCH_TOO_LARGE",
+                f"At most {self.config.max_batch_events} events per batch.",
+                {"max": self.config.max_batch_events, "received": n},
+            )
+        self.check_rate_limit(user_ref, cost=max(1, math.ceil(n * self.config.event_batch_weight)), op="log_events", payload=[e.properties for e in events])
+        if n == 0:
+            return ServiceResult(body={"type": "luna_events", "ok": True, "results": []}, widget_view="event_ack")
+
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+
+        if self.user_gate(user_id).get("data_opt_out"):
+            return ServiceResult(
+                body={
+                    "type": "luna_events",
+                    "ok": True,
+                    "reason": "opted_out",
+                    "results": [{"event_id": e.event_id, "status": "skipped"} for e in events],
+                },
+                widget_view="event_ack",
+            )
+
+        rows, results = _event_rows(events)
+        for r in rows:
+            r["user_id"] = user_id
+
+        warnings: List[str] = []
+        try:
+            inserted = set(d.insert_events(rows=rows))
+            for r in results:
+                if r["status"] == "stored" and r["event_id"] not in inserted:
+                    r["status"] = "duplicate"
+        except LunaError as err:
+            self.spool.enqueue("events", {"rows": rows}, error=err.message)
+            warnings.append("spooled_write")
+            for r in results:
+                if r["status"] == "stored":
+                    r["status"] = "spooled"
+
+        return ServiceResult(
+            body={"type": "luna_events", "ok": True, "results": results},
+            widget_view="event_ack",
+            warnings=warnings,
+            drained=self.drain_spool(),
+        )
+
+    # ---- overload (shed) variants: rate limit + spool, no storage I/O ----
+
+    def _shed_log_event(self, user_ref: str, event: LunaEvent) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="log_event", payload=event.properties)
+        rows, _ = _event_rows([event])
+        self.spool.enqueue("shed_events", {"user_ref": user_ref, "rows": rows}, error="overloaded")
+        return ServiceResult(
+            body={"type": "luna_event", "ok": True, "stored": False, "spooled": True, "reason": "overloaded", "event_id": event.event_id},
+            widget_view="event_ack",
+            warnings=["spooled_write"],
+        )
+
+    def _shed_log_events(self, user_ref: str, events: List[LunaEvent]) -> ServiceResult:
+        n = len(events)
+        if n > self.config.max_batch_events:
+            raise LunaError(
+                "BATCH_TOO_LARGE",
+                f"At most {self.config.max_batch_events} events per batch.",
+                {"max": self.config.max_batch_events, "received": n},
+            )
+        self.check_rate_limit(user_ref, cost=max(1, math.ceil(n * self.config.event_batch_weight)), op="log_events", payload=[e.properties for e in events])
+        rows, results = _event_rows(events)
+        if rows:
+            self.spool.enqueue("shed_events", {"user_ref": user_ref, "rows": rows}, error="overloaded")
+        for r in results:
+            if r["status"] == "stored":
+                r["status"] = "spooled"
+        return ServiceResult(
+            body={"type": "luna_events", "ok": True, "reason": "overloaded", "results": results},
+            widget_view="event_ack",
+            warnings=["spooled_write"] if rows else [],
+        )
+
+    def _shed_submit_feedback(
+        self,
+        user_ref: str,
+        *,
+        rating: Optional[int],
+        tags: Optional[list],
+        notes: Optional[str],
+        date_plan_id: Optional[str],
+    ) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="submit_feedback", payload=notes)
+        payload = {"user_ref": user_ref, "date_plan_id": date_plan_id, "rating": rating, "tags": tags, "notes": notes}
+        self.spool.enqueue("shed_feedback", payload, error="overloaded")
+        return ServiceResult(
+            body={"type": "luna_feedback", "ok": True, "stored": False, "spooled": True, "reason": "overloaded"},
+            widget_view="feedback_ack",
+            warnings=["spooled_write"],
+        )
+
+    def submit_feedback(
+        self,
+        user_ref: str,
+        *,
+        rating: Optional[int],
+        tags: Optional[list],
+        notes: Optional[str],
+        date_plan_id: Optional[str],
+    ) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="submit_feedback", payload=notes)
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+
+        if self.user_gate(user_id).get("data_opt_out"):
+            return ServiceResult(
+                body={"type": "luna_feedback", "ok": True, "stored": False, "reason": "opted_out"},
+                widget_view="feedback_ack",
+            )
+
+        payload = {
+            "user_id": user_id,
+            "date_plan_id": date_plan_id,
+            "rating": rating,
+            "tags": tags,
+            "notes": notes,
+        }
+        try:
+            d.insert_feedback(**payload)
+        except Exception as e:
+            self.spool.enqueue("feedback", payload, error=str(e))
+
+        return ServiceResult(
+            body={"type": "luna_feedback", "ok": True, "stored": True},
+            widget_view="feedback_ack",
+            drained=self.drain_spool(),
+        )
+
+    def get_user_snapshot(self, user_ref: str) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="get_user_snapshot")
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+        snap = d.get_latest(user_id=user_id)
+        body: Dict[str, Any] = {"type": "luna_snapshot", "snapshot": snap}
+        if self.purger is not None:
+            body["purge"] = self.purger.status(user_id)
+        return ServiceResult(
+            body=body,
+            widget_view="snapshot",
+            drained=self.drain_spool(),
+        )
+
+    def _export_rows(
+        self, user_id: Optional[str], *, start: Optional[Tuple[int, Tuple[str, str]]] = None, page_size: Optional[int] = None,
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(table index, row) across _EXPORT_TABLES, oldest first, resuming after `start`."""
+        d = self.require_db()
+        if user_id is None:
+            return
+        first, after = start if start is not None else (0, None)
+        for i in range(first, len(_EXPORT_TABLES)):
+            table, column = _EXPORT_TABLES[i]
+            rows = d.iter_user_rows(
+                table,
+                user_id=user_id,
+                time_column=column,
+                after=after if i == first else None,
+                page_size=page_size or self.config.export_page_size,
+            )
+            for row in rows:
+                yield i, row
+
+    def export_user_data(self, user_ref: str) -> Iterator[str]:
+        """
+        Everything stored for a user as NDJSON lines: a header, one {"table", "row"} line
+        per row (archetypes, date_plans, feedback, event_log), then a trailer with counts.
+        Lazy: rows are pulled one keyset page at a time while the caller consumes lines.
+        Gating, rate limiting and the user lookup happen before the first line is
+        produced (run it via `run()`). An unknown user_ref exports zero rows.
+        """
+        self.check_rate_limit(user_ref, cost=2, op="export_user_data")
+        user_id = self.lookup_user(user_ref)
+
+        def lines() -> Iterator[str]:
+            counts = {table: 0 for table, _ in _EXPORT_TABLES}
+            yield stable_json_dumps({
+                "type": "luna_export",
+                "user_ref": user_ref,
+                "generated_at": utc_now_iso(),
+                "tables": [table for table, _ in _EXPORT_TABLES],
+            }) + "\n"
+            try:
+                for i, row in self._export_rows(user_id):
+                    table = _EXPORT_TABLES[i][0]
+                    counts[table] += 1
+                    yield stable_json_dumps({"table": table, "row": row}) + "\n"
+            except LunaError as e:
+                # Headers are already sent; say so in-band instead of truncating silently.
+                yield stable_json_dumps({"type": "luna_export_error", **e.to_payload(), "counts": counts}) + "\n"
+                return
+            yield stable_json_dumps({"type": "luna_export_end", "counts": counts}) + "\n"
+
+        return lines()
+
+    async def stream_export(self, lines: Iterator[str]) -> AsyncIterator[str]:
+        """
+        Serve export_user_data's lines (obtained through run()) with every page read on
+        the DB pool: up to export_page_size lines per admitted call, so a long export
+        counts against the same pending limit and shedding as any other read. While the
+        pool is overloaded the stream backs off and retries; if it stays overloaded, an
+        in-band luna_export_error line ends it (headers are already sent).
+        """
+        n = max(1, self.config.export_page_size)
+        while True:
+            for attempt in range(_EXPORT_OVERLOAD_RETRIES + 1):
+                try:
+                    if self.admission is None:
+                        chunk = await asyncio.to_thread(_take, lines, n)
+                    else:
+                        chunk = await self.admission.run(NORMAL, _take, lines, n)
+                    break
+                except LunaError as e:
+                    if e.code != "OVERLOADED" or attempt == _EXPORT_OVERLOAD_RETRIES:
+                        yield stable_json_dumps({"type": "luna_export_error", **e.to_payload()}) + "\n"
+                        return
+                    await asyncio.sleep(0.25 * 2 ** attempt)
+            if not chunk:
+                return
+            for line in chunk:
+                yield line
+
+    def export_user_page(self, user_ref: str, *, cursor: Optional[str] = None, limit: int = 200) -> ServiceResult:
+        """
+        One page of the export (NDJSON text) plus an opaque cursor for the next page, for
+        callers that cannot consume a stream (MCP tools). Same order as export_user_data.
+        """
+        self.check_rate_limit(user_ref, cost=2, op="export_user_page")
+        user_id = self.lookup_user(user_ref)
+        limit = max(1, min(int(limit), 1000))
+        start = _decode_export_cursor(cursor) if cursor else None
+
+        out: List[str] = []
+        last: Optional[Tuple[int, Dict[str, Any]]] = None
+        next_cursor: Optional[str] = None
+        for i, row in self._export_rows(user_id, start=start, page_size=limit + 1):
+            if len(out) >= limit:
+                assert last is not None
+                li, lrow = last
+                next_cursor = _encode_export_cursor(li, lrow[_EXPORT_TABLES[li][1]], lrow["id"])
+                break
+            out.append(stable_json_dumps({"table": _EXPORT_TABLES[i][0], "row": row}))
+            last = (i, row)
+        return ServiceResult(
+            body={
+                "type": "luna_export_page",
+                "count": len(out),
+                "ndjson": "\n".join(out) + ("\n" if out else ""),
+                "next_cursor": next_cursor,
+                "done": next_cursor is None,
+            },
+            widget_view="export",
+        )
+
+    def get_latest_archetype(self, user_ref: str) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="get_latest_archetype")
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+        row = d.get_latest_archetype(user_id=user_id)
+        return ServiceResult(
+            body={
+                "type": "luna_archetype",
+                "found": bool(row),
+                "archetype": row.get("archetype_json") if row else None,
+                "created_at": row.get("created_at") if row else None,
+            },
+            widget_view="archetype_card",
+        )
+
+    def get_archetype_benchmarks(self, user_ref: str, level: Optional[str] = None) -> ServiceResult:
+        """
+        Where the user's latest archetype sits in the aggregate: share of users with the
+        same styles, percentile of each trait score, and which blind-spot patterns tend
+        to co-occur with theirs. Aggregates only; groups below cohort_min_size are withheld.
+        """
+        self.check_rate_limit(user_ref, cost=1, op="get_archetype_benchmarks")
+        if self.cohort is None:
+            raise LunaError("BENCHMARKS_UNAVAILABLE", "Cohort benchmarks are disabled on this server.")
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+        row = d.get_latest_archetype(user_id=user_id, level=level)
+        if not row:
+            return ServiceResult(body={"type": "luna_benchmarks", "found": False}, widget_view="benchmarks")
+
+        arch = row.get("archetype_json") or {}
+        lvl = row.get("level") or arch.get("level")
+        min_n = self.config.cohort_min_size
+        cohort = self.cohort
+
+        styles: Dict[str, Any] = {}
+        for axis in AXES:
+            dist = cohort.distribution(axis, level=lvl)
+            value = arch.get(axis)
+            if dist["total"] >= min_n and value in dist["share"]:
+                styles[axis] = {"value": value, "share": dist["share"][value], "cohort": dist["total"]}
+
+        traits = []
+        for t in arch.get("traits") or []:
+            pct = cohort.trait_percentile(t.get("label", ""), t.get("score", 0), level=lvl)
+            if pct and pct["n"] >= min_n:
+                traits.append({"label": t.get("label"), "score": t.get("score"), "percentile": pct["percentile"], "cohort": pct["n"]})
+
+        blind_spots = []
+        for p in (arch.get("blind_spots") or {}).get("patterns") or []:
+            co = cohort.blind_spot_cooccurrence(p, top=3, level=lvl)
+            if co and co["n"] >= min_n:
+                co["co_occurs_with"] = [c for c in co["co_occurs_with"] if c["count"] >= min_n]
+                blind_spots.append(co)
+
+        return ServiceResult(
+            body={
+                "type": "luna_benchmarks",
+                "found": True,
+                "level": lvl,
+                "cohort_size": len(cohort),
+                "styles": styles,
+                "traits": traits,
+                "blind_spots": blind_spots,
+            },
+            widget_view="benchmarks",
+        )
+
+    def get_criteria_insights(self, user_ref: str, city: str, *, limit: int = 10) -> ServiceResult:
+        """
+        Which DateOps criteria get rated well in a city: average rating per (category,
+        noise level, price tier) of rated plans' primary criteria, plus common debrief
+        tags. Read from aggregates kept up to date on each feedback write; groups and
+        tags with fewer than insights_min_count ratings / uses are withheld.
+        """
+        self.check_rate_limit(user_ref, cost=1, op="get_criteria_insights")
+        if not self.config.criteria_insights:
+            raise LunaError("INSIGHTS_UNAVAILABLE", "Criteria insights are disabled on this server.")
+        d = self.require_db()
+        # Same key the trigger uses: date_plans.city_key, else the trimmed, lowercased city.
+        city_key = self.cities.key(city) if self.cities is not None else city.strip().lower()
+        rows = self._insights.get(city_key)
+        if rows is None:
+            rows = d.get_criteria_insights(city_key=city_key)
+            self._insights.set(city_key, rows)
+
+        min_n = self.config.insights_min_count
+        tag_totals: Dict[str, int] = {}
+        criteria = []
+        for r in rows:
+            tags = r.get("tag_counts") or {}
+            for tag, n in tags.items():
+                tag_totals[tag] = tag_totals.get(tag, 0) + int(n)
+            if r.get("rating_count", 0) < min_n:
+                continue
+            criteria.append({
+                "category": r.get("category"),
+                "noise_level": r.get("noise_level"),
+                "price_tier": r.get("price_tier"),
+                "avg_rating": round(r["rating_sum"] / r["rating_count"], 2) if r["rating_count"] else None,
+                "ratings": r["rating_count"],
+                "top_tags": [t for t, n in sorted(tags.items(), key=lambda kv: -kv[1]) if n >= min_n][:3],
+            })
+        criteria.sort(key=lambda c: (c["avg_rating"] is None, -(c["avg_rating"] or 0), -c["ratings"]))
+        top_tags = [{"tag": t, "count": n} for t, n in sorted(tag_totals.items(), key=lambda kv: -kv[1]) if n >= min_n][:10]
+        return ServiceResult(
+            body={
+                "type": "luna_criteria_insights",
+                "found": bool(criteria or top_tags),
+                "city": city,
+                "city_key": city_key,
+                "min_count": min_n,
+                "criteria": criteria[: max(1, min(limit, 50))],
+                "top_tags": top_tags,
+            },
+            widget_view="criteria_insights",
+        )
+
+    def get_latest_dateops(self, user_ref: str) -> ServiceResult:
+        self.check_rate_limit(user_ref, cost=1, op="get_latest_dateops")
+        d = self.require_db()
+        user_id = self.ensure_user(user_ref)
+        row = d.get_latest_date_plan(user_id=user_id)
+        return ServiceResult(
+            body={
+                "type": "luna_dateops",
+                "found": bool(row),
+                "plan_id": row.get("id") if row else None,
+                "city": row.get("city") if row else None,
+                "plan": row.get("plan_json") if row else None,
+                "created_at": row.get("created_at") if row else None,
+            },
+            widget_view="dateops_plan",
+        )
+
+    # ----------------------------
+    # Admin: profiling
+    # ----------------------------
+
+    def profile_status(self, token: Optional[str]) -> ServiceResult:
+        return ServiceResult(body={"type": "luna_profile", **self.require_profiler(token).status()}, widget_view="admin")
+
+    def start_profile(self, token: Optional[str], *, seconds: float = 30.0, interval_ms: float = 10.0) -> ServiceResult:
+        sample = self.require_profiler(token).start_sampling(seconds, interval_ms=interval_ms)
+        return ServiceResult(body={"type": "luna_profile_sample", **sample}, widget_view="admin")
+
+    def memory_snapshot(self, token: Optional[str], *, top: int = 25) -> ServiceResult:
+        snap = self.require_profiler(token).memory_snapshot(top=top)
+        return ServiceResult(body={"type": "luna_memory_snapshot", **snap}, widget_view="admin")
+
+    def arm_tool_profile(self, token: Optional[str], tool: str, *, calls: int = 1) -> ServiceResult:
+        armed = self.require_profiler(token).arm(tool, calls)
+        return ServiceResult(body={"type": "luna_profile_tool", **armed}, widget_view="admin")
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+
+# Admission priority per operation (anything else: NORMAL). Writes the user sees keep
+# headroom; analytics and feedback are the first to be shed.
+_OP_PRIORITY = {
+    "store_archetype": HIGH,
+    "store_dateops_plan": HIGH,
+    "accept_consent": HIGH,
+    "set_opt_out": HIGH,
+    "log_event": LOW,
+    "log_events": LOW,
+    "submit_feedback": LOW,
+}
+# LOW operations with a spool-only variant used when admission sheds them
+_SHED_OPS = {
+    "log_event": "_shed_log_event",
+    "log_events": "_shed_log_events",
+    "submit_feedback": "_shed_submit_feedback",
+}
+
+# Back-off retries of an export page read while the DB pool is overloaded
+_EXPORT_OVERLOAD_RETRIES = 4
+
+
+def _take(items: Iterator[Any], n: int) -> List[Any]:
+    return list(itertools.islice(items, n))
+
+
+def _event_rows(events: List[LunaEvent]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Rows (without user_id) and per-event results; repeated event_ids are reported as duplicate."""
+    now = utc_now_iso()
+    rows: List[Dict[str, Any]] = []
+    results: List[Dict[str, Any]] = []
+    seen = set()
+    for e in events:
+        if e.event_id in seen:
+            results.append({"event_id": e.event_id, "status": "duplicate"})
+            continue
+        seen.add(e.event_id)
+        rows.append({
+            "event_name": e.event_name,
+            "event_id": e.event_id,
+            "properties": e.properties,
+            "occurred_at": e.occurred_at or now,
+        })
+        results.append({"event_id": e.event_id, "status": "stored"})
+    return rows, results
+
+
+# Export order, and the column each table is keyset-paginated on together with id.
+# event_log pages on occurred_at: its per-user index is (user_id, occurred_at).
+_EXPORT_TABLES = (
+    ("archetypes", "created_at"),
+    ("date_plans", "created_at"),
+    ("feedback", "created_at"),
+    ("event_log", "occurred_at"),
+)
+
+
+def _encode_export_cursor(table_index: int, ts: str, row_id: str) -> str:
+    raw = stable_json_dumps([table_index, ts, row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_export_cursor(cursor: str) -> Tuple[int, Tuple[str, str]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        table_index, ts, row_id = json.loads(raw)
+        if not (0 <= int(table_index) < len(_EXPORT_TABLES)):
+            raise ValueError("table index out of range")
+        return int(table_index), (str(ts), str(row_id))
+    except Exception:
+        raise LunaError("INVALID_CURSOR", "Export cursor is malformed; restart the export without a cursor.")
+
+
+# Keys kept by compact mode: the ack, IDs, source hash and anything needed to act on
+# a rejection. Payload echoes (profile / plan / display_text / card_copy) are dropped.
+_COMPACT_KEYS = frozenset({
+    "type", "ok", "stored", "spooled", "status", "reason", "fields", "instructions",
+    "source_hash", "archetype_id", "plan_id", "event_id", "results", "found",
+})
+
+
+def wants_field(key: str, compact: bool, projection: Optional[List[str]]) -> bool:
+    """Whether a top-level key survives shape_body (lets callers skip building it)."""
+    if projection and any(p == key or p.startswith(key + ".") for p in projection):
+        return True
+    if compact:
+        return key in _COMPACT_KEYS
+    return not projection
+
+
+def shape_body(
+    body: Dict[str, Any],
+    *,
+    compact: bool = False,
+    projection: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Trim a response body. `compact` keeps only _COMPACT_KEYS; `projection` is a list of
+    (optionally dotted) paths to keep, e.g. ["profile.archetype_name", "display_text"].
+    Both may be combined; `type` is always kept.
+    """
+    if not compact and not projection:
+        return body
+    if compact:
+        out = {k: v for k, v in body.items() if k in _COMPACT_KEYS}
+    else:
+        out = {k: body[k] for k in ("type", "stored", "reason") if k in body}
+    for path in projection or []:
+        src: Any = body
+        parts = path.split(".")
+        for part in parts:
+            if not isinstance(src, dict) or part not in src:
+                src = _MISSING
+                break
+            src = src[part]
+        if src is _MISSING:
+            continue
+        dst = out
+        for part in parts[:-1]:
+            nxt = dst.get(part)
+            if not isinstance(nxt, dict):
+                nxt = dst[part] = {}
+            dst = nxt
+        dst[parts[-1]] = src
+    return out
+
+
+_MISSING = object()
+
+def venue_name_fields(plan: DateOpsPlan) -> List[str]:
+    """Hard guardrail against venue hallucinations / proper nouns. Returns offending field paths."""
+    suspicious = []
+    for field_path, text in [
+        ("primary_criteria.category", plan.primary_criteria.category),
+        ("primary_criteria.vibe_required", plan.primary_criteria.vibe_required),
+        ("backup_criteria.category", plan.backup_criteria.category),
+        ("backup_criteria.vibe_required", plan.backup_criteria.vibe_required),
+        ("invite_text", plan.invite_text),
+        ("backup_plan", plan.backup_plan or ""),
+    ]:
+        if looks_like_specific_venue(text):
+            suspicious.append(field_path)
+    return suspicious
+
+
+def render_dateops_markdown(plan: Dict[str, Any], city: str) -> str:
+    p = plan
+    pc = p.get("primary_criteria", {})
+    bc = p.get("backup_criteria", {})
+    hooks = p.get("conversation_hooks", []) or []
+    hooks_md = "\n".join([f"- {h}" for h in hooks[:6]]) if hooks else "- (none)"
+    return f"""\
+## 🗓️ {p.get('plan_name','Date Plan')} ({city})
+
+**Time:** {p.get('suggested_time','')}
+
+### Primary criteria
+- Category: **{pc.get('category','')}**
+- Vibe: {pc.get('vibe_required','')}
+- Noise: {pc.get('noise_level','')}
+- Price: {pc.get('price_tier','')}
+
+### Backup criteria
+- Category: **{bc.get('category','')}**
+- Vibe: {bc.get('vibe_required','')}
+- Noise: {bc.get('noise_level','')}
+- Price: {bc.get('price_tier','')}
+
+### Invite text
+> {p.get('invite_text','').strip()}
+
+### Conversation hooks
+{hooks_md}
+"""
+
+
+_service: Optional[LunaService] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> LunaService:
+    """Process-wide LunaService shared by every front-end loaded in this process."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = LunaService(ServiceConfig.from_env())
+                atexit.register(_service.shutdown)
+    return _service
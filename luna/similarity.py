@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+_WORD = re.compile(r"[a-z0-9$]+")
+_MASK64 = (1 << 64) - 1
+
+# Feature weights: the venue criteria decide what the plan *is*; wording of the
+# invite and hooks is what regenerations and small tweaks mostly change.
+_CRITERIA_FIELDS = ("category", "noise_level", "price_tier")
+_W_CRITERIA = 4
+_W_VIBE = 2
+_W_TEXT = 1
+
+
+def _tokens(text: str) -> List[str]:
+    return _WORD.findall((text or "").lower())
+
+
+def _shingles(text: str) -> Iterable[str]:
+    words = _tokens(text)
+    yield from words
+    for a, b in zip(words, words[1:]):
+        yield f"{a} {b}"
+
+
+def _h64(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(features: Iterable[Tuple[str, int]]) -> int:
+    """64-bit SimHash of weighted features: similar feature sets -> few differing bits."""
+    v = [0] * 64
+    for feature, weight in features:
+        h = _h64(feature)
+        for i in range(64):
+            v[i] += weight if (h >> i) & 1 else -weight
+    out = 0
+    for i in range(64):
+        if v[i] > 0:
+            out |= 1 << i
+    return out
+
+
+def plan_features(plan: Dict[str, Any]) -> Iterable[Tuple[str, int]]:
+    """Normalized features of a DateOps plan: criteria, invite text and conversation hooks."""
+    for slot in ("primary_criteria", "backup_criteria"):
+        crit = plan.get(slot) or {}
+        for field in _CRITERIA_FIELDS:
+            value = " ".join(_tokens(str(crit.get(field) or "")))
+            if value:
+                yield f"{slot}.{field}={value}", _W_CRITERIA
+        for s in _shingles(crit.get("vibe_required") or ""):
+            yield f"{slot}.vibe:{s}", _W_VIBE
+    for s in _shingles(plan.get("invite_text") or ""):
+        yield f"invite:{s}", _W_TEXT
+    for hook in plan.get("conversation_hooks") or []:
+        for s in _shingles(hook):
+            yield f"hook:{s}", _W_TEXT
+
+
+def plan_fingerprint(plan: Dict[str, Any]) -> int:
+    """Signed 64-bit fingerprint (fits a Postgres bigint)."""
+    h = simhash(plan_features(plan))
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK64).count("1")
+
+
+class PlanFingerprints:
+    """
+    Per-user index of recent DateOps plan fingerprints: user_id -> [(plan_id, city, fp)],
+    newest first, at most `per_user` entries, for at most `max_users` users (LRU). `city`
+    is whatever the caller matches on: the canonical city key when LUNA_CITY_KEYS is on,
+    else the raw city.
+    A user missing from the index is loaded once through `load(user_id)` (the newest
+    stored plans), so near-duplicate checks stay correct across restarts and workers.
+    """
+    def __init__(self, load: Callable[[str], List[Dict[str, Any]]], *, per_user: int = 20, max_users: int = 10_000):
+        self._load = load
+        self.per_user = max(1, per_user)
+        self.max_users = max(1, max_users)
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, List[Tuple[str, str, int]]]" = OrderedDict()
+
+    def _entries(self, user_id: str) -> List[Tuple[str, str, int]]:
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is not None:
+                self._users.move_to_end(user_id)
+                return entries
+        rows = self._load(user_id)
+        entries = [(r["id"], r.get("city") or "", int(r["simhash"])) for r in rows if r.get("simhash") is not None][: self.per_user]
+        with self._lock:
+            entries = self._users.setdefault(user_id, entries)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return entries
+
+    def nearest(self, user_id: str, city: str, fp: int, *, max_distance: int) -> Optional[Tuple[str, int]]:
+        """(plan_id, distance) of the closest recent plan for the same city within max_distance."""
+        best: Optional[Tuple[str, int]] = None
+        for plan_id, plan_city, other in self._entries(user_id):
+            if plan_city != city:
+                continue
+            dist = hamming(fp, other)
+            if dist <= max_distance and (best is None or dist < best[1]):
+                best = (plan_id, dist)
+        return best
+
+    def add(self, user_id: str, plan_id: str, city: str, fp: int) -> None:
+        """Record a stored (or replaced) plan as the user's newest."""
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is None:
+                return  # loaded from storage on next use
+            entries[:] = [(plan_id, city, fp)] + [e for e in entries if e[0] != plan_id][: self.per_user - 1]
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def dump(self) -> Dict[str, List[List[Any]]]:
+        """Most recently used users first (warm-state snapshots)."""
+        with self._lock:
+            return {uid: [list(e) for e in entries] for uid, entries in reversed(self._users.items())}
+
+    def load(self, users: Dict[str, List[List[Any]]]) -> int:
+        n = 0
+        with self._lock:
+            for uid, entries in users.items():
+                if uid in self._users or len(self._users) >= self.max_users:
+                    continue
+                self._users[uid] = [(str(p), str(c), int(fp)) for p, c, fp in entries][: self.per_user]
+                self._users.move_to_end(uid, last=False)  # keep dump order: oldest evicted first
+                n += 1
+        return n
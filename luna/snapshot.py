@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, IO, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None  # type: ignore[assignment]
+
+FORMAT_VERSION = 1
+_MAGIC = b"LUNAWARM"
+# Worker slots tried before falling back to a pid-suffixed (non-restorable) file
+MAX_SLOTS = 64
+
+
+class WarmState:
+    """
+    Snapshot / restore of in-process caches across restarts and redeploys.
+
+    Each section is a (dump, load) pair: `dump()` returns JSON-able state and
+    `load(state, age_seconds)` merges it back, never overwriting entries the new process
+    has already filled. The file is `LUNAWARM` + a format-version byte + zlib-compressed
+    JSON, written atomically (temp file + rename, mode 0600) every `interval_seconds`
+    and on shutdown.
+
+    Each worker process owns its own file, `<path>.<slot>`: the lowest slot whose
+    `<path>.<slot>.lock` no live process holds (flock, released on exit). Workers
+    sharing a path never overwrite each other, and a restarted pool of the same size
+    takes the same slots back, each restoring one previous worker's caches.
+
+    Restore runs once, on the warm-up thread, so boot never waits for it. A snapshot
+    older than `max_age_seconds`, with another format version, or unreadable is ignored.
+    Sections with TTLs subtract the snapshot's age, so nothing outlives its original
+    expiry. Unknown sections are skipped and missing ones left empty, so versions can
+    be rolled forward and back.
+    """
+    def __init__(self, path: str, *, interval_seconds: float = 60.0, max_age_seconds: float = 900.0):
+        self.path = Path(path)
+        self.file: Optional[Path] = None  # this worker's snapshot, claimed on first use
+        self._slot_lock: Optional[IO[bytes]] = None
+        self.interval = max(1.0, interval_seconds)
+        self.max_age = max(0.0, max_age_seconds)
+        self._sections: Dict[str, Tuple[Callable[[], Any], Callable[[Any, float], Any]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_saved_at: Optional[float] = None
+        self.last_save_bytes = 0
+        self.last_error: Optional[str] = None
+        self.restored: Dict[str, Any] = {}
+
+    def register(self, name: str, dump: Callable[[], Any], load: Callable[[Any, float], Any]) -> None:
+        self._sections[name] = (dump, load)
+
+    # ---- worker slot ----
+
+    def _claim(self) -> Path:
+        with self._lock:
+            if self.file is not None:
+                return self.file
+            self.file = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+            if fcntl is None:
+                self.file = self.path
+                return self.file
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                return self.file
+            for slot in range(MAX_SLOTS):
+                try:
+                    f = open(self.path.with_name(f"{self.path.name}.{slot}.lock"), "ab")
+                except OSError:
+                    break
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    f.close()
+                    continue
+                self._slot_lock = f
+                self.file = self.path.with_name(f"{self.path.name}.{slot}")
+                break
+            return self.file
+
+    # ---- save ----
+
+    def save(self) -> bool:
+        sections: Dict[str, Any] = {}
+        for name, (dump, _) in self._sections.items():
+            try:
+                sections[name] = dump()
+            except Exception as e:
+                self.last_error = f"{name}: {e}"[:200]
+        doc = {"written_at": time.time(), "pid": os.getpid(), "sections": sections}
+        blob = _MAGIC + bytes([FORMAT_VERSION]) + zlib.compress(json.dumps(doc, separators=(",", ":")).encode("utf-8"), 6)
+        path = self._claim()
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with self._lock:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(blob)
+                os.replace(tmp, path)
+            except OSError as e:
+                self.last_error = str(e)[:200]
+                return False
+        self.last_saved_at = time.time()
+        self.last_save_bytes = len(blob)
+        return True
+
+    # ---- restore ----
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        try:
+            raw = self._claim().read_bytes()
+        except OSError:
+            return None
+        if not raw.startswith(_MAGIC) or len(raw) <= len(_MAGIC) or raw[len(_MAGIC)] != FORMAT_VERSION:
+            return None
+        try:
+            return json.loads(zlib.decompress(raw[len(_MAGIC) + 1:]).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+
+    def restore(self) -> Dict[str, Any]:
+        """Merge a fresh-enough snapshot into the registered sections. Returns what was restored."""
+        doc = self.read()
+        if doc is None:
+            self.restored = {"status": "none"}
+            return self.restored
+        age = max(0.0, time.time() - float(doc.get("written_at") or 0))
+        if age > self.max_age:
+            self.restored = {"status": "stale", "age_s": round(age, 1)}
+            return self.restored
+        counts: Dict[str, Any] = {}
+        for name, state in (doc.get("sections") or {}).items():
+            section = self._sections.get(name)
+            if section is None:
+                continue
+            try:
+                counts[name] = section[1](state, age)
+            except Exception as e:
+                self.last_error = f"{name}: {e}"[:200]
+        self.restored = {"status": "restored", "age_s": round(age, 1), "sections": counts}
+        return self.restored
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.file or self.path),
+            "last_saved_at": self.last_saved_at,
+            "last_save_bytes": self.last_save_bytes,
+            "restored": dict(self.restored),
+            **({"last_error": self.last_error} if self.last_error else {}),
+        }
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="luna-warm-state", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.save()
+        if self._slot_lock is not None:
+            self._slot_lock.close()  # frees the slot for the next process
+            self._slot_lock = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.save()
@@ -4,32 +4,124 @@ from __future__ import annotations
 import json
 import os
 import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional, Callable, List
+from typing import Any, Dict, Optional, Callable, List, IO
 
 from .util import utc_now_iso, stable_json_dumps
 
+try:
+    import fcntl  # POSIX only
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+
+def _try_lock(f: IO[Any]) -> bool:
+    """Non-blocking exclusive advisory lock on an open file (always succeeds without fcntl)."""
+    if fcntl is None:  # pragma: no cover
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
 
 class Spooler:
     """
     Auto-healing fallback: if DB writes fail, enqueue a JSONL record locally.
     When DB is healthy again, we replay the queue.
+
+    Safe with several worker processes sharing one spool dir:
+    - each process appends only to its own segment file (seg-<ns>-<pid>.jsonl) and
+      holds an exclusive flock on it while it is the active segment;
+    - drain() only touches segments it can flock, so a segment is replayed by at most
+      one process at a time and never while its writer is still appending. A crashed
+      worker's lock is released by the OS, so its segment becomes drainable.
+    A legacy single-file queue.jsonl is still drained.
+
+    drain() runs after most requests, so it is cheap when there is nothing to do: it
+    only seals an active segment that holds records, and scans the directory for other
+    segments (older ones of ours, or other workers') at most every `scan_seconds`
+    unless forced (the background prober forces it).
     """
-    def __init__(self, spool_dir: str = "/tmp/luna_spool", max_bytes: int = 8_000_000):
+    def __init__(
+        self,
+        spool_dir: str = "/tmp/luna_spool",
+        max_bytes: int = 8_000_000,
+        segment_bytes: int = 1_000_000,
+        scan_seconds: float = 5.0,
+    ):
         self.dir = Path(spool_dir)
-        self.dir.mkdir(parents=True, exist_ok=True)
         self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.scan_seconds = max(0.0, scan_seconds)
+        self._next_scan = 0.0
         self._lock = threading.Lock()
+        # Created on first enqueue (or warm-up), not at import time.
+        self._dir_ready = False
+        self._active: Optional[IO[str]] = None
+        self._active_path: Optional[Path] = None
+        self._active_size = 0
+        self._owner_pid = os.getpid()
+
+    def ensure_dir(self) -> None:
+        if not self._dir_ready:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._dir_ready = True
 
     @property
     def path(self) -> Path:
+        """Legacy single-file queue (still drained)."""
         return self.dir / "queue.jsonl"
 
-    def _current_size(self) -> int:
+    def segments(self) -> List[Path]:
+        """Replayable files, oldest first."""
         try:
-            return self.path.stat().st_size
+            segs = sorted(self.dir.glob("seg-*.jsonl"))
         except FileNotFoundError:
-            return 0
+            return []
+        if self.path.exists():
+            segs.insert(0, self.path)
+        return segs
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth (records + bytes + segments). Reads files; call from background code."""
+        records = 0
+        size = 0
+        segs = self.segments()
+        for seg in segs:
+            try:
+                with seg.open("rb") as f:
+                    for chunk in iter(lambda: f.read(65536), b""):
+                        records += chunk.count(b"\n")
+                        size += len(chunk)
+            except FileNotFoundError:
+                continue
+        return {"records": records, "bytes": size, "segments": len(segs)}
+
+    # ---- writer side ----
+
+    def _open_segment(self) -> None:
+        self.ensure_dir()
+        # Create + lock under a name drain() ignores, then publish it. Otherwise a
+        # drainer could lock (and unlink) the empty file before we hold its lock.
+        p = self.dir / f"seg-{time.time_ns():020d}-{os.getpid()}.jsonl"
+        pending = p.with_name(p.name + ".new")
+        f = pending.open("a", encoding="utf-8")
+        _try_lock(f)
+        os.rename(pending, p)
+        self._active, self._active_path, self._active_size = f, p, 0
+        self._owner_pid = os.getpid()
+
+    def _seal_active(self) -> None:
+        """Close the active segment; closing releases the flock so it becomes drainable."""
+        if self._active is not None:
+            try:
+                self._active.close()
+            except Exception:
+                pass
+        self._active, self._active_path, self._active_size = None, None, 0
 
     def enqueue(self, kind: str, payload: Dict[str, Any], *, error: Optional[str] = None) -> None:
         rec = {
@@ -39,51 +131,119 @@ class Spooler:
             "error": error,
         }
         line = stable_json_dumps(rec) + "\n"
+        nbytes = len(line.encode("utf-8"))
         with self._lock:
-            if self._current_size() + len(line.encode("utf-8")) > self.max_bytes:
-                # Best-effort: rotate (drop old)
-                self.rotate()
-            with self.path.open("a", encoding="utf-8") as f:
-                f.write(line)
+            if self._active is not None and self._owner_pid != os.getpid():
+                # Forked child inherited the parent's segment (and its lock): start our own.
+                self._active, self._active_path, self._active_size = None, None, 0
+            if self._active is not None and self._active_size + nbytes > self.segment_bytes:
+                self._seal_active()
+                self._enforce_cap()
+            if self._active is None:
+                self._open_segment()
+            assert self._active is not None
+            self._active.write(line)
+            self._active.flush()
+            self._active_size += nbytes
+
+    def _enforce_cap(self) -> None:
+        """Best-effort: park the oldest unlocked segments (drop from replay) over max_bytes."""
+        segs = self.segments()
+        total = 0
+        sizes = []
+        for seg in segs:
+            try:
+                sz = seg.stat().st_size
+            except FileNotFoundError:
+                sz = 0
+            sizes.append(sz)
+            total += sz
+        for seg, sz in zip(segs, sizes):
+            if total <= self.max_bytes:
+                break
+            try:
+                with seg.open("r", encoding="utf-8") as f:
+                    if not _try_lock(f):
+                        continue
+                    seg.rename(self.dir / f"overflow.{utc_now_iso().replace(':','-')}.{seg.name}")
+                total -= sz
+            except FileNotFoundError:
+                continue
 
     def rotate(self) -> None:
         with self._lock:
-            if self.path.exists():
-                rot = self.dir / f"queue.{utc_now_iso().replace(':','-')}.jsonl"
-                self.path.rename(rot)
+            self._seal_active()
+
+    # ---- replay side ----
 
-    def drain(self, apply_fn: Callable[[str, Dict[str, Any]], None], max_records: int = 200) -> int:
+    def drain(self, apply_fn: Callable[[str, Dict[str, Any]], None], max_records: int = 200, *, force: bool = False) -> int:
         """
         Replay queued writes. apply_fn(kind, payload) must raise on failure.
-        Returns count applied.
+        Returns count applied. At most max_records records are attempted per call.
+        Without `force`, returns 0 at once unless this process has enqueued records
+        since the last drain or the periodic directory scan is due.
         """
         with self._lock:
-            if not self.path.exists():
+            local = self._active is not None and self._active_size > 0 and self._owner_pid == os.getpid()
+            if local:
+                # Our own active segment is locked by us; seal it so its records are replayable.
+                self._seal_active()
+            now = time.monotonic()
+            if not (local or force or now >= self._next_scan):
                 return 0
-            lines = self.path.read_text(encoding="utf-8").splitlines()
-
-        if not lines:
-            return 0
+            self._next_scan = now + self.scan_seconds
 
         applied = 0
-        remaining: List[str] = []
-        for line in lines:
-            if applied >= max_records:
-                remaining.append(line)
-                continue
+        budget = max_records
+        for seg in self.segments():
+            if budget <= 0:
+                break
+            n_applied, n_tried = self._drain_segment(seg, apply_fn, budget)
+            applied += n_applied
+            budget -= n_tried
+        return applied
+
+    def _drain_segment(self, seg: Path, apply_fn: Callable[[str, Dict[str, Any]], None], budget: int) -> "tuple[int, int]":
+        try:
+            f = seg.open("r+", encoding="utf-8")
+        except FileNotFoundError:
+            return 0, 0
+        with f:
+            if not _try_lock(f):
+                # Being written (active segment of a live worker) or drained elsewhere.
+                return 0, 0
             try:
-                rec = json.loads(line)
-                apply_fn(rec.get("kind",""), rec.get("payload",{}))
-                applied += 1
-            except Exception:
-                remaining.append(line)
+                if os.fstat(f.fileno()).st_ino != os.stat(seg).st_ino:
+                    return 0, 0  # replaced/removed by another drainer after we opened it
+            except FileNotFoundError:
+                return 0, 0
+            lines = f.read().splitlines()
 
-        with self._lock:
+            applied = 0
+            tried = 0
+            remaining: List[str] = []
+            for line in lines:
+                if not line:
+                    continue
+                if tried >= budget:
+                    remaining.append(line)
+                    continue
+                tried += 1
+                try:
+                    rec = json.loads(line)
+                    apply_fn(rec.get("kind",""), rec.get("payload",{}))
+                    applied += 1
+                except Exception:
+                    remaining.append(line)
+
+            # Still holding the lock: publish the remainder atomically, or drop the segment.
             if remaining:
-                self.path.write_text("\n".join(remaining) + "\n", encoding="utf-8")
+                tmp = seg.with_name(seg.name + ".tmp")
+                tmp.write_text("\n".join(remaining) + "\n", encoding="utf-8")
+                os.replace(tmp, seg)
             else:
                 try:
-                    self.path.unlink()
+                    seg.unlink()
                 except FileNotFoundError:
                     pass
-        return applied
+        return applied, tried
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from .util import SimpleTTLCache
+
+
+def _minute_iso() -> str:
+    return datetime.now(timezone.utc).replace(second=0, microsecond=0).isoformat()
+
+
+class UserDirectory:
+    """
+    user_ref -> user_id resolution with coalesced last-seen tracking.
+
+    Only the first sighting of a user_ref in this process pays for `upsert_user`.
+    After that, visits are recorded in memory at minute granularity and flushed
+    as one batched `touch_users` every `flush_seconds`, so read tools stop
+    rewriting the users row on every call.
+    """
+    def __init__(self, db: Any, *, flush_seconds: float = 60.0, max_items: int = 50_000):
+        self.db = db
+        self.flush_seconds = max(1.0, flush_seconds)
+        self._ids = SimpleTTLCache(ttl_seconds=86_400, max_items=max_items)
+        self._lock = threading.Lock()
+        self._last_written: Dict[str, str] = {}
+        self._pending: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def resolve(self, user_ref: str) -> str:
+        user_id = self._ids.get(user_ref)
+        if user_id is None:
+            # upsert_user also stamps last_seen_at
+            user_id = self.db.upsert_user(user_ref)
+            self._ids.set(user_ref, user_id)
+            with self._lock:
+                self._last_written[user_ref] = _minute_iso()
+                self._pending.pop(user_ref, None)
+            return user_id
+        self.touch(user_ref)
+        return user_id
+
+    def lookup(self, user_ref: str) -> Optional[str]:
+        """user_id for an existing user, or None; never creates the row or counts a visit."""
+        user_id = self._ids.get(user_ref)
+        if user_id is None:
+            user_id = self.db.find_user(user_ref)
+            if user_id is not None:
+                self._ids.set(user_ref, user_id)
+        return user_id
+
+    def cached(self, user_ref: str) -> Optional[str]:
+        """user_id if this process has already resolved `user_ref` (no I/O)."""
+        return self._ids.get(user_ref)
+
+    def remember(self, user_ref: str, user_id: str) -> None:
+        """Record an id learned elsewhere (e.g. from a store RPC) and count the visit."""
+        if self._ids.get(user_ref) is None:
+            self._ids.set(user_ref, user_id)
+        self.touch(user_ref)
+
+    def touch(self, user_ref: str) -> None:
+        minute = _minute_iso()
+        with self._lock:
+            if self._last_written.get(user_ref) != minute:
+                self._pending[user_ref] = minute
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def dump(self) -> List[List[Any]]:
+        """Resolved user_ref -> user_id entries (warm-state snapshots)."""
+        return self._ids.dump()
+
+    def load(self, entries: Iterable[List[Any]], age_seconds: float = 0.0) -> int:
+        """Restore ids resolved by a previous process: no upsert_user on their first visit."""
+        return self._ids.load(entries, age_seconds)
+
+    def flush(self) -> int:
+        """Write pending last-seen stamps in one batch. Returns rows written."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+        rows = [{"chatgpt_user_ref": ref, "last_seen_at": ts} for ref, ts in batch.items()]
+        try:
+            self.db.touch_users(rows)
+        except Exception:
+            with self._lock:
+                # keep whichever stamp is newer for the next attempt
+                for ref, ts in batch.items():
+                    if self._pending.get(ref, "") < ts:
+                        self._pending[ref] = ts
+            return 0
+        with self._lock:
+            if len(self._last_written) > 200_000:
+                self._last_written.clear()
+            self._last_written.update(batch)
+        return len(rows)
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="luna-last-seen", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
@@ -7,7 +7,7 @@ import os
 import re
 import time
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
 # Heuristic: flag likely specific venue/proper noun names.
 # Goal: prevent "Mario's Wine Bar" style hallucinations in Track A.
@@ -81,6 +81,26 @@ class SimpleTTLCache:
             self._d.clear()
         self._d[key] = (time.time() + self.ttl, value)
 
+    def pop(self, key: str) -> None:
+        self._d.pop(key, None)
+
+    def dump(self) -> List[List[Any]]:
+        """Live entries as [key, seconds_left, value] (for warm-state snapshots)."""
+        now = time.time()
+        return [[k, round(exp - now, 1), v] for k, (exp, v) in list(self._d.items()) if exp > now]
+
+    def load(self, entries: Iterable[List[Any]], age_seconds: float = 0.0) -> int:
+        """Restore dump() output taken `age_seconds` ago; expired and present keys are skipped."""
+        now = time.time()
+        n = 0
+        for key, left, value in entries:
+            left = min(float(left) - age_seconds, float(self.ttl))
+            if left <= 0 or key in self._d or len(self._d) >= self.max:
+                continue
+            self._d[key] = (now + left, value)
+            n += 1
+        return n
+
 def env_bool(name: str, default: bool = False) -> bool:
     v = os.getenv(name)
     if v is None:
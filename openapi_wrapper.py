@@ -3,275 +3,341 @@ OpenAPI REST wrapper for Luna Track A MCP Server.
 This allows ChatGPT Custom GPTs to call Luna tools via Actions.
 
 Run with: uvicorn openapi_wrapper:app --host 0.0.0.0 --port 8001
+(or `uvicorn asgi:app` to serve REST + MCP from one process)
 """
 
 import os
-import json
-from typing import Any, Dict, Optional
-from fastapi import FastAPI, HTTPException
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, FastAPI, Header, Query, Request
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, model_validator
+from pydantic_core import PydanticCustomError
 
-from luna.db import SupabaseDB
-from luna.models import ArchetypeProfile, DateOpsPlan, LunaEvent, ToolMeta, model_dump
-from luna.ratelimit import RateLimiter
-from luna.util import utc_now_iso, env_bool, looks_like_specific_venue
+from luna.errors import LunaError
+from luna.limits import BodySizeLimitMiddleware
+from luna.models import ArchetypeProfile, DateOpsPlan, LunaEvent
+from luna.service import ServiceResult, get_service
+from luna.util import utc_now_iso
 
-# ---- Config ----
-SUPABASE_URL = os.getenv("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "") or os.getenv("SUPABASE_KEY", "")
-LUNA_RATE_LIMIT_PER_MIN = int(os.getenv("LUNA_RATE_LIMIT_PER_MIN", "60"))
-LUNA_RATE_LIMIT_BURST = int(os.getenv("LUNA_RATE_LIMIT_BURST", "30"))
+# Responses at least this large are gzip-compressed when the client accepts it (0 = off)
+LUNA_GZIP_MIN_BYTES = int(os.getenv("LUNA_GZIP_MIN_BYTES", "1000"))
+# Request bodies over these sizes get 413 before they are parsed (0 = no limit).
+# The batch cap also covers /mcp when asgi.py mounts the MCP transport here.
+LUNA_MAX_BODY_BYTES = int(os.getenv("LUNA_MAX_BODY_BYTES", "65536"))
+LUNA_MAX_BATCH_BODY_BYTES = int(os.getenv("LUNA_MAX_BATCH_BODY_BYTES", "262144"))
 
-# Initialize
-db: Optional[SupabaseDB] = None
-if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
-    db = SupabaseDB(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# Same process-wide service as server.py: one DB client, limiter and spool.
+svc = get_service()
+svc.start_warmup()
 
-rate_limiter = RateLimiter(rate_per_minute=LUNA_RATE_LIMIT_PER_MIN, burst=LUNA_RATE_LIMIT_BURST)
+router = APIRouter()
 
-app = FastAPI(
-    title="Luna Track A API",
-    description="Relationship OS API - Store archetypes, DateOps plans, and track events. ChatGPT does reasoning; this API validates and stores.",
-    version="1.0.0",
-    servers=[{"url": "https://luna-track-a-production.up.railway.app"}]
-)
+# LunaError code -> HTTP status (anything else: 503 if retryable, 400 otherwise)
+_STATUS_BY_CODE = {
+    "RATE_LIMITED": 429,
+    "DB_NOT_CONFIGURED": 503,
+    "NOT_FOUND": 404,
+    "FORBIDDEN": 403,
+    "PROFILE_BUSY": 409,
+    "OVERLOADED": 503,
+    "UNKNOWN_FIELDS": 422,
+}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["https://chat.openai.com", "https://chatgpt.com"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
+def _rest(result: ServiceResult) -> Dict[str, Any]:
+    return {**result.body, "warnings": result.warnings, "generated_at": utc_now_iso()}
 
-def _require_db() -> SupabaseDB:
-    if not db:
-        raise HTTPException(status_code=503, detail="Database not configured")
-    return db
 
+def _projection(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
 
-def _check_rate_limit(user_ref: str, cost: int = 1):
-    if not rate_limiter.allow(user_ref, cost):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+_COMPACT_QUERY = Query(default=None, description="Return only ack, IDs, source_hash and warnings")
+_FIELDS_QUERY = Query(default=None, description="Comma-separated (dotted) fields to return, e.g. profile.tagline,card_copy")
 
 
 # ---- Request Models ----
+# Request envelopes reject unknown top-level keys (422 UNKNOWN_FIELDS) instead of silently
+# dropping them, and do so before the nested archetype / plan is validated.
+class _Strict(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _reject_unknown_keys(cls, data: Any) -> Any:
+        if isinstance(data, dict):
+            unknown = data.keys() - cls.model_fields.keys()
+            if unknown:
+                fields = ", ".join(sorted(map(str, unknown)))
+                raise PydanticCustomError("unknown_fields", "Unknown top-level fields: {fields}", {"fields": fields})
+        return data
+
+
 class HealthResponse(BaseModel):
     ok: bool
     db_configured: bool
 
 
-class ConsentRequest(BaseModel):
+class ConsentRequest(_Strict):
     user_ref: str
     consent_version: str
 
 
-class OptOutRequest(BaseModel):
+class OptOutRequest(_Strict):
     user_ref: str
     opt_out: bool
 
 
-class StoreArchetypeRequest(BaseModel):
+class StoreArchetypeRequest(_Strict):
     user_ref: str
     archetype: ArchetypeProfile
 
 
-class StoreDateOpsRequest(BaseModel):
+class StoreDateOpsRequest(_Strict):
     user_ref: str
+    city: str = "unspecified"
     plan: DateOpsPlan
 
 
-class LogEventRequest(BaseModel):
+class LogEventRequest(_Strict):
     user_ref: str
     event: LunaEvent
 
 
+class LogEventsRequest(_Strict):
+    user_ref: str
+    events: List[LunaEvent]
+
+
+class FeedbackRequest(_Strict):
+    user_ref: str
+    rating: Optional[int] = None
+    tags: Optional[list] = None
+    notes: Optional[str] = None
+    date_plan_id: Optional[str] = None
+
+
 # ---- Endpoints ----
-@app.get("/api/health", tags=["Health"])
-async def health() -> Dict[str, Any]:
-    """Check server health and database connection."""
-    ok = bool(db and db.ping())
-    return {
-        "ok": ok,
-        "db_configured": bool(db),
-        "generated_at": utc_now_iso()
-    }
-
-
-@app.post("/api/consent", tags=["User"])
+@router.get("/api/health", tags=["Health"])
+async def health(deep: bool = False) -> Dict[str, Any]:
+    """
+    Server health from the background prober (DB latency, breaker, spool depth,
+    last success). Constant time; ?deep=1 runs a live database check on the DB pool.
+    """
+    if deep:
+        return _rest(await svc.run("health", deep=True))
+    return _rest(svc.health())
+
+
+@router.get("/api/live", tags=["Health"])
+async def live() -> Dict[str, Any]:
+    """Liveness probe: the process is up. Never touches the database."""
+    return svc.liveness()
+
+
+@router.get("/api/ready", tags=["Health"])
+async def ready(response: Response) -> Dict[str, Any]:
+    """Readiness probe: 503 until warm-up has finished (bounded by LUNA_WARMUP_TIMEOUT_SECONDS)."""
+    body = svc.readiness()
+    if not body["ready"]:
+        response.status_code = 503
+    return body
+
+
+@router.post("/api/consent", tags=["User"])
 async def accept_consent(req: ConsentRequest) -> Dict[str, Any]:
     """Record user consent for data storage."""
-    _check_rate_limit(req.user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(req.user_ref)
-    d.sb.table("users").update({
-        "consent_version": req.consent_version,
-        "updated_at": utc_now_iso()
-    }).eq("id", user_id).execute()
-
-    return {
-        "status": "accepted",
-        "consent_version": req.consent_version,
-        "generated_at": utc_now_iso()
-    }
-
-
-@app.post("/api/opt-out", tags=["User"])
+    return _rest(await svc.run("accept_consent", req.user_ref, req.consent_version))
+
+
+@router.post("/api/opt-out", tags=["User"])
 async def set_opt_out(req: OptOutRequest) -> Dict[str, Any]:
     """Set data opt-out preference."""
-    _check_rate_limit(req.user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(req.user_ref)
-    d.set_opt_out(user_id, req.opt_out)
+    return _rest(await svc.run("set_opt_out", req.user_ref, req.opt_out))
 
-    return {
-        "opt_out": req.opt_out,
-        "generated_at": utc_now_iso()
-    }
 
-
-@app.post("/api/archetype", tags=["Archetype"])
-async def store_archetype(req: StoreArchetypeRequest) -> Dict[str, Any]:
+@router.post("/api/archetype", tags=["Archetype"])
+async def store_archetype(
+    req: StoreArchetypeRequest,
+    compact: Optional[bool] = _COMPACT_QUERY,
+    fields: Optional[str] = _FIELDS_QUERY,
+) -> Dict[str, Any]:
     """
     Store a validated archetype profile (Lite or Deep).
     ChatGPT generates the archetype; this endpoint validates and stores it.
     """
-    _check_rate_limit(req.user_ref, cost=2)
-    d = _require_db()
-    user_id = d.upsert_user(req.user_ref)
-
-    # Check opt-out
-    res = d.sb.table("users").select("data_opt_out").eq("id", user_id).limit(1).execute()
-    user_row = res.data[0] if res.data else {}
-
-    if user_row.get("data_opt_out"):
-        return {
-            "stored": False,
-            "reason": "opted_out",
-            "profile": model_dump(req.archetype),
-            "generated_at": utc_now_iso()
-        }
-
-    # Store archetype
-    archetype_id = d.upsert_archetype(user_id, model_dump(req.archetype))
-
-    return {
-        "stored": True,
-        "archetype_id": archetype_id,
-        "profile": model_dump(req.archetype),
-        "generated_at": utc_now_iso()
-    }
-
-
-@app.post("/api/dateops", tags=["DateOps"])
-async def store_dateops_plan(req: StoreDateOpsRequest) -> Dict[str, Any]:
+    return _rest(await svc.run("store_archetype", req.user_ref, req.archetype, compact=compact, projection=_projection(fields)))
+
+
+@router.post("/api/dateops", tags=["DateOps"])
+async def store_dateops_plan(
+    req: StoreDateOpsRequest,
+    compact: Optional[bool] = _COMPACT_QUERY,
+    fields: Optional[str] = _FIELDS_QUERY,
+) -> Dict[str, Any]:
     """
     Store a DateOps plan with venue criteria.
     ChatGPT generates the plan; this endpoint validates and stores it.
+    Plans containing specific venue names come back with reason=venue_name_detected.
     """
-    _check_rate_limit(req.user_ref, cost=2)
-    d = _require_db()
-    user_id = d.upsert_user(req.user_ref)
-
-    # Check for specific venue names (not allowed)
-    plan_dict = model_dump(req.plan)
-    if looks_like_specific_venue(json.dumps(plan_dict)):
-        raise HTTPException(
-            status_code=400,
-            detail="Plan contains specific venue names. Use criteria only, not venue names."
-        )
-
-    # Check opt-out
-    res = d.sb.table("users").select("data_opt_out").eq("id", user_id).limit(1).execute()
-    user_row = res.data[0] if res.data else {}
-
-    if user_row.get("data_opt_out"):
-        return {
-            "stored": False,
-            "reason": "opted_out",
-            "plan": plan_dict,
-            "generated_at": utc_now_iso()
-        }
-
-    plan_id = d.upsert_dateops_plan(user_id, plan_dict)
-
-    return {
-        "stored": True,
-        "plan_id": plan_id,
-        "plan": plan_dict,
-        "generated_at": utc_now_iso()
-    }
-
-
-@app.post("/api/event", tags=["Events"])
+    return _rest(await svc.run("store_dateops_plan", req.user_ref, req.city, req.plan, compact=compact, projection=_projection(fields)))
+
+
+@router.post("/api/event", tags=["Events"])
 async def log_event(req: LogEventRequest) -> Dict[str, Any]:
     """
     Log a relationship event (date, conversation milestone, etc.).
     """
-    _check_rate_limit(req.user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(req.user_ref)
+    return _rest(await svc.run("log_event", req.user_ref, req.event))
 
-    # Check opt-out
-    res = d.sb.table("users").select("data_opt_out").eq("id", user_id).limit(1).execute()
-    user_row = res.data[0] if res.data else {}
 
-    if user_row.get("data_opt_out"):
-        return {
-            "stored": False,
-            "reason": "opted_out",
-            "event": model_dump(req.event),
-            "generated_at": utc_now_iso()
-        }
+@router.post("/api/events/batch", tags=["Events"])
+async def log_events(req: LogEventsRequest) -> Dict[str, Any]:
+    """
+    Log a burst of events in one request. Returns per-event status.
+    """
+    return _rest(await svc.run("log_events", req.user_ref, req.events))
 
-    event_id = d.insert_event(user_id, model_dump(req.event))
 
-    return {
-        "stored": True,
-        "event_id": event_id,
-        "event": model_dump(req.event),
-        "generated_at": utc_now_iso()
-    }
+@router.post("/api/feedback", tags=["Feedback"])
+async def submit_feedback(req: FeedbackRequest) -> Dict[str, Any]:
+    """Best-effort post-date feedback."""
+    return _rest(await svc.run(
+        "submit_feedback",
+        req.user_ref,
+        rating=req.rating,
+        tags=req.tags,
+        notes=req.notes,
+        date_plan_id=req.date_plan_id,
+    ))
 
 
-@app.get("/api/archetype/{user_ref}", tags=["Archetype"])
+@router.get("/api/archetype/{user_ref}", tags=["Archetype"])
 async def get_archetype(user_ref: str) -> Dict[str, Any]:
     """Retrieve the latest archetype for a user."""
-    _check_rate_limit(user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-
-    res = d.sb.table("archetypes").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(1).execute()
+    return _rest(await svc.run("get_latest_archetype", user_ref))
 
-    if not res.data:
-        return {"found": False, "archetype": None}
 
-    return {
-        "found": True,
-        "archetype": res.data[0].get("profile_json", {}),
-        "generated_at": utc_now_iso()
-    }
+@router.get("/api/archetype/{user_ref}/benchmarks", tags=["Archetype"])
+async def get_archetype_benchmarks(user_ref: str, level: Optional[str] = None) -> Dict[str, Any]:
+    """Aggregate cohort benchmarks for the user's latest archetype."""
+    return _rest(await svc.run("get_archetype_benchmarks", user_ref, level))
 
 
-@app.get("/api/dateops/{user_ref}", tags=["DateOps"])
+@router.get("/api/dateops/{user_ref}", tags=["DateOps"])
 async def get_dateops(user_ref: str) -> Dict[str, Any]:
     """Retrieve the latest DateOps plan for a user."""
-    _check_rate_limit(user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
+    return _rest(await svc.run("get_latest_dateops", user_ref))
 
-    res = d.sb.table("dateops_plans").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(1).execute()
 
-    if not res.data:
-        return {"found": False, "plan": None}
+@router.get("/api/dateops/{user_ref}/insights", tags=["DateOps"])
+async def get_criteria_insights(user_ref: str, city: str, limit: int = 10) -> Dict[str, Any]:
+    """Best-rated criteria and common debrief tags for a city (aggregates)."""
+    return _rest(await svc.run("get_criteria_insights", user_ref, city, limit=limit))
 
-    return {
-        "found": True,
-        "plan": res.data[0].get("plan_json", {}),
-        "generated_at": utc_now_iso()
-    }
+
+@router.get("/api/export/{user_ref}", tags=["User"])
+async def export_user_data(user_ref: str) -> StreamingResponse:
+    """
+    Stream everything stored for a user as NDJSON: a header line, one {"table", "row"}
+    line per stored row, and a trailer with per-table counts. Memory stays constant
+    however long the history is. An unknown user_ref yields an export with zero rows.
+    Page reads run on the DB pool like any other read.
+    """
+    lines = await svc.run("export_user_data", user_ref)
+    return StreamingResponse(
+        svc.stream_export(lines),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="luna-export.ndjson"'},
+    )
+
+
+# ---- Admin (profiling) ----
+# 404 unless LUNA_ADMIN_TOKEN is set; every call needs it in X-Luna-Admin-Token.
+# Kept out of the OpenAPI schema so GPT Actions never see these routes.
+_ADMIN_TOKEN = Header(default=None, alias="X-Luna-Admin-Token")
+
+
+@router.get("/api/admin/profile", include_in_schema=False)
+async def admin_profile_status(token: Optional[str] = _ADMIN_TOKEN) -> Dict[str, Any]:
+    """Sampler state, per-tool timings, armed captures and recently written files."""
+    return _rest(svc.profile_status(token))
+
+
+@router.post("/api/admin/profile/sample", include_in_schema=False)
+async def admin_profile_sample(seconds: float = 30.0, interval_ms: float = 10.0, token: Optional[str] = _ADMIN_TOKEN) -> Dict[str, Any]:
+    """Start a background sampling profile; collapsed stacks are written when it ends."""
+    return _rest(svc.start_profile(token, seconds=seconds, interval_ms=interval_ms))
+
+
+@router.post("/api/admin/profile/tool/{tool}", include_in_schema=False)
+async def admin_profile_tool(tool: str, calls: int = 1, token: Optional[str] = _ADMIN_TOKEN) -> Dict[str, Any]:
+    """cProfile the next `calls` calls of a tool listed in LUNA_PROFILE_TOOLS."""
+    return _rest(svc.arm_tool_profile(token, tool, calls=calls))
+
+
+@router.post("/api/admin/memory/snapshot", include_in_schema=False)
+async def admin_memory_snapshot(top: int = 25, token: Optional[str] = _ADMIN_TOKEN) -> Dict[str, Any]:
+    """tracemalloc top allocators and growth since the previous snapshot."""
+    return _rest(svc.memory_snapshot(token, top=top))
+
+
+async def _luna_error_handler(request: Request, exc: LunaError) -> JSONResponse:
+    status = _STATUS_BY_CODE.get(exc.code, 503 if exc.retryable else 400)
+    headers = {"Retry-After": "1"} if exc.code == "OVERLOADED" else None
+    return JSONResponse(status_code=status, content=exc.to_payload(), headers=headers)
+
+
+async def _validation_error_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
+    """Unknown top-level fields get the LunaError envelope; other 422s keep FastAPI's shape."""
+    for err in exc.errors():
+        if err.get("type") == "unknown_fields":
+            fields = str((err.get("ctx") or {}).get("fields", ""))
+            return await _luna_error_handler(request, LunaError(
+                "UNKNOWN_FIELDS", err.get("msg", "Unknown top-level fields"), {"fields": fields.split(", ") if fields else []},
+            ))
+    return await request_validation_exception_handler(request, exc)
+
+
+def create_app(*, lifespan: Any = None) -> FastAPI:
+    """Build the REST app. asgi.py passes the MCP transport's lifespan to co-host it."""
+    api = FastAPI(
+        title="Luna Track A API",
+        description="Relationship OS API - Store archetypes, DateOps plans, and track events. ChatGPT does reasoning; this API validates and stores.",
+        version="1.0.0",
+        servers=[{"url": "https://luna-track-a-production.up.railway.app"}],
+        lifespan=lifespan,
+    )
+    # Middleware added later wraps earlier ones. The body-size guard goes first (innermost)
+    # so oversized bodies still never reach JSON parsing / validation, while its 413
+    # passes back through CORS and carries the headers browsers need to read it.
+    api.add_middleware(
+        BodySizeLimitMiddleware,
+        max_bytes=LUNA_MAX_BODY_BYTES,
+        overrides={"/api/events/batch": LUNA_MAX_BATCH_BODY_BYTES, "/mcp": LUNA_MAX_BATCH_BODY_BYTES},
+    )
+    if LUNA_GZIP_MIN_BYTES > 0:
+        api.add_middleware(GZipMiddleware, minimum_size=LUNA_GZIP_MIN_BYTES)
+    api.add_middleware(
+        CORSMiddleware,
+        allow_origins=["https://chat.openai.com", "https://chatgpt.com"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    api.add_exception_handler(LunaError, _luna_error_handler)
+    api.add_exception_handler(RequestValidationError, _validation_error_handler)
+    api.include_router(router)
+    return api
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+-- Luna Track A — single-call store RPCs (apply after schema.sql)
+-- Purpose: store_archetype / store_dateops_plan in ONE round-trip and ONE transaction:
+--   user upsert -> consent / opt-out gate -> idempotent upsert (+ content_blobs) -> event row.
+-- Used when LUNA_STORE_RPC=true. Safe to re-run (create or replace).
+
+begin;
+
+-- ------------------------------------------------------------
+-- Helper: user row for a write, created on first sighting.
+-- FOR SHARE makes a concurrent opt-out / consent change wait for (or be seen by)
+-- the store, so the gate decision and the write commit together.
+-- ------------------------------------------------------------
+create or replace function luna_user_for_write(p_user_ref text)
+returns users
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_user users;
+begin
+  select * into v_user from users where chatgpt_user_ref = p_user_ref for share;
+  if not found then
+    insert into users(chatgpt_user_ref, last_seen_at, updated_at)
+    values (p_user_ref, now(), now())
+    on conflict (chatgpt_user_ref) do update set last_seen_at = excluded.last_seen_at
+    returning * into v_user;
+  end if;
+  return v_user;
+end;
+$$;
+
+-- Gate outcome: null = storage allowed.
+create or replace function luna_block_reason(p_user users, p_require_consent boolean)
+returns text
+language sql
+immutable
+as $$
+  select case
+    when p_user.data_opt_out then 'opted_out'
+    when coalesce(p_require_consent, false) and p_user.consent_version is null then 'consent_required'
+  end;
+$$;
+
+-- p_blobs: [{"hash", "body", "size_bytes"}] for packed fields (LUNA_BLOB_MIN_BYTES)
+create or replace function luna_put_blobs(p_user_id uuid, p_blobs jsonb)
+returns void
+language sql
+set search_path = public
+as $$
+  insert into content_blobs(hash, user_id, body, size_bytes)
+  select b->>'hash', p_user_id, b->'body', (b->>'size_bytes')::int
+  from jsonb_array_elements(coalesce(p_blobs, '[]'::jsonb)) as b
+  on conflict (hash) do nothing;
+$$;
+
+-- p_event: {"event_name", "event_id", "properties", "occurred_at"}; duplicates ignored
+create or replace function luna_put_event(p_user_id uuid, p_event jsonb)
+returns void
+language sql
+set search_path = public
+as $$
+  insert into event_log(user_id, event_name, event_id, properties, occurred_at)
+  select p_user_id,
+         p_event->>'event_name',
+         p_event->>'event_id',
+         coalesce(p_event->'properties', '{}'::jsonb),
+         coalesce((p_event->>'occurred_at')::timestamptz, now())
+  where p_event is not null
+  on conflict (user_id, event_id) do nothing;
+$$;
+
+-- ------------------------------------------------------------
+-- store_archetype
+-- Returns {"user_id", "id", "stored", "reason", "data_opt_out", "consent_version"}.
+-- ------------------------------------------------------------
+create or replace function luna_store_archetype(
+  p_user_ref text,
+  p_level text,
+  p_source_hash text,
+  p_archetype_json jsonb,
+  p_model_version text default null,
+  p_event jsonb default null,
+  p_blobs jsonb default '[]'::jsonb,
+  p_require_consent boolean default false
+)
+returns jsonb
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_user users;
+  v_reason text;
+  v_id uuid;
+begin
+  v_user := luna_user_for_write(p_user_ref);
+  v_reason := luna_block_reason(v_user, p_require_consent);
+  if v_reason is null then
+    perform luna_put_blobs(v_user.id, p_blobs);
+    insert into archetypes(user_id, level, source_hash, archetype_json, model_version)
+    values (v_user.id, p_level::archetype_level, p_source_hash, p_archetype_json, p_model_version)
+    on conflict (user_id, level, source_hash) do update
+      set archetype_json = excluded.archetype_json,
+          model_version = excluded.model_version
+    returning id into v_id;
+    perform luna_put_event(v_user.id, p_event);
+  end if;
+  return jsonb_build_object(
+    'user_id', v_user.id,
+    'id', v_id,
+    'stored', v_reason is null,
+    'reason', v_reason,
+    'data_opt_out', v_user.data_opt_out,
+    'consent_version', v_user.consent_version
+  );
+end;
+$$;
+
+-- ------------------------------------------------------------
+-- store_dateops_plan (venue-name screening stays in the server, before this call)
+-- With p_simhash / p_max_distance (LUNA_PLAN_DEDUP_DISTANCE), a near-duplicate among
+-- the user's 20 newest same-city plans is overwritten in place, source_hash included
+-- ('replaced': true, no event row). If another of the user's plans already has
+-- p_source_hash, that row is upserted instead. bit_count needs Postgres 14+. p_city_key: canonical city (LUNA_CITY_KEYS);
+-- when set, "same city" compares city_key ("Brooklyn, NY" matches "NYC"), falling back to the
+-- raw city for rows stored before city_key existed.
+-- ------------------------------------------------------------
+drop function if exists luna_store_date_plan(text, text, text, jsonb, jsonb, jsonb, boolean);
+drop function if exists luna_store_date_plan(text, text, text, jsonb, jsonb, jsonb, boolean, bigint, int);
+
+create or replace function luna_store_date_plan(
+  p_user_ref text,
+  p_source_hash text,
+  p_city text,
+  p_plan_json jsonb,
+  p_event jsonb default null,
+  p_blobs jsonb default '[]'::jsonb,
+  p_require_consent boolean default false,
+  p_simhash bigint default null,
+  p_max_distance int default null,
+  p_city_key text default null
+)
+returns jsonb
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_user users;
+  v_reason text;
+  v_id uuid;
+  v_replaced boolean := false;
+begin
+  v_user := luna_user_for_write(p_user_ref);
+  v_reason := luna_block_reason(v_user, p_require_consent);
+  if v_reason is null then
+    perform luna_put_blobs(v_user.id, p_blobs);
+    if p_simhash is not null and p_max_distance is not null then
+      select r.id into v_id
+      from (
+        select id, city, city_key, simhash from date_plans
+        where user_id = v_user.id
+        order by created_at desc
+        limit 20
+      ) r
+      where (case when p_city_key is not null and r.city_key is not null then r.city_key = p_city_key else r.city = p_city end)
+        and r.simhash is not null
+        and bit_count(int8send(r.simhash # p_simhash)) <= p_max_distance
+      order by bit_count(int8send(r.simhash # p_simhash))
+      limit 1;
+      if v_id is not null and exists (
+        select 1 from date_plans where user_id = v_user.id and source_hash = p_source_hash and id <> v_id
+      ) then
+        v_id := null;
+      end if;
+    end if;
+    if v_id is not null then
+      update date_plans
+        set source_hash = p_source_hash, city = p_city, city_key = coalesce(p_city_key, city_key),
+            plan_json = p_plan_json, simhash = p_simhash, created_at = now()
+        where id = v_id;
+      v_replaced := true;
+    else
+      insert into date_plans(user_id, source_hash, city, city_key, plan_json, simhash)
+      values (v_user.id, p_source_hash, p_city, p_city_key, p_plan_json, p_simhash)
+      on conflict (user_id, source_hash) do update
+        set city = excluded.city,
+            city_key = excluded.city_key,
+            plan_json = excluded.plan_json,
+            simhash = excluded.simhash
+      returning id into v_id;
+      perform luna_put_event(v_user.id, p_event);
+    end if;
+  end if;
+  return jsonb_build_object(
+    'user_id', v_user.id,
+    'id', v_id,
+    'stored', v_reason is null,
+    'reason', v_reason,
+    'replaced', v_replaced,
+    'data_opt_out', v_user.data_opt_out,
+    'consent_version', v_user.consent_version
+  );
+end;
+$$;
+
+-- Server-side only, like the tables (service_role bypasses RLS; nobody else may call these).
+revoke all on function luna_user_for_write(text) from public, anon, authenticated;
+revoke all on function luna_block_reason(users, boolean) from public, anon, authenticated;
+revoke all on function luna_put_blobs(uuid, jsonb) from public, anon, authenticated;
+revoke all on function luna_put_event(uuid, jsonb) from public, anon, authenticated;
+revoke all on function luna_store_archetype(text, text, text, jsonb, text, jsonb, jsonb, boolean) from public, anon, authenticated;
+revoke all on function luna_store_date_plan(text, text, text, jsonb, jsonb, jsonb, boolean, bigint, int, text) from public, anon, authenticated;
+grant execute on function luna_user_for_write(text) to service_role;
+grant execute on function luna_block_reason(users, boolean) to service_role;
+grant execute on function luna_put_blobs(uuid, jsonb) to service_role;
+grant execute on function luna_put_event(uuid, jsonb) to service_role;
+grant execute on function luna_store_archetype(text, text, text, jsonb, text, jsonb, jsonb, boolean) to service_role;
+grant execute on function luna_store_date_plan(text, text, text, jsonb, jsonb, jsonb, boolean, bigint, int, text) to service_role;
+
+insert into schema_version(version) values ('2026-10-19.luna_track_a.store_rpc')
+on conflict (version) do nothing;
+insert into schema_version(version) values ('2026-10-19.luna_track_a.plan_dedup_rpc')
+on conflict (version) do nothing;
+insert into schema_version(version) values ('2026-10-19.luna_track_a.city_key_rpc')
+on conflict (version) do nothing;
+insert into schema_version(version) values ('2026-10-19.luna_track_a.plan_replace_hash_rpc')
+on conflict (version) do nothing;
+insert into schema_version(version) values ('2026-10-19.luna_track_a.plan_dedup_city_key_rpc')
+on conflict (version) do nothing;
+
+commit;
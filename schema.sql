@@ -30,8 +30,14 @@ create table if not exists users (
   last_seen_at timestamptz
 );
 
+-- Background purge after opt-out (LUNA_PURGE_ON_OPT_OUT): progress survives restarts
+alter table users add column if not exists purge_requested_at timestamptz;
+alter table users add column if not exists purge_completed_at timestamptz;
+
 create index if not exists idx_users_created_at on users(created_at);
 create index if not exists idx_users_last_seen_at on users(last_seen_at);
+create index if not exists idx_users_purge_pending on users(purge_requested_at)
+  where purge_requested_at is not null and purge_completed_at is null;
 
 -- ------------------------------------------------------------
 -- 2) Archetypes (the moat)
@@ -57,6 +63,39 @@ create table if not exists archetypes (
 create index if not exists idx_archetypes_user_created on archetypes(user_id, created_at desc);
 create index if not exists idx_archetypes_level on archetypes(level);
 
+-- Analytics columns: hot archetype_json fields as stored generated columns, so dashboard
+-- and cohort queries group / filter on indexed columns instead of parsing JSONB per row.
+-- Postgres 12+. Adding them rewrites the table once under an exclusive lock (see
+-- DEPLOY.md). Top-level fields moved to content_blobs (LUNA_BLOB_MIN_BYTES) read as null.
+-- Labels are normalized like luna/cohort.py: trimmed, lowercased, whitespace collapsed.
+create or replace function luna_jsonb_labels(p jsonb)
+returns text[]
+language sql
+immutable
+parallel safe
+as $$
+  select case when jsonb_typeof(p) = 'array' then array(
+    select left(regexp_replace(lower(btrim(e)), '\s+', ' ', 'g'), 120)
+    from jsonb_array_elements_text(p) as e
+    where btrim(e) <> ''
+  ) end;
+$$;
+
+alter table archetypes
+  add column if not exists communication_style text generated always as (archetype_json->>'communication_style') stored,
+  add column if not exists conflict_style text generated always as (archetype_json->>'conflict_style') stored,
+  add column if not exists energy_level text generated always as (archetype_json->>'energy_level') stored,
+  add column if not exists schema_version text generated always as (archetype_json->>'schema_version') stored,
+  add column if not exists blind_spot_patterns text[]
+    generated always as (luna_jsonb_labels(archetype_json->'blind_spots'->'patterns')) stored;
+
+-- Latest archetype per (user, level) with its styles, answered from the index alone.
+create index if not exists idx_archetypes_user_level_latest on archetypes(user_id, level, created_at desc)
+  include (communication_style, conflict_style, energy_level);
+create index if not exists idx_archetypes_styles on archetypes(level, communication_style, conflict_style, energy_level);
+create index if not exists idx_archetypes_schema_version on archetypes(schema_version, created_at);
+create index if not exists idx_archetypes_blind_spots on archetypes using gin (blind_spot_patterns);
+
 -- ------------------------------------------------------------
 -- 3) DateOps plans (retention loop; criteria-only, no venues)
 -- ------------------------------------------------------------
@@ -74,6 +113,30 @@ create table if not exists date_plans (
 create index if not exists idx_date_plans_user_created on date_plans(user_id, created_at desc);
 create index if not exists idx_date_plans_city on date_plans(city);
 
+-- Near-duplicate detection (LUNA_PLAN_DEDUP_DISTANCE): 64-bit SimHash of the plan's
+-- criteria + text. The covering index answers "newest plans' (id, city, simhash)"
+-- from the index alone.
+alter table date_plans add column if not exists simhash bigint;
+create index if not exists idx_date_plans_user_simhash on date_plans(user_id, created_at desc) include (city, simhash);
+
+-- Canonical city (LUNA_CITY_KEYS): "NYC" / "New York" / "new york, ny" -> 'new-york',
+-- assigned at write time so per-city rollups are a plain indexed group-by.
+-- Backfill older rows with scripts/backfill_city_keys.py.
+alter table date_plans add column if not exists city_key text;
+create index if not exists idx_date_plans_city_key on date_plans(city_key, created_at);
+
+-- Analytics columns: primary venue criteria of plan_json (see the archetype columns
+-- above; null when primary_criteria was moved to content_blobs).
+alter table date_plans
+  add column if not exists category text
+    generated always as (regexp_replace(lower(btrim(plan_json->'primary_criteria'->>'category')), '\s+', ' ', 'g')) stored,
+  add column if not exists price_tier text generated always as (plan_json->'primary_criteria'->>'price_tier') stored,
+  add column if not exists noise_level text generated always as (plan_json->'primary_criteria'->>'noise_level') stored,
+  add column if not exists schema_version text generated always as (plan_json->>'schema_version') stored;
+
+create index if not exists idx_date_plans_criteria on date_plans(price_tier, noise_level, created_at);
+create index if not exists idx_date_plans_city_category on date_plans(city_key, category);
+
 -- ------------------------------------------------------------
 -- 4) Feedback (learning loop, still Track A-safe)
 -- ------------------------------------------------------------
@@ -107,6 +170,199 @@ create table if not exists event_log (
 create index if not exists idx_event_log_user_time on event_log(user_id, occurred_at desc);
 create index if not exists idx_event_log_name_time on event_log(event_name, occurred_at desc);
 
+-- ------------------------------------------------------------
+-- 6) Content-addressed JSON bodies
+-- Large top-level fields of archetype_json / plan_json (share_card_copy, blind_spots,
+-- compatibility, invite_text, ...) are stored once per distinct value and the row holds
+-- {"$blob": hash}. Hashes are scoped per user, so blobs are removed with the user.
+-- Enabled by LUNA_BLOB_MIN_BYTES > 0.
+-- ------------------------------------------------------------
+create table if not exists content_blobs (
+  hash text primary key,
+  user_id uuid not null references users(id) on delete cascade,
+  body jsonb not null,
+  size_bytes int not null,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists idx_content_blobs_user on content_blobs(user_id);
+
+-- ------------------------------------------------------------
+-- 7) Criteria insights (LUNA_CRITERIA_INSIGHTS)
+-- Rating sums / counts and tag frequencies per (city, category, noise, price) of the
+-- rated plan's primary criteria. Maintained by a trigger on feedback insert and
+-- delete (one keyed upsert / update per feedback row; purges subtract what they
+-- delete), so get_criteria_insights is a primary-key read instead of a feedback x
+-- date_plans.plan_json join. Feedback on a plan replaced since it was counted is
+-- subtracted from the plan's current bucket (clamped at zero);
+-- luna_rebuild_criteria_insights() recomputes exactly.
+-- ------------------------------------------------------------
+create table if not exists criteria_insights (
+  city_key text not null,
+  category text not null,
+  noise_level text not null,
+  price_tier text not null,
+  feedback_count int not null default 0,
+  rating_count int not null default 0,
+  rating_sum int not null default 0,
+  tag_counts jsonb not null default '{}'::jsonb,
+  updated_at timestamptz not null default now(),
+  primary key (city_key, category, noise_level, price_tier)
+);
+
+-- primary_criteria of a plan, following a content_blobs reference if it was packed
+create or replace function luna_plan_criteria(p_plan date_plans)
+returns jsonb
+language sql
+stable
+set search_path = public
+as $$
+  select case
+    when p_plan.plan_json->'primary_criteria' ? '$blob'
+      then (select body from content_blobs where hash = p_plan.plan_json->'primary_criteria'->>'$blob')
+    else p_plan.plan_json->'primary_criteria'
+  end;
+$$;
+
+create or replace function luna_feedback_insight()
+returns trigger
+language plpgsql
+set search_path = public
+as $$
+declare
+  v_row feedback;
+  v_sign int;
+  v_plan date_plans;
+  v_crit jsonb;
+  v_tags jsonb;
+  v_city_key text;
+  v_category text;
+  v_noise_level text;
+  v_price_tier text;
+begin
+  if tg_op = 'DELETE' then
+    v_row := old;
+    v_sign := -1;
+  else
+    v_row := new;
+    v_sign := 1;
+  end if;
+  if v_row.date_plan_id is null or (v_row.rating is null and coalesce(cardinality(v_row.tags), 0) = 0) then
+    return null;
+  end if;
+  -- Only the feedback author's own plans count. Purges delete feedback before date_plans.
+  select * into v_plan from date_plans where id = v_row.date_plan_id and user_id = v_row.user_id;
+  if not found then
+    return null;
+  end if;
+  v_crit := luna_plan_criteria(v_plan);
+  if v_crit is null then
+    return null;
+  end if;
+  v_city_key := coalesce(v_plan.city_key, lower(trim(v_plan.city)));
+  v_category := regexp_replace(lower(trim(coalesce(v_crit->>'category', ''))), '\s+', ' ', 'g');
+  v_noise_level := coalesce(v_crit->>'noise_level', '');
+  v_price_tier := coalesce(v_crit->>'price_tier', '');
+  select coalesce(jsonb_object_agg(tag, n), '{}'::jsonb) into v_tags
+  from (
+    select lower(trim(t)) as tag, count(*) as n
+    from unnest(v_row.tags) as t
+    where trim(t) <> '' and length(trim(t)) <= 40
+    group by 1
+  ) s;
+  if v_sign > 0 then
+    insert into criteria_insights as ci
+      (city_key, category, noise_level, price_tier, feedback_count, rating_count, rating_sum, tag_counts)
+    values (
+      v_city_key, v_category, v_noise_level, v_price_tier,
+      1,
+      (v_row.rating is not null)::int,
+      coalesce(v_row.rating, 0),
+      v_tags
+    )
+    on conflict (city_key, category, noise_level, price_tier) do update set
+      feedback_count = ci.feedback_count + 1,
+      rating_count = ci.rating_count + excluded.rating_count,
+      rating_sum = ci.rating_sum + excluded.rating_sum,
+      tag_counts = (
+        select coalesce(jsonb_object_agg(k, coalesce((ci.tag_counts->>k)::int, 0) + coalesce((excluded.tag_counts->>k)::int, 0)), '{}'::jsonb)
+        from jsonb_object_keys(ci.tag_counts || excluded.tag_counts) as k
+      ),
+      updated_at = now();
+  else
+    -- Clamped at zero: the plan may have been replaced since the feedback was counted.
+    update criteria_insights as ci set
+      feedback_count = greatest(ci.feedback_count - 1, 0),
+      rating_count = greatest(ci.rating_count - (v_row.rating is not null)::int, 0),
+      rating_sum = greatest(ci.rating_sum - coalesce(v_row.rating, 0), 0),
+      tag_counts = (
+        select coalesce(jsonb_object_agg(k, n), '{}'::jsonb)
+        from (
+          select k, coalesce((ci.tag_counts->>k)::int, 0) - coalesce((v_tags->>k)::int, 0) as n
+          from jsonb_object_keys(ci.tag_counts) as k
+        ) s
+        where n > 0
+      ),
+      updated_at = now()
+    where ci.city_key = v_city_key and ci.category = v_category
+      and ci.noise_level = v_noise_level and ci.price_tier = v_price_tier;
+    delete from criteria_insights
+    where city_key = v_city_key and category = v_category
+      and noise_level = v_noise_level and price_tier = v_price_tier
+      and feedback_count = 0;
+  end if;
+  return null;
+exception when others then
+  -- Insights are best-effort: never fail the feedback write or purge, but leave a trace.
+  raise warning 'luna_feedback_insight: % (%)', sqlerrm, sqlstate;
+  return null;
+end;
+$$;
+
+drop trigger if exists trg_feedback_insight on feedback;
+create trigger trg_feedback_insight
+  after insert or delete on feedback
+  for each row execute function luna_feedback_insight();
+
+-- Full recompute from the current feedback rows (backfill, or to correct drift).
+create or replace function luna_rebuild_criteria_insights()
+returns void
+language sql
+set search_path = public
+as $$
+  delete from criteria_insights;
+  with keyed as (
+    select
+      coalesce(p.city_key, lower(trim(p.city))) as city_key,
+      regexp_replace(lower(trim(coalesce(c->>'category', ''))), '\s+', ' ', 'g') as category,
+      coalesce(c->>'noise_level', '') as noise_level,
+      coalesce(c->>'price_tier', '') as price_tier,
+      f.rating,
+      f.tags
+    from feedback f
+    join date_plans p on p.id = f.date_plan_id and p.user_id = f.user_id
+    cross join lateral luna_plan_criteria(p) as c
+    where c is not null and (f.rating is not null or coalesce(cardinality(f.tags), 0) > 0)
+  ),
+  tag_counts as (
+    select city_key, category, noise_level, price_tier, jsonb_object_agg(tag, n) as tag_counts
+    from (
+      select city_key, category, noise_level, price_tier, lower(trim(t)) as tag, count(*) as n
+      from keyed, unnest(keyed.tags) as t
+      where trim(t) <> '' and length(trim(t)) <= 40
+      group by 1, 2, 3, 4, 5
+    ) s
+    group by 1, 2, 3, 4
+  )
+  insert into criteria_insights
+    (city_key, category, noise_level, price_tier, feedback_count, rating_count, rating_sum, tag_counts)
+  select k.city_key, k.category, k.noise_level, k.price_tier,
+         count(*), count(k.rating), coalesce(sum(k.rating), 0), coalesce(t.tag_counts, '{}'::jsonb)
+  from keyed k
+  left join tag_counts t using (city_key, category, noise_level, price_tier)
+  group by k.city_key, k.category, k.noise_level, k.price_tier, t.tag_counts;
+$$;
+
 -- ------------------------------------------------------------
 -- RLS (locked down; server uses service_role anyway)
 -- ------------------------------------------------------------
@@ -115,6 +371,8 @@ alter table archetypes enable row level security;
 alter table date_plans enable row level security;
 alter table feedback enable row level security;
 alter table event_log enable row level security;
+alter table content_blobs enable row level security;
+alter table criteria_insights enable row level security;
 
 -- Deny everything by default (no policies) - intended for service_role access only.
 
@@ -0,0 +1,52 @@
+"""
+Fill date_plans.city_key for plans stored before LUNA_CITY_KEYS was enabled.
+
+Uses the same alias table as the server (plus LUNA_CITY_ALIASES_FILE, if set).
+Only rows with no key are touched; --dry-run shows the mapping for one batch.
+"""
+import argparse
+import os
+from collections import defaultdict
+
+from luna.cities import CityIndex
+from luna.db import SupabaseDB
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    url = os.getenv("SUPABASE_URL", "")
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "") or os.getenv("SUPABASE_KEY", "")
+    if not url or not key:
+        raise SystemExit("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
+    db = SupabaseDB(url, key)
+    aliases = os.getenv("LUNA_CITY_ALIASES_FILE", "")
+    cities = CityIndex.from_file(aliases) if aliases else CityIndex()
+
+    total = 0
+    keys = defaultdict(int)
+    while True:
+        rows = db.date_plans_missing_city_key(limit=args.batch)
+        if not rows:
+            break
+        by_key = defaultdict(list)
+        for r in rows:
+            by_key[cities.key(r.get("city") or "")].append(r["id"])
+        for city_key, ids in by_key.items():
+            keys[city_key] += len(ids)
+            if not args.dry_run:
+                db.set_city_key(city_key=city_key, plan_ids=ids)
+        total += len(rows)
+        if args.dry_run or len(rows) < args.batch:
+            break
+
+    print(f"plans: {total}  distinct city keys: {len(keys)}")
+    for city_key, n in sorted(keys.items(), key=lambda kv: -kv[1])[:20]:
+        print(f"  {city_key:<24} {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+Load generator: simulated ChatGPT sessions replaying the SYSTEM_PROMPT.md flows.
+
+  lite    : log_events(app_open, quiz_started, quiz_completed) -> store_archetype -> get_user_snapshot
+  dateops : log_events(dateops_started) -> store_dateops_plan -> submit_feedback
+
+Each simulated user runs one session against the MCP streamable HTTP transport
+(`/mcp`, one MCP session per user) or the REST wrapper (`/api/...`). Without
+--base-url a local `uvicorn asgi:app` is started with LUNA_DB_BACKEND=memory, so
+no Supabase is needed.
+
+Reports throughput, latency percentiles per step, rate-limit and overload
+rejections, errors and spool growth (from /api/health).
+
+Usage:
+  python scripts/loadgen.py --users 2000 --concurrency 200
+  python scripts/loadgen.py --target rest --users 500 --mix lite=1
+  python scripts/loadgen.py --base-url http://localhost:8000 --target both
+  python scripts/loadgen.py --db-latency-ms 20 --workers 2
+  python scripts/loadgen.py --faults scripts/faults.example.json --think-ms 2000 --sample-every 1
+
+With --faults the local server runs the fault-injection scenario (luna/faults.py) and
+--sample-every records a spool / breaker timeline, so recovery after an outage window
+(spool back to zero, breaker closed) can be read off the report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_MCP_HEADERS = {"accept": "application/json, text/event-stream", "content-type": "application/json"}
+
+
+# ---- session payloads ----
+
+def _archetype(rng: random.Random) -> Dict[str, Any]:
+    n = rng.randint(3, 5)
+    return {
+        "level": "lite",
+        "archetype_name": rng.choice(["Quiet Strategist", "Warm Spark", "Slow Burner", "Playful Skeptic"]),
+        "tagline": "Plans three moves ahead, says half of them out loud.",
+        "energy_level": rng.choice(["Low-Key", "Moderate", "High-Voltage"]),
+        "communication_style": rng.choice(["Direct", "Storyteller", "Reflective", "Debater", "Avoidant"]),
+        "conflict_style": rng.choice(["Repair-Fast", "Slow-to-Warm", "Avoidant", "Escalator", "Stonewall"]),
+        "traits": [
+            {"label": f"trait {rng.randint(1, 40)}", "score": rng.randint(1, 10), "evidence": "Said they plan dates days ahead."}
+            for _ in range(n)
+        ],
+        "blind_spots": {"patterns": rng.sample(["waits too long to text", "over-plans", "hides interest", "tests people"], 2)},
+        "share_card_copy": f"**{uuid.uuid4().hex[:8]}** You date like you play chess: patient, observant, occasionally too quiet.",
+        "source": "text_quiz",
+    }
+
+
+def _plan(rng: random.Random) -> Dict[str, Any]:
+    criteria = {"category": "wine bar", "vibe_required": "low light, room to talk", "noise_level": "Quiet", "price_tier": "$$"}
+    return {
+        "plan_name": f"Thursday reset {rng.randint(1, 999)}",
+        "suggested_time": "Thursday 7pm",
+        "constraints_summary": "Quiet, mid-budget, easy exit after one drink.",
+        "primary_criteria": criteria,
+        "backup_criteria": {**criteria, "category": "tea house"},
+        "invite_text": "Low-key drink on thursday? I know the kind of place we both like.",
+        "conversation_hooks": ["worst travel story", "most overrated food"],
+    }
+
+
+def _events(names: List[str]) -> List[Dict[str, Any]]:
+    return [{"event_name": n, "event_id": uuid.uuid4().hex, "properties": {"src": "loadgen"}} for n in names]
+
+
+# ---- transports ----
+
+class Stats:
+    def __init__(self) -> None:
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.sessions = 0
+
+    def record(self, step: str, ms: float, outcome: str) -> None:
+        self.latency[step].append(ms)
+        self.outcomes[step][outcome] += 1
+
+
+def _outcome_from_text(text: str) -> str:
+    if "RATE_LIMITED" in text:
+        return "rate_limited"
+    return "overloaded" if "OVERLOADED" in text else "error"
+
+
+class RestClient:
+    def __init__(self, http: httpx.AsyncClient, stats: Stats):
+        self.http, self.stats = http, stats
+
+    async def _call(self, step: str, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            r = await self.http.request(method, path, json=body)
+            ms = (time.perf_counter() - t0) * 1000
+            if r.status_code == 200:
+                self.stats.record(step, ms, "ok")
+                return r.json()
+            outcome = "rate_limited" if r.status_code == 429 else f"http_{r.status_code}"
+            if r.status_code == 503 and "OVERLOADED" in r.text:
+                outcome = "overloaded"
+            self.stats.record(step, ms, outcome)
+        except httpx.HTTPError:
+            self.stats.record(step, (time.perf_counter() - t0) * 1000, "transport_error")
+        return {}
+
+    async def open(self) -> None:
+        return None
+
+    async def log_events(self, user_ref: str, events: List[Dict[str, Any]]) -> None:
+        await self._call("log_events", "POST", "/api/events/batch", {"user_ref": user_ref, "events": events})
+
+    async def store_archetype(self, user_ref: str, archetype: Dict[str, Any]) -> None:
+        await self._call("store_archetype", "POST", "/api/archetype?compact=true", {"user_ref": user_ref, "archetype": archetype})
+
+    async def snapshot(self, user_ref: str) -> None:
+        # REST has no snapshot route; the latest-archetype read is the equivalent step.
+        await self._call("get_user_snapshot", "GET", f"/api/archetype/{user_ref}")
+
+    async def store_plan(self, user_ref: str, city: str, plan: Dict[str, Any]) -> Optional[str]:
+        body = await self._call("store_dateops_plan", "POST", "/api/dateops?compact=true", {"user_ref": user_ref, "city": city, "plan": plan})
+        return body.get("plan_id")
+
+    async def feedback(self, user_ref: str, date_plan_id: Optional[str]) -> None:
+        await self._call("submit_feedback", "POST", "/api/feedback", {"user_ref": user_ref, "rating": 4, "tags": ["fun"], "date_plan_id": date_plan_id})
+
+
+class McpClient:
+    """Minimal streamable-HTTP MCP client: initialize once, then tools/call."""
+    def __init__(self, http: httpx.AsyncClient, stats: Stats):
+        self.http, self.stats = http, stats
+        self.session_id: Optional[str] = None
+        self._id = 0
+
+    def _headers(self) -> Dict[str, str]:
+        h = dict(_MCP_HEADERS)
+        if self.session_id:
+            h["mcp-session-id"] = self.session_id
+        return h
+
+    @staticmethod
+    def _parse(r: httpx.Response) -> Dict[str, Any]:
+        if r.headers.get("content-type", "").startswith("text/event-stream"):
+            for line in r.text.splitlines():
+                if line.startswith("data:"):
+                    return json.loads(line[5:].strip())
+            return {}
+        return r.json() if r.content else {}
+
+    async def _rpc(self, method: str, params: Dict[str, Any], *, notify: bool = False) -> Tuple[int, Dict[str, Any]]:
+        msg: Dict[str, Any] = {"jsonrpc": "2.0", "method": method, "params": params}
+        if not notify:
+            self._id += 1
+            msg["id"] = self._id
+        r = await self.http.post("/mcp", json=msg, headers=self._headers())
+        if "mcp-session-id" in r.headers:
+            self.session_id = r.headers["mcp-session-id"]
+        return r.status_code, (self._parse(r) if not notify else {})
+
+    async def open(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            status, _ = await self._rpc("initialize", {
+                "protocolVersion": "2025-03-26", "capabilities": {}, "clientInfo": {"name": "luna-loadgen", "version": "1"},
+            })
+            await self._rpc("notifications/initialized", {}, notify=True)
+            self.stats.record("mcp_initialize", (time.perf_counter() - t0) * 1000, "ok" if status == 200 else f"http_{status}")
+        except httpx.HTTPError:
+            self.stats.record("mcp_initialize", (time.perf_counter() - t0) * 1000, "transport_error")
+
+    async def _tool(self, step: str, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            status, msg = await self._rpc("tools/call", {"name": name, "arguments": arguments})
+        except httpx.HTTPError:
+            self.stats.record(step, (time.perf_counter() - t0) * 1000, "transport_error")
+            return {}
+        ms = (time.perf_counter() - t0) * 1000
+        result = msg.get("result") or {}
+        if status != 200 or "error" in msg:
+            self.stats.record(step, ms, f"http_{status}" if status != 200 else "error")
+            return {}
+        if result.get("isError"):
+            text = " ".join(c.get("text", "") for c in result.get("content") or [])
+            self.stats.record(step, ms, _outcome_from_text(text))
+            return {}
+        self.stats.record(step, ms, "ok")
+        return (result.get("structuredContent") or {}).get("structuredContent") or {}
+
+    async def log_events(self, user_ref: str, events: List[Dict[str, Any]]) -> None:
+        await self._tool("log_events", "log_events", {"user_ref": user_ref, "events": events})
+
+    async def store_archetype(self, user_ref: str, archetype: Dict[str, Any]) -> None:
+        await self._tool("store_archetype", "store_archetype", {"user_ref": user_ref, "archetype": archetype, "compact": True})
+
+    async def snapshot(self, user_ref: str) -> None:
+        await self._tool("get_user_snapshot", "get_user_snapshot", {"user_ref": user_ref})
+
+    async def store_plan(self, user_ref: str, city: str, plan: Dict[str, Any]) -> Optional[str]:
+        body = await self._tool("store_dateops_plan", "store_dateops_plan", {"user_ref": user_ref, "city": city, "plan": plan, "compact": True})
+        return body.get("plan_id")
+
+    async def feedback(self, user_ref: str, date_plan_id: Optional[str]) -> None:
+        await self._tool("submit_feedback", "submit_feedback", {
+            "user_ref": user_ref, "rating": 4, "tags": ["fun"], "notes": None, "date_plan_id": date_plan_id,
+        })
+
+
+# ---- sessions ----
+
+async def _session(client: Any, flow: str, rng: random.Random, think_ms: float) -> None:
+    user_ref = f"load-{uuid.uuid4().hex[:16]}"
+
+    async def think() -> None:
+        if think_ms > 0:
+            await asyncio.sleep(rng.uniform(0, think_ms) / 1000)
+
+    await client.open()
+    if flow == "lite":
+        await client.log_events(user_ref, _events(["app_open", "quiz_started", "quiz_completed"]))
+        await think()
+        await client.store_archetype(user_ref, _archetype(rng))
+        await think()
+        await client.snapshot(user_ref)
+    else:
+        await client.log_events(user_ref, _events(["dateops_started"]))
+        await think()
+        plan_id = await client.store_plan(user_ref, rng.choice(["Austin", "Denver", "Chicago", "unspecified"]), _plan(rng))
+        await think()
+        await client.feedback(user_ref, plan_id)
+
+
+def _parse_mix(text: str) -> List[Tuple[str, float]]:
+    out = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() in ("lite", "dateops"):
+            out.append((name.strip(), float(weight or 1)))
+    return out or [("lite", 1.0)]
+
+
+async def _run_target(base_url: str, target: str, args: argparse.Namespace) -> Dict[str, Any]:
+    stats = Stats()
+    rng = random.Random(args.seed)
+    flows, weights = zip(*_parse_mix(args.mix))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as http:
+        spool_before = await _spool(http)
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def one() -> None:
+            async with sem:
+                client = McpClient(http, stats) if target == "mcp" else RestClient(http, stats)
+                await _session(client, rng.choices(flows, weights)[0], rng, args.think_ms)
+                stats.sessions += 1
+
+        t0 = time.perf_counter()
+        timeline: List[Dict[str, Any]] = []
+        sampler = asyncio.create_task(_sample(http, t0, args.sample_every, timeline)) if args.sample_every > 0 else None
+        await asyncio.gather(*(one() for _ in range(args.users)))
+        elapsed = time.perf_counter() - t0
+        if sampler is not None:
+            # Keep sampling after the load stops until the spool has drained (or --drain-wait).
+            deadline = time.perf_counter() + args.drain_wait
+            while time.perf_counter() < deadline and (not timeline or timeline[-1].get("spool_records")):
+                await asyncio.sleep(args.sample_every)
+            sampler.cancel()
+        spool_after = await _spool(http)
+
+    calls = sum(len(v) for v in stats.latency.values())
+    return {
+        "target": target,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "sessions_per_s": round(stats.sessions / elapsed, 1) if elapsed else None,
+        "calls_per_s": round(calls / elapsed, 1) if elapsed else None,
+        "rate_limited": sum(o.get("rate_limited", 0) for o in stats.outcomes.values()),
+        "overloaded": sum(o.get("overloaded", 0) for o in stats.outcomes.values()),
+        "errors": sum(n for o in stats.outcomes.values() for k, n in o.items() if k not in ("ok", "rate_limited", "overloaded")),
+        "spool": {"before": spool_before, "after": spool_after},
+        "steps": {step: {**_percentiles(lat), "outcomes": dict(stats.outcomes[step])} for step, lat in stats.latency.items()},
+        **({"timeline": timeline} if sampler is not None else {}),
+    }
+
+
+def _percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"n": 0}
+    v = sorted(values)
+
+    def pct(p: float) -> float:
+        return round(v[min(len(v) - 1, int(p / 100 * len(v)))], 1)
+
+    return {"n": len(v), "mean_ms": round(statistics.fmean(v), 1), "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99), "max_ms": round(v[-1], 1)}
+
+
+async def _spool(http: httpx.AsyncClient) -> Dict[str, Any]:
+    try:
+        r = await http.get("/api/health", params={"deep": "true"})
+        return r.json().get("spool") or {}
+    except Exception:
+        return {}
+
+
+async def _sample(http: httpx.AsyncClient, t0: float, every: float, out: List[Dict[str, Any]]) -> None:
+    """Cheap (cached) health reads: spool depth and breaker state over time."""
+    while True:
+        try:
+            body = (await http.get("/api/health")).json()
+            out.append({
+                "t_s": round(time.perf_counter() - t0, 1),
+                "spool_records": (body.get("spool") or {}).get("records"),
+                "breaker": body.get("breaker"),
+                "db_ok": body.get("db_ok"),
+                "db_pending": (body.get("admission") or {}).get("pending"),
+            })
+        except Exception:
+            pass
+        await asyncio.sleep(every)
+
+
+# ---- local server ----
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "LUNA_DB_BACKEND": "memory",
+        "LUNA_MEMORY_DB_LATENCY_MS": str(args.db_latency_ms),
+        "LUNA_SPOOL_DIR": tempfile.mkdtemp(prefix="luna-loadgen-spool-"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    if args.faults:
+        env["LUNA_FAULTS_FILE"] = os.path.abspath(args.faults)
+        # Probe often enough that recovery is visible at --sample-every resolution.
+        env.setdefault("LUNA_HEALTH_PROBE_SECONDS", "1")
+    cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(base_url + "/api/ready", timeout=1).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit("server did not become ready within 30s")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base-url", default=None, help="Existing server (default: start a local asgi:app on MemoryDB)")
+    ap.add_argument("--target", choices=["mcp", "rest", "both"], default="both")
+    ap.add_argument("--users", type=int, default=1000, help="Simulated users (one session each) per target")
+    ap.add_argument("--concurrency", type=int, default=100, help="Sessions in flight at once")
+    ap.add_argument("--mix", default="lite=0.7,dateops=0.3")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="Max random pause between steps of a session")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--db-latency-ms", type=float, default=0.0, help="Local server only: simulated DB round-trip")
+    ap.add_argument("--workers", type=int, default=1, help="Local server only: uvicorn worker processes")
+    ap.add_argument("--faults", default=None, help="Local server only: fault-injection scenario file (JSON)")
+    ap.add_argument("--sample-every", type=float, default=0.0, help="Seconds between spool/breaker samples (0 = off)")
+    ap.add_argument("--drain-wait", type=float, default=60.0, help="Max seconds to keep sampling for the spool to drain")
+    args = ap.parse_args()
+
+    proc = None
+    base_url = args.base_url
+    if base_url is None:
+        proc, base_url = _start_server(args)
+    try:
+        targets = ["mcp", "rest"] if args.target == "both" else [args.target]
+        report = [asyncio.run(_run_target(base_url, t, args)) for t in targets]
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+    print(json.dumps({"base_url": base_url, "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cold-start measurement: import time of the app module, time until /api/ready,
+and first-request latency. Each run is a fresh interpreter (true cold start).
+
+Usage:
+  python scripts/startup_bench.py                 # asgi:app, 5 runs
+  python scripts/startup_bench.py --module openapi_wrapper --runs 10
+  python scripts/startup_bench.py --path /api/health
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+mod = __import__(sys.argv[1])
+t_import = time.perf_counter() - t0
+
+from fastapi.testclient import TestClient
+with TestClient(getattr(mod, "app")) as c:
+    t1 = time.perf_counter()
+    while c.get("/api/ready").status_code != 200 and time.perf_counter() - t1 < 30:
+        time.sleep(0.005)
+    t_ready = time.perf_counter() - t0
+    t2 = time.perf_counter()
+    c.get(sys.argv[2])
+    t_first = time.perf_counter() - t2
+    t3 = time.perf_counter()
+    c.get(sys.argv[2])
+    t_second = time.perf_counter() - t3
+print(json.dumps({"import_ms": t_import * 1000, "ready_ms": t_ready * 1000,
+                  "first_request_ms": t_first * 1000, "second_request_ms": t_second * 1000}))
+"""
+
+
+def _run_once(module: str, path: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD, module, path],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="asgi")
+    ap.add_argument("--path", default="/api/live")
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    runs = [_run_once(args.module, args.path) for _ in range(max(1, args.runs))]
+    summary = {}
+    for key in runs[0]:
+        vals = [r[key] for r in runs]
+        summary[key] = {
+            "median": round(statistics.median(vals), 1),
+            "min": round(min(vals), 1),
+            "max": round(max(vals), 1),
+        }
+    print(json.dumps({"module": args.module, "path": args.path, "runs": len(runs), **summary}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
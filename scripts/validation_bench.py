@@ -0,0 +1,114 @@
+"""
+Validation cost per payload size for store_archetype-shaped bodies.
+
+For each size it times, per request:
+  - uncached:     new TypeAdapter per call + json.loads + validate (worst case)
+  - cached_dict:  json.loads + cached TypeAdapter.validate_python (FastAPI / FastMCP path)
+  - cached_json:  cached TypeAdapter.validate_json (parse + validate in pydantic-core)
+  - unknown_key:  an unknown top-level key rejected before the nested archetype is validated
+  - guarded:      the Content-Length check in luna.limits, which refuses oversized bodies
+                  before any of the above runs
+
+Usage:
+  python scripts/validation_bench.py
+  python scripts/validation_bench.py --traits 4,64,1024,8192 --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pydantic import TypeAdapter, ValidationError  # noqa: E402
+
+from luna.limits import BodySizeLimitMiddleware  # noqa: E402
+from openapi_wrapper import StoreArchetypeRequest  # noqa: E402
+
+
+def _payload(n_traits: int) -> bytes:
+    archetype = {
+        "level": "deep",
+        "archetype_name": "Quiet Strategist",
+        "tagline": "Plans three moves ahead, says half of them out loud.",
+        "share_card_copy": "You date like you play chess: patient, observant, occasionally too quiet. " * 3,
+        "traits": [
+            {"label": f"trait {i}", "score": 1 + i % 10, "evidence": "Mentions planning dates days ahead and checking reviews."}
+            for i in range(n_traits)
+        ],
+        "blind_spots": {"patterns": ["waits too long to text back"], "repairs": ["send the first message"]},
+    }
+    return json.dumps({"user_ref": "bench-user", "archetype": archetype}).encode("utf-8")
+
+
+def _per_call_us(fn, repeat: int) -> float:
+    fn()  # warm
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def _guard_us(size: int, max_bytes: int, repeat: int) -> float:
+    async def app(scope, receive, send):  # pragma: no cover - never reached when guarded
+        raise AssertionError("body should have been refused")
+
+    mw = BodySizeLimitMiddleware(app, max_bytes=max_bytes)
+    scope = {"type": "http", "path": "/api/archetype", "headers": [(b"content-length", str(size).encode())]}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def run():
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            await mw(scope, receive, send)
+        return (time.perf_counter() - t0) / repeat * 1e6
+
+    return asyncio.run(run())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--traits", default="2,16,128,1024,8192")
+    ap.add_argument("--repeat", type=int, default=100)
+    ap.add_argument("--max-bytes", type=int, default=int(os.getenv("LUNA_MAX_BODY_BYTES", "65536")))
+    args = ap.parse_args()
+
+    model = StoreArchetypeRequest
+    cached = TypeAdapter(model)
+    rows = []
+    for n in [int(x) for x in args.traits.split(",") if x.strip()]:
+        raw = _payload(n)
+        junk = raw[:-1] + b',"unexpected":true}'
+
+        def uncached():
+            TypeAdapter(model).validate_python(json.loads(raw))
+
+        def unknown_key():
+            try:
+                cached.validate_json(junk)
+            except ValidationError:
+                pass
+
+        row = {
+            "traits": n,
+            "bytes": len(raw),
+            "uncached_us": _per_call_us(uncached, max(1, args.repeat // 10)),
+            "cached_dict_us": _per_call_us(lambda: cached.validate_python(json.loads(raw)), args.repeat),
+            "cached_json_us": _per_call_us(lambda: cached.validate_json(raw), args.repeat),
+            "unknown_key_us": _per_call_us(unknown_key, args.repeat),
+            "guarded_us": _guard_us(len(raw), args.max_bytes, args.repeat) if len(raw) > args.max_bytes else None,
+        }
+        rows.append({k: (round(v, 1) if isinstance(v, float) else v) for k, v in row.items()})
+    print(json.dumps({"max_body_bytes": args.max_bytes, "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
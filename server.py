@@ -16,110 +16,57 @@ Cost strategy:
 # FastMCP needs to resolve type annotations immediately to build tool schemas.
 
 import os
-import json
 import logging
-from typing import Any, Dict, Literal, Optional
+from typing import Any, Dict, List, Optional
 
 from fastmcp import FastMCP, Context
 
-from luna.db import SupabaseDB
-from luna.errors import LunaError, error_payload
+from luna.logqueue import JsonRecordFormatter, install_queue_logging
 from luna.models import ArchetypeProfile, DateOpsPlan, LunaEvent, ToolMeta, model_dump
-from luna.ratelimit import RateLimiter
-from luna.spool import Spooler
-from luna.util import (
-    env_bool,
-    stable_hash_json,
-    stable_json_dumps,
-    utc_now_iso,
-    looks_like_specific_venue,
-)
+from luna.service import ServiceResult, get_service
+from luna.util import env_bool, utc_now_iso
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=LOG_LEVEL, format="%(message)s")
+LUNA_LOG_QUEUE_MAX = int(os.getenv("LUNA_LOG_QUEUE_MAX", "10000"))
+if env_bool("LUNA_LOG_ASYNC", True):
+    # Records are queued unformatted; a background thread serializes + writes in batches.
+    install_queue_logging(LOG_LEVEL, max_queue=LUNA_LOG_QUEUE_MAX)
+else:
+    # Same JSON lines as the queued path, written inline.
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(JsonRecordFormatter())
+    logging.basicConfig(level=LOG_LEVEL, handlers=[_log_handler])
 logger = logging.getLogger("luna")
 
-# ---- Config ----
-SUPABASE_URL = os.getenv("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "") or os.getenv("SUPABASE_KEY", "")
-LUNA_SPOOL_DIR = os.getenv("LUNA_SPOOL_DIR", "/tmp/luna_spool")
-LUNA_RATE_LIMIT_PER_MIN = int(os.getenv("LUNA_RATE_LIMIT_PER_MIN", "60"))
-LUNA_RATE_LIMIT_BURST = int(os.getenv("LUNA_RATE_LIMIT_BURST", "30"))
-
-REQUIRE_CONSENT = env_bool("LUNA_REQUIRE_CONSENT", False)
-
 # ---- Runtime ----
+# All gating / rate limiting / storage lives in the shared service core so the REST
+# wrapper (and asgi.py, which serves both) reuses the same DB client, limiter and spool.
+# Tools that touch storage go through svc.run(): the bounded DB pool with admission
+# control, so a slow database never blocks the event loop.
 mcp = FastMCP("Luna Relationship OS (Track A)")
-spool = Spooler(spool_dir=LUNA_SPOOL_DIR)
-rl = RateLimiter(rate_per_minute=LUNA_RATE_LIMIT_PER_MIN, burst=LUNA_RATE_LIMIT_BURST)
-
-db: Optional[SupabaseDB] = None
-if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
-    db = SupabaseDB(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+svc = get_service()
+svc.start_warmup()
 
 
 def _log_json(event: str, **fields: Any) -> None:
-    payload = {"event": event, "ts": utc_now_iso(), **fields}
-    logger.info(stable_json_dumps(payload))
-
-
-def _require_db() -> SupabaseDB:
-    if db is None:
-        raise LunaError("DB_NOT_CONFIGURED", "Supabase not configured. Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY.")
-    return db
-
-
-def _check_rate_limit(user_ref: str, cost: int = 1) -> None:
-    if not rl.allow(user_ref, cost=cost):
-        raise LunaError("RATE_LIMITED", "Too many requests. Try again in a minute.", retryable=True)
-
-
-def _spool_apply(kind: str, payload: Dict[str, Any]) -> None:
-    """
-    Replayer for auto-healing queue. This MUST be deterministic and safe to repeat.
-    """
-    d = _require_db()
-    if kind == "archetype":
-        d.insert_archetype(**payload)
-    elif kind == "dateplan":
-        d.insert_date_plan(**payload)
-    elif kind == "optout":
-        d.set_opt_out(payload["user_id"], payload["opt_out"])
-    elif kind == "event":
-        d.insert_event(**payload)
-    elif kind == "feedback":
-        d.insert_feedback(**payload)
-    else:
-        # unknown record type: drop
+    if not logger.isEnabledFor(logging.INFO):
         return
-
-
-def _maybe_drain_spool(ctx: Optional[Context] = None) -> None:
-    """
-    Best-effort drain; never throw.
-    """
-    try:
-        drained = spool.drain(_spool_apply, max_records=100)
-        if drained and ctx:
-            # low-noise: only tell client when meaningful
-            ctx.info(f"Recovered and replayed {drained} queued writes.")  # type: ignore
-    except Exception:
-        return
-
-
-def _ensure_user(user_ref: str) -> str:
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-    return user_id
-
-
-def _consent_gate(user_row: Dict[str, Any], user_ref: str) -> None:
-    if not REQUIRE_CONSENT:
-        return
-    if user_row.get("data_opt_out"):
-        raise LunaError("USER_OPTED_OUT", "User opted out of data storage.")
-    if not user_row.get("consent_version"):
-        raise LunaError("CONSENT_REQUIRED", "User consent required before storing data.", {"how": "Call accept_consent tool"})
+    # Hand off the dict as-is; JsonRecordFormatter serializes it (and stamps `ts`)
+    # off the request path.
+    logger.info({"event": event, **fields})
+
+
+async def _respond(result: ServiceResult, ctx: Optional[Context] = None) -> Dict[str, Any]:
+    if result.drained and ctx:
+        # low-noise: only tell client when meaningful
+        try:
+            await ctx.info(f"Recovered and replayed {result.drained} queued writes.")
+        except Exception:
+            pass
+    return {
+        "structuredContent": result.body,
+        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view=result.widget_view, warnings=result.warnings)),
+    }
 
 
 # ----------------------------
@@ -127,21 +74,14 @@ def _consent_gate(user_row: Dict[str, Any], user_ref: str) -> None:
 # ----------------------------
 
 @mcp.tool
-async def health(ctx: Context) -> Dict[str, Any]:
+async def health(ctx: Context, deep: bool = False) -> Dict[str, Any]:
     """
     Health status. Use this in deployment verification.
+    Answers from the background prober's cached state; deep=true runs a live DB check.
     """
-    ok = bool(db and db.ping())
-    _maybe_drain_spool(ctx)
-    return {
-        "structuredContent": {
-            "type": "luna_health",
-            "ok": ok,
-            "db_configured": bool(db),
-            "spool_path": str(spool.path),
-        },
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="health"))
-    }
+    if deep:
+        return await _respond(await svc.run("health", deep=True), ctx)
+    return await _respond(svc.health(), ctx)
 
 
 @mcp.tool
@@ -149,23 +89,9 @@ async def accept_consent(user_ref: str, consent_version: str, ctx: Context) -> D
     """
     Record user consent for data storage. Use ONLY when user explicitly agrees.
     """
-    _check_rate_limit(user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-
-    # Update consent_version via direct update
-    def _do():
-        d.sb.table("users").update({"consent_version": consent_version, "updated_at": utc_now_iso()}).eq("id", user_id).execute()
-    try:
-        _do()
-    except Exception as e:
-        spool.enqueue("optout", {"user_id": user_id, "opt_out": False}, error=str(e))
-    _maybe_drain_spool(ctx)
+    result = await svc.run("accept_consent", user_ref, consent_version)
     _log_json("consent", user_ref=user_ref, consent_version=consent_version)
-    return {
-        "structuredContent": {"type": "luna_consent", "status": "accepted", "consent_version": consent_version},
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="consent"))
-    }
+    return await _respond(result, ctx)
 
 
 @mcp.tool
@@ -173,19 +99,7 @@ async def set_data_opt_out(user_ref: str, opt_out: bool, ctx: Context) -> Dict[s
     """
     Opt-out switch. If opt_out=true, future calls will still work but will NOT store new records.
     """
-    _check_rate_limit(user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-    try:
-        d.set_opt_out(user_id, opt_out)
-    except LunaError as e:
-        spool.enqueue("optout", {"user_id": user_id, "opt_out": opt_out}, error=str(e))
-    _maybe_drain_spool(ctx)
-
-    return {
-        "structuredContent": {"type": "luna_opt_out", "opt_out": opt_out},
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="settings"))
-    }
+    return await _respond(await svc.run("set_opt_out", user_ref, opt_out), ctx)
 
 
 @mcp.tool
@@ -193,98 +107,19 @@ async def store_archetype(
     user_ref: str,
     archetype: ArchetypeProfile,
     ctx: Context,
+    compact: Optional[bool] = None,
+    projection: Optional[List[str]] = None,
 ) -> Dict[str, Any]:
     """
     Store a validated archetype (Lite or Deep).
     IMPORTANT:
       - ChatGPT must generate the archetype content.
       - This server only validates + stores. It does not call OpenAI.
+    compact=true returns only the ack, IDs and source_hash (you already have the profile).
+    projection=["profile.tagline", ...] returns just those (dotted) fields.
     """
-    _check_rate_limit(user_ref, cost=2)
-    d = _require_db()
-
-    user_id = d.upsert_user(user_ref)
-
-    # Opt-out gate
-    try:
-        # Fetch opt-out quickly (best-effort; if fails, proceed but avoid storing)
-        res = d.sb.table("users").select("data_opt_out,consent_version").eq("id", user_id).limit(1).execute()
-        user_row = res.data[0] if res.data else {}
-    except Exception:
-        user_row = {}
-
-    if user_row.get("data_opt_out"):
-        return {
-            "structuredContent": {
-                "type": "luna_archetype",
-                "stored": False,
-                "reason": "opted_out",
-                "profile": model_dump(archetype),
-            },
-            "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="archetype_card"))
-        }
-
-    # Consent gate (optional)
-    if REQUIRE_CONSENT and not user_row.get("consent_version"):
-        return {
-            "structuredContent": {
-                "type": "luna_archetype",
-                "stored": False,
-                "reason": "consent_required",
-                "profile": model_dump(archetype),
-            },
-            "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="archetype_card", warnings=["consent_required"]))
-        }
-
-    archetype_dict = model_dump(archetype)
-    # Deterministic idempotency key: hash of structured payload (not raw transcript)
-    source_hash = stable_hash_json(f"{user_ref}:{archetype.level}", archetype_dict)
-
-    payload = {
-        "user_id": user_id,
-        "level": archetype.level,
-        "source_hash": source_hash,
-        "archetype_json": archetype_dict,
-        "model_version": archetype.model_version,
-    }
-
-    try:
-        d.insert_archetype(**payload)
-    except LunaError as e:
-        # auto-healing fallback
-        spool.enqueue("archetype", payload, error=e.message)
-        return {
-            "structuredContent": {
-                "type": "luna_archetype",
-                "stored": False,
-                "profile": archetype_dict,
-            },
-            "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="archetype_card", warnings=["spooled_write"]))
-        }
-
-    _maybe_drain_spool(ctx)
-
-    # best-effort metrics
-    try:
-        d.insert_event(
-            user_id=user_id,
-            event_name="archetype_stored",
-            event_id=f"archetype:{source_hash}",
-            properties={"level": archetype.level, "source": archetype.source},
-            occurred_at=utc_now_iso(),
-        )
-    except Exception:
-        pass
-
-    return {
-        "structuredContent": {
-            "type": "luna_archetype",
-            "stored": True,
-            "profile": archetype_dict,
-            "card_copy": archetype.share_card_copy,
-        },
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="archetype_card"))
-    }
+    result = await svc.run("store_archetype", user_ref, archetype, compact=compact, projection=projection)
+    return await _respond(result, ctx)
 
 
 @mcp.tool
@@ -293,122 +128,19 @@ async def store_dateops_plan(
     city: str,
     plan: DateOpsPlan,
     ctx: Context,
+    compact: Optional[bool] = None,
+    projection: Optional[List[str]] = None,
 ) -> Dict[str, Any]:
     """
     Store a DateOps plan (criteria-only).
     Safety constraints:
       - MUST NOT contain specific venue names (Track A).
       - If detected, returns an error so ChatGPT can regenerate.
+    compact=true returns only the ack, IDs and source_hash; projection=["display_text"]
+    returns just the listed (dotted) fields.
     """
-    _check_rate_limit(user_ref, cost=2)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-
-    # Opt-out gate
-    try:
-        res = d.sb.table("users").select("data_opt_out").eq("id", user_id).limit(1).execute()
-        if res.data and res.data[0].get("data_opt_out"):
-            return {
-                "structuredContent": {"type": "luna_dateops", "stored": False, "reason": "opted_out", "plan": model_dump(plan)},
-                "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="dateops_plan")),
-            }
-    except Exception:
-        pass
-
-    plan_dict = model_dump(plan)
-
-    # Hard guardrails against venue hallucinations / proper nouns
-    suspicious = []
-    for field_path, text in [
-        ("primary_criteria.category", plan.primary_criteria.category),
-        ("primary_criteria.vibe_required", plan.primary_criteria.vibe_required),
-        ("backup_criteria.category", plan.backup_criteria.category),
-        ("backup_criteria.vibe_required", plan.backup_criteria.vibe_required),
-        ("invite_text", plan.invite_text),
-        ("backup_plan", plan.backup_plan or ""),
-    ]:
-        if looks_like_specific_venue(text):
-            suspicious.append(field_path)
-
-    if suspicious:
-        return {
-            "structuredContent": {
-                "type": "luna_dateops",
-                "stored": False,
-                "reason": "venue_name_detected",
-                "fields": suspicious,
-                "instructions": "Regenerate using ONLY generic criteria. No business names, no URLs, no @handles, no apostrophes.",
-            },
-            "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="dateops_plan", warnings=["venue_name_detected"]))
-        }
-
-    source_hash = stable_hash_json(f"{user_ref}:dateops:{city}", plan_dict)
-    payload = {"user_id": user_id, "source_hash": source_hash, "city": city, "plan_json": plan_dict}
-
-    try:
-        d.insert_date_plan(**payload)
-    except LunaError as e:
-        spool.enqueue("dateplan", payload, error=e.message)
-        return {
-            "structuredContent": {"type": "luna_dateops", "stored": False, "plan": plan_dict},
-            "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="dateops_plan", warnings=["spooled_write"]))
-        }
-
-    _maybe_drain_spool(ctx)
-
-    # best-effort metrics
-    try:
-        d.insert_event(
-            user_id=user_id,
-            event_name="dateops_stored",
-            event_id=f"dateops:{source_hash}",
-            properties={"city": city},
-            occurred_at=utc_now_iso(),
-        )
-    except Exception:
-        pass
-
-    return {
-        "structuredContent": {
-            "type": "luna_dateops",
-            "stored": True,
-            "city": city,
-            "plan": plan_dict,
-            "display_text": _render_dateops_markdown(plan_dict, city),
-        },
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="dateops_plan"))
-    }
-
-
-def _render_dateops_markdown(plan: Dict[str, Any], city: str) -> str:
-    p = plan
-    pc = p.get("primary_criteria", {})
-    bc = p.get("backup_criteria", {})
-    hooks = p.get("conversation_hooks", []) or []
-    hooks_md = "\n".join([f"- {h}" for h in hooks[:6]]) if hooks else "- (none)"
-    return f"""\
-## 🗓️ {p.get('plan_name','Date Plan')} ({city})
-
-**Time:** {p.get('suggested_time','')}
-
-### Primary criteria
-- Category: **{pc.get('category','')}**
-- Vibe: {pc.get('vibe_required','')}
-- Noise: {pc.get('noise_level','')}
-- Price: {pc.get('price_tier','')}
-
-### Backup criteria
-- Category: **{bc.get('category','')}**
-- Vibe: {bc.get('vibe_required','')}
-- Noise: {bc.get('noise_level','')}
-- Price: {bc.get('price_tier','')}
-
-### Invite text
-> {p.get('invite_text','').strip()}
-
-### Conversation hooks
-{hooks_md}
-"""
+    result = await svc.run("store_dateops_plan", user_ref, city, plan, compact=compact, projection=projection)
+    return await _respond(result, ctx)
 
 
 @mcp.tool
@@ -423,30 +155,17 @@ async def log_event(user_ref: str, event: LunaEvent, ctx: Context) -> Dict[str,
       - deep_started / deep_completed
       - dateops_started / dateops_completed
     """
-    _check_rate_limit(user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-
-    occurred_at = event.occurred_at or utc_now_iso()
-    payload = {
-        "user_id": user_id,
-        "event_name": event.event_name,
-        "event_id": event.event_id,
-        "properties": event.properties,
-        "occurred_at": occurred_at,
-    }
+    return await _respond(await svc.run("log_event", user_ref, event), ctx)
 
-    try:
-        d.insert_event(**payload)
-    except Exception as e:
-        spool.enqueue("event", payload, error=str(e))
 
-    _maybe_drain_spool(ctx)
-
-    return {
-        "structuredContent": {"type": "luna_event", "ok": True},
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="event_ack"))
-    }
+@mcp.tool
+async def log_events(user_ref: str, events: List[LunaEvent], ctx: Context) -> Dict[str, Any]:
+    """
+    Batch analytics logging: send a burst of events (e.g. app_open + quiz_started +
+    quiz_completed) in ONE call instead of several log_event calls.
+    Returns per-event status (stored / duplicate / spooled / skipped).
+    """
+    return await _respond(await svc.run("log_events", user_ref, events), ctx)
 
 
 @mcp.tool
@@ -461,45 +180,46 @@ async def submit_feedback(
     """
     Best-effort feedback logging (Track A learning loop).
     """
-    _check_rate_limit(user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-
-    payload = {
-        "user_id": user_id,
-        "date_plan_id": date_plan_id,
-        "rating": rating,
-        "tags": tags,
-        "notes": notes,
-    }
+    result = await svc.run("submit_feedback", user_ref, rating=rating, tags=tags, notes=notes, date_plan_id=date_plan_id)
+    return await _respond(result, ctx)
 
-    try:
-        d.insert_feedback(**payload)
-    except Exception as e:
-        spool.enqueue("feedback", payload, error=str(e))
 
-    _maybe_drain_spool(ctx)
+@mcp.tool
+async def get_user_snapshot(user_ref: str, ctx: Context) -> Dict[str, Any]:
+    """
+    Retrieve latest stored outputs for continuity across sessions.
+    """
+    return await _respond(await svc.run("get_user_snapshot", user_ref), ctx)
 
-    return {
-        "structuredContent": {"type": "luna_feedback", "ok": True},
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="feedback_ack"))
-    }
+
+@mcp.tool
+async def get_archetype_benchmarks(user_ref: str, ctx: Context, level: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Aggregate self-knowledge: how common the user's styles are, the percentile of
+    each trait score, and blind-spot patterns that often co-occur with theirs.
+    Cohort aggregates only. Never compare or match the user with other users.
+    """
+    return await _respond(await svc.run("get_archetype_benchmarks", user_ref, level), ctx)
 
 
 @mcp.tool
-async def get_user_snapshot(user_ref: str, ctx: Context) -> Dict[str, Any]:
+async def get_criteria_insights(user_ref: str, city: str, ctx: Context, limit: int = 10) -> Dict[str, Any]:
     """
-    Retrieve latest stored outputs for continuity across sessions.
+    Before writing a DateOps plan: which criteria (category, noise level, price tier)
+    got the best post-date ratings in this city, and the most common debrief tags.
+    Aggregates only; use them to pick criteria, never to name venues.
     """
-    _check_rate_limit(user_ref, cost=1)
-    d = _require_db()
-    user_id = d.upsert_user(user_ref)
-    snap = d.get_latest(user_id=user_id)
-    _maybe_drain_spool(ctx)
-    return {
-        "structuredContent": {"type": "luna_snapshot", "snapshot": snap},
-        "_meta": model_dump(ToolMeta(generated_at=utc_now_iso(), widget_view="snapshot"))
-    }
+    return await _respond(await svc.run("get_criteria_insights", user_ref, city, limit=limit), ctx)
+
+
+@mcp.tool
+async def export_user_data(user_ref: str, ctx: Context, cursor: Optional[str] = None, limit: int = 200) -> Dict[str, Any]:
+    """
+    Export everything stored for the user (archetypes, date plans, feedback, events)
+    as NDJSON, one page per call. Pass back next_cursor until done=true.
+    The REST endpoint GET /api/export/{user_ref} streams the whole export at once.
+    """
+    return await _respond(await svc.run("export_user_page", user_ref, cursor=cursor, limit=limit), ctx)
 
 
 # ----------------------------
@@ -508,5 +228,5 @@ async def get_user_snapshot(user_ref: str, ctx: Context) -> Dict[str, Any]:
 if __name__ == "__main__":
     # For local dev: `fastmcp run server.py`
     # For cloud: see DEPLOY.md
-    _log_json("startup", db_configured=bool(db), spool_dir=LUNA_SPOOL_DIR)
+    _log_json("startup", db_configured=bool(svc.db), spool_dir=svc.config.spool_dir)
     mcp.run()
@@ -0,0 +1,64 @@
+"""
+Shared fixtures. Everything runs against luna.memorydb.MemoryDB (LUNA_DB_BACKEND=memory):
+no Supabase, no network. Modules that build the process-wide service at import
+(server.py, openapi_wrapper.py) see the memory backend through the env set here.
+"""
+import os
+import sys
+from typing import Any
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("LUNA_DB_BACKEND", "memory")
+os.environ.setdefault("LUNA_SPOOL_DIR", os.path.join(ROOT, ".pytest_cache", "luna_spool"))
+
+from luna.models import ArchetypeProfile, DateOpsPlan, VenueCriteria  # noqa: E402
+from luna.service import LunaService, ServiceConfig  # noqa: E402
+
+
+def make_service(tmp_path: Any, *, db: Any = None, **overrides: Any) -> LunaService:
+    """
+    Memory-backed service; storage runs inline (no admission pool) unless db_workers is
+    set. Pass another service's `db` to model several workers sharing one database.
+    """
+    fields = {
+        "spool_dir": str(tmp_path / "spool"),
+        "db_backend": "memory",
+        "db_workers": 0,
+        "rate_burst": 10_000,
+        "rate_per_minute": 100_000,
+        "cohort_stats": False,
+    }
+    fields.update(overrides)
+    return LunaService(ServiceConfig(**fields), db=db)
+
+
+@pytest.fixture
+def service(tmp_path: Any) -> LunaService:
+    return make_service(tmp_path)
+
+
+def archetype(**fields: Any) -> ArchetypeProfile:
+    data = {
+        "level": "lite",
+        "archetype_name": "The Quiet Strategist",
+        "tagline": "Plans the date, then enjoys it",
+        "share_card_copy": "Thoughtful, steady and a little guarded at first.",
+    }
+    data.update(fields)
+    return ArchetypeProfile(**data)
+
+
+def plan(category: str = "wine bar", noise: str = "Quiet", invite: str = "want to grab a drink this friday?") -> DateOpsPlan:
+    crit = VenueCriteria(category=category, vibe_required="quiet and cozy", noise_level=noise)
+    return DateOpsPlan(
+        plan_name="Friday drinks",
+        suggested_time="friday 7pm",
+        constraints_summary="quiet, mid budget",
+        primary_criteria=crit,
+        backup_criteria=crit,
+        invite_text=invite,
+    )
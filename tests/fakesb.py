@@ -0,0 +1,205 @@
+"""
+Minimal in-memory stand-in for the supabase-py query builder, enough to drive
+luna.db.SupabaseDB in tests: table().select/insert/upsert/update/delete with
+eq / gt / in_ / is_ / or_ filters, order, limit and execute(). Inner embeds like
+`users!inner(data_opt_out)` join on `<table minus "s">_id` and can be filtered with
+eq("users.data_opt_out", ...).
+"""
+import copy
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+Row = Dict[str, Any]
+_COND = re.compile(r'^(\w+)\.(eq|gt|lt)\.(?:"(.*)"|(.*))$')
+_EMBED = re.compile(r"(\w+)!inner\(([\w,]+)\)")
+
+
+class Result:
+    def __init__(self, data: List[Row], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _split_top(expr: str) -> List[str]:
+    parts, depth, buf = [], 0, ""
+    for ch in expr:
+        if ch == "," and depth == 0:
+            parts.append(buf)
+            buf = ""
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        buf += ch
+    return parts + [buf] if buf else parts
+
+
+def _condition(expr: str) -> Callable[[Row], bool]:
+    if expr.startswith("and(") and expr.endswith(")"):
+        subs = [_condition(p) for p in _split_top(expr[4:-1])]
+        return lambda r: all(f(r) for f in subs)
+    m = _COND.match(expr)
+    if m is None:
+        raise ValueError(f"unsupported filter: {expr}")
+    col, op, quoted, bare = m.groups()
+    value = quoted if quoted is not None else bare
+
+    def check(r: Row) -> bool:
+        v = r.get(col)
+        if v is None:
+            return False
+        v = str(v)
+        return v == value if op == "eq" else (v > value if op == "gt" else v < value)
+    return check
+
+
+class Query:
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table_name = table
+        self.filters: List[Callable[[Row], bool]] = []
+        self.orders: List[Any] = []
+        self.limit_n: Optional[int] = None
+        self.op: Any = None
+        self.count: Optional[str] = None
+
+    # ---- verbs ----
+    def select(self, cols: str = "*", count: Optional[str] = None) -> "Query":
+        self.op = ("select", cols)
+        self.count = count
+        return self
+
+    def insert(self, rows: Any) -> "Query":
+        self.op = ("upsert", rows, "", False)
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = "", ignore_duplicates: bool = False) -> "Query":
+        self.op = ("upsert", rows, on_conflict, ignore_duplicates)
+        return self
+
+    def update(self, values: Row) -> "Query":
+        self.op = ("update", values)
+        return self
+
+    def delete(self) -> "Query":
+        self.op = ("delete",)
+        return self
+
+    # ---- filters ----
+    def eq(self, col: str, value: Any) -> "Query":
+        if "." in col:
+            table, field = col.split(".", 1)
+            self.filters.append(lambda r: (r.get(table) or {}).get(field) == value)
+        else:
+            self.filters.append(lambda r: r.get(col) == value)
+        return self
+
+    def gt(self, col: str, value: Any) -> "Query":
+        self.filters.append(lambda r: r.get(col) is not None and r.get(col) > value)
+        return self
+
+    def in_(self, col: str, values: List[Any]) -> "Query":
+        self.filters.append(lambda r: r.get(col) in values)
+        return self
+
+    def is_(self, col: str, value: str) -> "Query":
+        self.filters.append(lambda r: (r.get(col) is None) == (value == "null"))
+        return self
+
+    def or_(self, expr: str) -> "Query":
+        subs = [_condition(p) for p in _split_top(expr)]
+        self.filters.append(lambda r: any(f(r) for f in subs))
+        return self
+
+    def order(self, col: str, desc: bool = False) -> "Query":
+        self.orders.append((col, desc))
+        return self
+
+    def limit(self, n: int) -> "Query":
+        self.limit_n = n
+        return self
+
+    # ---- run ----
+    def _embeds(self) -> List[Any]:
+        return _EMBED.findall(self.op[1]) if self.op and self.op[0] == "select" else []
+
+    def _matching(self) -> List[Row]:
+        rows = self.client.rows(self.table_name)
+        embeds = self._embeds()
+        if embeds:
+            joined = []
+            for r in rows:
+                r = dict(r)
+                for table, cols in embeds:
+                    other = next((o for o in self.client.rows(table) if o.get("id") == r.get(table[:-1] + "_id")), None)
+                    if other is None:
+                        break
+                    r[table] = {c: other.get(c) for c in cols.split(",")}
+                else:
+                    joined.append(r)
+            rows = joined
+        return [r for r in rows if all(f(r) for f in self.filters)]
+
+    def execute(self) -> Result:
+        self.client.calls.append((self.table_name, self.op[0]))
+        kind = self.op[0]
+        if kind == "select":
+            rows = self._matching()
+            for col, desc in reversed(self.orders):
+                rows.sort(key=lambda r: str(r.get(col)), reverse=desc)
+            if self.limit_n is not None:
+                rows = rows[: self.limit_n]
+            cols = _EMBED.sub(lambda m: m.group(1), self.op[1])
+            if cols != "*":
+                names = [c.strip() for c in cols.split(",")]
+                rows = [{c: r.get(c) for c in names} for r in rows]
+            return Result(copy.deepcopy(rows), len(rows) if self.count else None)
+        if kind == "upsert":
+            return Result(self._upsert(*self.op[1:]))
+        if kind == "update":
+            rows = self._matching()
+            for r in rows:
+                r.update(copy.deepcopy(self.op[1]))
+            return Result(copy.deepcopy(rows))
+        rows = self._matching()
+        self.client.tables[self.table_name] = [r for r in self.client.rows(self.table_name) if r not in rows]
+        return Result(copy.deepcopy(rows))
+
+    def _upsert(self, rows: Any, on_conflict: str, ignore_duplicates: bool) -> List[Row]:
+        table = self.client.rows(self.table_name)
+        keys = [k for k in on_conflict.split(",") if k]
+        out = []
+        for r in rows if isinstance(rows, list) else [rows]:
+            existing = next((x for x in table if keys and all(x.get(k) == r.get(k) for k in keys)), None)
+            if existing is not None:
+                if not ignore_duplicates:  # ON CONFLICT DO NOTHING returns no row
+                    existing.update(copy.deepcopy(r))
+                    out.append(copy.deepcopy(existing))
+                continue
+            row = copy.deepcopy(r)
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+            table.append(row)
+            out.append(copy.deepcopy(row))
+        return out
+
+
+class FakeSupabase:
+    def __init__(self) -> None:
+        self.tables: Dict[str, List[Row]] = {}
+        self.calls: List[Any] = []
+
+    def rows(self, table: str) -> List[Row]:
+        return self.tables.setdefault(table, [])
+
+    def table(self, name: str) -> Query:
+        return Query(self, name)
+
+
+def fake_db(**kwargs: Any) -> Any:
+    """A SupabaseDB wired to a fresh FakeSupabase (reachable as `db.sb`)."""
+    from luna.db import SupabaseDB
+    db = SupabaseDB("http://fake.local", "key", **kwargs)
+    db._sb = FakeSupabase()
+    return db
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+
+from conftest import make_service
+from luna.models import LunaEvent
+
+
+def test_shed_writes_are_spooled_off_the_event_loop_and_not_reported_stored(tmp_path):
+    svc = make_service(tmp_path, db_workers=1, db_shed_pending=1)
+    release = threading.Event()
+    enqueued_on = []
+    enqueue = svc.spool.enqueue
+    svc.spool.enqueue = lambda *a, **kw: (enqueued_on.append(threading.current_thread()), enqueue(*a, **kw))[1]
+
+    async def scenario():
+        blocker = asyncio.ensure_future(svc.run("get_user_snapshot", "u0"))
+        await asyncio.sleep(0.05)  # the one pool thread is now busy
+        event = LunaEvent(event_name="app_open", event_id="event-0001", properties={})
+        shed_event = await svc.run("log_event", "u1", event)
+        shed_feedback = await svc.run("submit_feedback", "u1", rating=5, tags=None, notes=None, date_plan_id=None)
+        release.set()
+        await blocker
+        return shed_event.body, shed_feedback.body
+
+    snapshot = svc.get_user_snapshot
+    svc.get_user_snapshot = lambda *a, **kw: (release.wait(5), snapshot(*a, **kw))[1]
+    event, feedback = asyncio.run(scenario())
+
+    for body in (event, feedback):
+        assert (body["stored"], body["spooled"], body["reason"]) == (False, True, "overloaded")
+    assert len(enqueued_on) == 2
+    assert all(t is not threading.main_thread() for t in enqueued_on)
+
+
+def test_admission_recovers_after_a_wait_spike():
+    from luna.admission import LOW, NORMAL, AdmissionController
+
+    ctl = AdmissionController(workers=1, shed_pending=100, shed_wait_ms=100, wait_half_life_seconds=0.05)
+    try:
+        ctl.pending = 2  # a burst: two calls queued for a second each
+        ctl._started(1000.0)
+        ctl._started(1000.0)
+        assert ctl._admit(NORMAL, False) == "rejected"
+
+        ctl._done()  # one long call still running, no new samples
+        time.sleep(0.4)
+        assert ctl._admit(NORMAL, False) == "admitted"
+        ctl._done()
+
+        ctl._started(1000.0)
+        ctl._done()  # drained
+        assert ctl.pending == 0 and ctl.wait_ms == 0
+        assert ctl._admit(LOW, True) == "admitted"
+    finally:
+        ctl.shutdown()
@@ -0,0 +1,46 @@
+from conftest import archetype, make_service
+from fakesb import fake_db
+from luna.models import model_dump
+
+BIG = {"share_card_copy": "x" * 400, "tagline": "short"}
+
+
+def test_restore_after_purge_rewrites_blobs():
+    db = fake_db(blob_min_bytes=64)
+    db.insert_archetype(user_id="u1", level="quick", source_hash="h1", archetype_json=BIG)
+    assert db.sb.rows("content_blobs")
+
+    for table in ("archetypes", "content_blobs"):
+        db.delete_user_rows(table, user_id="u1", limit=100)
+    assert not db.sb.rows("content_blobs")
+
+    db.insert_archetype(user_id="u1", level="quick", source_hash="h1", archetype_json=BIG)
+    assert db.get_latest_archetype(user_id="u1")["archetype_json"] == BIG
+
+
+def test_purge_on_another_worker_does_not_strand_references():
+    a = fake_db(blob_min_bytes=64)
+    b = fake_db(blob_min_bytes=64)
+    b._sb = a.sb  # two workers, one database
+    a.insert_archetype(user_id="u1", level="quick", source_hash="h1", archetype_json=BIG)
+    b.delete_user_rows("content_blobs", user_id="u1", limit=100)
+
+    a.insert_archetype(user_id="u1", level="quick", source_hash="h2", archetype_json=BIG)
+    reader = fake_db()
+    reader._sb = a.sb
+    assert reader.get_latest_archetype(user_id="u1")["archetype_json"] == BIG
+
+
+def test_store_after_opt_out_purge_reads_back_whole(tmp_path):
+    svc = make_service(tmp_path, db=fake_db(blob_min_bytes=64), purge_on_opt_out=True)
+    card = archetype(share_card_copy="Thoughtful, steady and a little guarded at first. " * 4)
+    svc.store_archetype("u1", card)
+    user_id = svc.ensure_user("u1")
+    svc.set_opt_out("u1", True)
+    assert svc.purger.run_job(user_id)
+    assert not svc.db.sb.rows("content_blobs")
+
+    svc.set_opt_out("u1", False)
+    svc.store_archetype("u1", card)
+    stored = svc.db.get_latest_archetype(user_id=user_id)["archetype_json"]
+    assert stored["share_card_copy"] == model_dump(card)["share_card_copy"]
@@ -0,0 +1,38 @@
+import pytest
+
+from luna.cities import CityIndex, normalize_city
+
+
+@pytest.mark.parametrize("text, key", [
+    ("Brooklyn, NY", "new-york"),
+    ("NYC", "new-york"),
+    ("new york city", "new-york"),
+    ("New Orleans, LA", "new-orleans"),
+    ("NOLA", "new-orleans"),
+    ("Portland, OR", "portland-or"),
+    ("portland maine", "portland-me"),
+    ("São Paulo", "sao-paulo"),
+    ("St. Paul, MN", "minneapolis"),
+])
+def test_aliases_resolve_to_the_canonical_key(text, key):
+    assert CityIndex().key(text) == key
+
+
+def test_unknown_cities_share_a_slug_without_the_region():
+    cities = CityIndex()
+    assert cities.key("Reno, NV") == cities.key("reno nv") == cities.key("Reno") == "reno"
+    assert cities.key("Boise, Idaho") == "boise"  # not a known suffix, so only the comma split applies
+    assert cities.key("") == "unknown"
+
+
+def test_extra_aliases_extend_the_builtin_table(tmp_path):
+    path = tmp_path / "aliases.json"
+    path.write_text('{"reno": ["biggest little city"], "new-york": ["gotham"]}', encoding="utf-8")
+    cities = CityIndex.from_file(str(path))
+    assert cities.key("Biggest Little City") == "reno"
+    assert cities.key("Gotham") == cities.key("Brooklyn, NY") == "new-york"
+
+
+def test_normalize_city():
+    assert normalize_city("  Saint-Étienne ") == "saint etienne"
+    assert normalize_city("St. Louis") == "saint louis"
@@ -0,0 +1,101 @@
+import pytest
+
+from conftest import archetype, make_service
+from fakesb import fake_db
+from luna.models import model_dump
+
+pytest.importorskip("numpy")
+from luna.cohort import CohortStats  # noqa: E402
+
+
+def _rows(*versions):
+    """Archetype rows for one user/level: ids sort opposite to created_at."""
+    return [
+        {
+            "id": f"{9 - i:08d}-0000-0000-0000-000000000000",
+            "user_id": "user-1",
+            "level": "lite",
+            "source_hash": f"h{i}",
+            "created_at": f"2026-10-0{i + 1}T00:00:00+00:00",
+            "archetype_json": model_dump(archetype(communication_style=style)),
+        }
+        for i, style in enumerate(versions)
+    ]
+
+
+def test_supabase_iter_archetypes_is_oldest_first_across_pages():
+    db = fake_db()
+    db.sb.tables["users"] = [{"id": "user-1", "data_opt_out": False}]
+    db.sb.tables["archetypes"] = _rows("Direct", "Debater", "Storyteller")
+    rows = list(db.iter_archetypes(page_size=2))
+    assert [r["archetype_json"]["communication_style"] for r in rows] == ["Direct", "Debater", "Storyteller"]
+
+    cohort = CohortStats()
+    cohort.extend(rows)
+    assert cohort.distribution("communication_style")["counts"]["Storyteller"] == 1
+    assert cohort.distribution("communication_style")["total"] == 1
+
+
+def test_memory_backfill_keeps_the_latest_version(tmp_path):
+    writer = make_service(tmp_path / "w")
+    for style in ("Direct", "Debater", "Storyteller"):
+        writer.store_archetype("u1", archetype(communication_style=style))
+    for i, row in enumerate(sorted(writer.db.archetypes.values(), key=lambda r: r["created_at"])):
+        row["id"] = f"{9 - i:08d}"  # random UUIDs: id order says nothing about age
+
+    svc = make_service(tmp_path / "r", db=writer.db, cohort_stats=True)
+    svc._load_cohort()
+    counts = svc.cohort.distribution("communication_style")["counts"]
+    assert counts["Storyteller"] == 1 and counts["Direct"] == 0
+
+
+def test_opt_out_and_purge_remove_users_from_benchmarks(tmp_path):
+    svc = make_service(tmp_path, cohort_stats=True, purge_on_opt_out=True)
+    svc.store_archetype("u1", archetype(communication_style="Direct"))
+    svc.store_archetype("u2", archetype(communication_style="Debater"))
+    assert len(svc.cohort) == 2
+
+    svc.set_opt_out("u1", True)
+    assert len(svc.cohort) == 1
+    assert svc.cohort.distribution("communication_style")["counts"]["Direct"] == 0
+
+    svc.set_opt_out("u1", False)  # opted back in before the purge ran
+    assert svc.cohort.distribution("communication_style")["counts"]["Direct"] == 1
+
+    svc.set_opt_out("u1", True)
+    user_id = svc.ensure_user("u1")
+    svc.cohort.add(user_id, "lite", model_dump(archetype()))  # e.g. loaded by a backfill meanwhile
+    assert svc.purger.run_job(user_id)
+    assert len(svc.cohort) == 1
+
+
+def test_removed_rows_are_excluded_from_trait_and_pattern_queries():
+    cohort = CohortStats()
+    a = {"traits": [{"label": "Warm", "score": 9}], "blind_spots": {"patterns": ["late replies"]}}
+    cohort.add("u1", "lite", a)
+    cohort.add("u2", "lite", {**a, "traits": [{"label": "Warm", "score": 2}]})
+    assert cohort.remove("u1") == 1
+    assert cohort.trait_percentile("warm", 5)["n"] == 1
+    assert cohort.blind_spot_cooccurrence("late replies")["n"] == 1
+
+
+def test_opted_out_users_stay_out_of_the_backfill_after_a_restart(tmp_path):
+    svc = make_service(tmp_path / "a", cohort_stats=True)
+    svc.store_archetype("u1", archetype(communication_style="Direct"))
+    svc.store_archetype("u2", archetype(communication_style="Debater"))
+    svc.set_opt_out("u1", True)  # purge is off: the rows stay
+
+    restarted = make_service(tmp_path / "b", db=svc.db, cohort_stats=True)
+    restarted._load_cohort()
+    assert len(restarted.cohort) == 1
+    assert restarted.cohort.distribution("communication_style")["counts"]["Direct"] == 0
+
+
+def test_supabase_iter_archetypes_skips_opted_out_users():
+    db = fake_db()
+    db.sb.tables["users"] = [{"id": "user-1", "data_opt_out": True}, {"id": "user-2", "data_opt_out": False}]
+    db.sb.tables["archetypes"] = _rows("Direct") + [{**_rows("Debater")[0], "id": "x", "user_id": "user-2"}]
+    rows = list(db.iter_archetypes())
+    assert [(r["user_id"], sorted(r)) for r in rows] == [
+        ("user-2", ["archetype_json", "created_at", "id", "level", "user_id"]),
+    ]
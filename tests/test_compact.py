@@ -0,0 +1,63 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import luna.service
+import openapi_wrapper
+from conftest import archetype, make_service, plan
+from luna.service import shape_body
+
+
+def test_shape_body_keeps_acks_and_projected_paths():
+    body = {"type": "luna_archetype", "stored": True, "archetype_id": "a1", "profile": {"tagline": "t", "level": "lite"}, "card_copy": "c"}
+    assert shape_body(body) is body
+    assert shape_body(body, compact=True) == {"type": "luna_archetype", "stored": True, "archetype_id": "a1"}
+    assert shape_body(body, projection=["profile.tagline", "missing.path"]) == {
+        "type": "luna_archetype", "stored": True, "profile": {"tagline": "t"},
+    }
+    assert shape_body(body, compact=True, projection=["card_copy"])["card_copy"] == "c"
+
+
+def test_compact_store_returns_ids_without_the_document(tmp_path):
+    svc = make_service(tmp_path)
+    body = svc.store_archetype("u1", archetype(), compact=True).body
+    assert set(body) == {"type", "stored", "archetype_id", "source_hash"}
+    assert [r["id"] for r in svc.db.archetypes.values()] == [body["archetype_id"]]
+
+    full = make_service(tmp_path, compact_responses=True, db=svc.db).store_archetype("u1", archetype(), compact=False).body
+    assert full["profile"]["archetype_name"] == "The Quiet Strategist"
+
+
+def test_display_text_is_only_rendered_when_returned(tmp_path, monkeypatch):
+    renders = []
+    real = luna.service.render_dateops_markdown
+    monkeypatch.setattr(luna.service, "render_dateops_markdown", lambda *a: renders.append(1) or real(*a))
+    svc = make_service(tmp_path)
+
+    body = svc.store_dateops_plan("u1", "nyc", plan(), compact=True).body
+    assert "display_text" not in body and body["plan_id"]
+    body = svc.store_dateops_plan("u1", "nyc", plan(), projection=["plan_id"]).body
+    assert set(body) == {"type", "stored", "plan_id"}
+    assert renders == []
+    assert "display_text" in svc.store_dateops_plan("u1", "nyc", plan()).body
+    assert renders == [1]
+
+
+@pytest.fixture
+def client():
+    return TestClient(openapi_wrapper.create_app())
+
+
+def test_rest_fields_and_gzip(client):
+    req = {"user_ref": "rest-compact-1", "archetype": archetype().model_dump()}
+    res = client.post("/api/archetype?fields=profile.tagline", json=req)
+    body = res.json()
+    assert body["profile"] == {"tagline": "Plans the date, then enjoys it"}
+    assert "card_copy" not in body and "warnings" in body
+
+    req = {"user_ref": "rest-compact-1", "city": "nyc", "plan": plan().model_dump()}
+    res = client.post("/api/dateops", json=req, headers={"Accept-Encoding": "gzip"})
+    assert len(res.content) >= openapi_wrapper.LUNA_GZIP_MIN_BYTES
+    assert res.headers.get("content-encoding") == "gzip"
+    res = client.post("/api/dateops?compact=true", json=req, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in res.headers  # too small to be worth compressing
+    assert res.json()["stored"] is True
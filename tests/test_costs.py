@@ -0,0 +1,8 @@
+from luna.costs import CostModel
+
+
+def test_payload_bytes_counts_utf8_not_escapes():
+    model = CostModel()
+    text = "café ☕ 東京"
+    assert model.payload_bytes({"notes": text}) == len(f'{{"notes":"{text}"}}'.encode("utf-8"))
+    assert model.payload_bytes(text) == len(text.encode("utf-8"))
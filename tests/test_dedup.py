@@ -0,0 +1,54 @@
+import pytest
+
+from conftest import make_service, plan
+
+
+@pytest.mark.parametrize("store_rpc", [False, True])
+def test_replaced_plan_stores_the_returned_source_hash(tmp_path, store_rpc):
+    svc = make_service(tmp_path, store_rpc=store_rpc, plan_dedup_distance=6)
+    first = svc.store_dateops_plan("u1", "nyc", plan(invite="want to grab a drink this friday")).body
+    second = svc.store_dateops_plan("u1", "nyc", plan(invite="want to grab a drink this friday night")).body
+    assert second.get("replaced") is True
+    assert second["plan_id"] == first["plan_id"]
+
+    (row,) = svc.db.date_plans.values()
+    assert row["source_hash"] == second["source_hash"] != first["source_hash"]
+
+    again = svc.store_dateops_plan("u1", "nyc", plan(invite="want to grab a drink this friday night")).body
+    assert (again["plan_id"], again["source_hash"]) == (row["id"], row["source_hash"])
+    assert len(svc.db.date_plans) == 1
+
+
+def test_replace_defers_to_an_existing_row_with_the_same_hash():
+    from fakesb import fake_db
+    db = fake_db()
+    a = db.insert_date_plan(user_id="u1", source_hash="h1", city="nyc", plan_json={"v": 1}, simhash=1)
+    b = db.insert_date_plan(user_id="u1", source_hash="h2", city="nyc", plan_json={"v": 2}, simhash=2)
+    assert db.replace_date_plan(plan_id=a, user_id="u1", source_hash="h2", city="nyc", plan_json={"v": 3}, simhash=3) is None
+    assert db.replace_date_plan(plan_id=b, user_id="u1", source_hash="h3", city="nyc", plan_json={"v": 3}, simhash=3) == b
+    assert sorted(r["source_hash"] for r in db.sb.rows("date_plans")) == ["h1", "h3"]
+
+
+@pytest.mark.parametrize("store_rpc", [False, True])
+def test_near_duplicates_match_on_the_city_key(tmp_path, store_rpc):
+    svc = make_service(tmp_path, store_rpc=store_rpc, plan_dedup_distance=6, city_keys=True)
+    first = svc.store_dateops_plan("u1", "Brooklyn, NY", plan(invite="want to grab a drink this friday")).body
+    second = svc.store_dateops_plan("u1", "NYC", plan(invite="want to grab a drink this friday night")).body
+    assert second.get("replaced") is True
+    assert second["plan_id"] == first["plan_id"]
+    (row,) = svc.db.date_plans.values()
+    assert (row["city"], row["city_key"]) == ("NYC", "new-york")
+
+    other = svc.store_dateops_plan("u1", "Reno, NV", plan(invite="want to grab a drink this friday night")).body
+    assert not other.get("replaced")
+    assert len(svc.db.date_plans) == 2
+
+
+def test_index_keys_plans_stored_before_city_keys(tmp_path):
+    svc = make_service(tmp_path, plan_dedup_distance=6)
+    first = svc.store_dateops_plan("u1", "brooklyn", plan(invite="want to grab a drink this friday")).body
+    # Restart with city keys on: the index reloads the old row from storage.
+    svc = make_service(tmp_path, db=svc.db, plan_dedup_distance=6, city_keys=True)
+    second = svc.store_dateops_plan("u1", "New York, NY", plan(invite="want to grab a drink this friday night")).body
+    assert second.get("replaced") is True
+    assert second["plan_id"] == first["plan_id"]
@@ -0,0 +1,21 @@
+import pytest
+
+from conftest import make_service
+from fakesb import fake_db
+from luna.models import LunaEvent
+
+
+def _event(n):
+    return LunaEvent(event_name="quiz_started", event_id=f"event-{n:04d}", properties={})
+
+
+@pytest.mark.parametrize("backend", ["memory", "supabase"])
+def test_already_logged_events_are_reported_as_duplicates(tmp_path, backend):
+    svc = make_service(tmp_path, db=fake_db() if backend == "supabase" else None)
+    first = svc.log_events("u1", [_event(1), _event(2)]).body["results"]
+    assert [r["status"] for r in first] == ["stored", "stored"]
+
+    again = svc.log_events("u1", [_event(2), _event(3), _event(3)]).body["results"]
+    assert [(r["event_id"], r["status"]) for r in again] == [
+        ("event-0002", "duplicate"), ("event-0003", "stored"), ("event-0003", "duplicate"),
+    ]
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import threading
+
+from conftest import archetype, make_service
+
+
+def _lines(chunks):
+    return [json.loads(line) for line in "".join(chunks).splitlines()]
+
+
+def test_export_of_unknown_user_is_empty_and_creates_nothing(tmp_path):
+    svc = make_service(tmp_path)
+    lines = _lines(svc.export_user_data("nobody"))
+    assert [line["type"] for line in lines] == ["luna_export", "luna_export_end"]
+    assert set(lines[-1]["counts"].values()) == {0}
+
+    page = svc.export_user_page("nobody").body
+    assert (page["count"], page["done"]) == (0, True)
+    assert svc.db.find_user("nobody") is None
+
+
+def test_export_runs_on_the_db_pool(tmp_path):
+    svc = make_service(tmp_path, db_workers=2)
+    svc.store_archetype("u1", archetype())
+
+    async def export():
+        return _lines(await svc.run("export_user_data", "u1"))
+
+    lines = asyncio.run(export())
+    assert svc.admission.stats()["counts"]["normal"]["admitted"] == 1
+    assert "archetypes" in [line.get("table") for line in lines[1:-1]]
+    assert lines[-1]["counts"]["archetypes"] == 1
+
+
+def test_streamed_export_reads_every_page_on_the_db_pool(tmp_path):
+    svc = make_service(tmp_path, db_workers=1, export_page_size=2)
+    for i in range(5):
+        svc.store_archetype("u1", archetype(tagline=f"Take number {i}"))
+    threads = []
+    iter_user_rows = svc.db.iter_user_rows
+
+    def traced(*args, **kwargs):
+        for row in iter_user_rows(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            yield row
+    svc.db.iter_user_rows = traced
+
+    async def export():
+        lines = await svc.run("export_user_data", "u1")
+        return _lines([line async for line in svc.stream_export(lines)])
+
+    lines = asyncio.run(export())
+    assert lines[-1]["counts"]["archetypes"] == 5
+    assert threads and all(name.startswith("luna-db") for name in threads)
+    assert svc.admission.stats()["counts"]["normal"]["admitted"] > 3  # prelude + one call per page
@@ -0,0 +1,49 @@
+import pytest
+
+from fakesb import fake_db
+from luna.errors import LunaError
+from luna.faults import FaultInjector, FaultyDB
+from luna.memorydb import MemoryDB
+
+
+def _faulty(db, method):
+    return FaultyDB(db, FaultInjector({method: {"outage": True}}))
+
+
+def test_fault_on_generator_method_fires_while_iterating():
+    db = fake_db()
+    db.sb.rows("archetypes").append({"id": "a1", "user_id": "u1", "created_at": "2026-01-01"})
+    faulty = _faulty(db, "iter_user_rows")
+
+    with pytest.raises(LunaError) as e:
+        list(faulty.iter_user_rows("archetypes", user_id="u1"))
+    assert e.value.code == "DB_READ_FAILED"
+    assert faulty.injector.stats()["methods"]["iter_user_rows"]["outage"] == 3  # every retry
+
+
+def test_other_methods_are_not_hit_by_a_generator_rule():
+    db = fake_db()
+    faulty = _faulty(db, "iter_archetypes")
+    assert faulty.get_latest_archetype(user_id="u1") is None
+    assert "archetypes" not in faulty.injector.stats()["methods"]
+
+
+def test_memory_backend_fault_on_generator_method():
+    faulty = _faulty(MemoryDB(), "iter_archetypes")
+    with pytest.raises(LunaError) as e:
+        list(faulty.iter_archetypes())
+    assert e.value.code == "DB_FAULT_INJECTED"
+
+
+def test_client_built_after_wrapping_is_faulty_too():
+    from fakesb import FakeSupabase
+    from luna.db import SupabaseDB
+    db = SupabaseDB("http://fake.local", "key")
+    db.client_factory = lambda url, key: FakeSupabase()
+    faulty = _faulty(db, "get_latest_archetype")
+    assert db._sb is None  # wrapping does not build the client
+
+    with pytest.raises(LunaError) as e:
+        faulty.get_latest_archetype(user_id="u1")
+    assert e.value.code == "DB_READ_FAILED"
+    assert faulty.injector.stats()["methods"]["get_latest_archetype"]["outage"] >= 1
@@ -0,0 +1,36 @@
+from conftest import archetype, make_service, plan
+from luna.models import LunaEvent
+
+
+def test_opt_out_on_one_worker_blocks_writes_on_another(tmp_path):
+    a = make_service(tmp_path / "a")
+    b = make_service(tmp_path / "b", db=a.db)  # two workers, one database
+
+    assert b.store_archetype("u1", archetype()).body["stored"] is True
+    a.set_opt_out("u1", True)
+
+    body = b.store_archetype("u1", archetype(tagline="A second take")).body
+    assert (body["stored"], body["reason"]) == (False, "opted_out")
+    assert b.store_dateops_plan("u1", "nyc", plan()).body["reason"] == "opted_out"
+    assert b.log_event("u1", _event()).body["reason"] == "opted_out"
+
+
+def test_consent_on_one_worker_is_seen_by_another(tmp_path):
+    a = make_service(tmp_path / "a", require_consent=True)
+    b = make_service(tmp_path / "b", db=a.db, require_consent=True)
+
+    assert b.store_archetype("u1", archetype()).body["reason"] == "consent_required"
+    a.accept_consent("u1", "v1")
+    assert b.store_archetype("u1", archetype()).body["stored"] is True
+
+
+def test_gate_cache_is_opt_in(tmp_path):
+    svc = make_service(tmp_path, gate_ttl_seconds=60)
+    user_id = svc.ensure_user("u1")
+    assert svc.user_gate(user_id).get("data_opt_out") is False
+    svc.db.set_opt_out(user_id, True)  # changed by another worker
+    assert svc.user_gate(user_id).get("data_opt_out") is False  # the documented trade-off
+
+
+def _event():
+    return LunaEvent(event_name="app_open", event_id="event-0001")
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+
+from conftest import make_service
+
+
+def test_deep_health_probes_on_the_db_pool_without_draining(tmp_path):
+    svc = make_service(tmp_path, db_workers=2)
+    threads = []
+    drains = []
+    ping = svc.db.ping
+
+    def tracked_ping():
+        threads.append(threading.current_thread().name)
+        return ping()
+
+    svc.prober._ping = tracked_ping
+    svc.drain_spool = lambda *a, **k: drains.append(1) or 0  # type: ignore[method-assign]
+
+    body = asyncio.run(svc.run("health", deep=True)).body
+    assert body["db_ok"] is True
+    assert threads and threads[0].startswith("luna-db")
+    assert drains == []
+
+
+def test_shallow_health_does_no_io(tmp_path):
+    svc = make_service(tmp_path)
+    svc.prober._ping = lambda: (_ for _ in ()).throw(AssertionError("pinged"))
+    assert svc.health().body["db_ok"] is None
@@ -0,0 +1,44 @@
+from conftest import make_service, plan
+from luna.service import ServiceConfig
+
+
+def test_unrated_group_has_no_average(tmp_path, monkeypatch):
+    svc = make_service(tmp_path, criteria_insights=True, insights_min_count=0)
+    svc.store_dateops_plan("u1", "nyc", plan())
+    plan_id = svc.db.get_latest_date_plan(user_id=svc.ensure_user("u1"))["id"]
+    svc.submit_feedback("u1", rating=None, tags=["cozy"], notes=None, date_plan_id=plan_id)
+    svc.submit_feedback("u1", rating=4, tags=None, notes=None, date_plan_id=None)
+
+    body = svc.get_criteria_insights("u1", "nyc").body
+    assert [(c["avg_rating"], c["ratings"]) for c in body["criteria"]] == [(None, 0)]
+
+    monkeypatch.setenv("LUNA_INSIGHTS_MIN_COUNT", "0")
+    assert ServiceConfig.from_env().insights_min_count == 1
+
+
+def test_feedback_on_another_users_plan_is_not_counted(tmp_path):
+    svc = make_service(tmp_path, criteria_insights=True, insights_min_count=1)
+    svc.store_dateops_plan("u1", "nyc", plan())
+    plan_id = svc.db.get_latest_date_plan(user_id=svc.ensure_user("u1"))["id"]
+    svc.submit_feedback("u2", rating=1, tags=None, notes=None, date_plan_id=plan_id)
+    assert svc.get_criteria_insights("u2", "nyc").body["found"] is False
+
+
+def test_purged_feedback_leaves_the_aggregates(tmp_path):
+    svc = make_service(tmp_path, criteria_insights=True, insights_min_count=1, purge_on_opt_out=True)
+    for user_ref, rating, tags in (("u1", 5, ["Cozy", "loud"]), ("u2", 3, ["cozy"])):
+        svc.store_dateops_plan(user_ref, "nyc", plan())
+        plan_id = svc.db.get_latest_date_plan(user_id=svc.ensure_user(user_ref))["id"]
+        svc.submit_feedback(user_ref, rating=rating, tags=tags, notes="free text", date_plan_id=plan_id)
+    (row,) = svc.db.get_criteria_insights(city_key="nyc")
+    assert (row["feedback_count"], row["rating_sum"], row["tag_counts"]) == (2, 8, {"cozy": 2, "loud": 1})
+
+    svc.set_opt_out("u1", True)
+    assert svc.purger.run_job(svc.ensure_user("u1"))
+    (row,) = svc.db.get_criteria_insights(city_key="nyc")
+    assert (row["feedback_count"], row["rating_count"], row["rating_sum"]) == (1, 1, 3)
+    assert row["tag_counts"] == {"cozy": 1}
+
+    svc.set_opt_out("u2", True)
+    assert svc.purger.run_job(svc.ensure_user("u2"))
+    assert svc.db.get_criteria_insights(city_key="nyc") == []
@@ -0,0 +1,47 @@
+import asyncio
+import importlib.util
+import os
+import random
+
+import httpx
+
+import openapi_wrapper
+from conftest import ROOT
+
+_spec = importlib.util.spec_from_file_location("loadgen", os.path.join(ROOT, "scripts", "loadgen.py"))
+loadgen = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(loadgen)
+
+
+def _run_sessions(flow, n):
+    stats = loadgen.Stats()
+    rng = random.Random(7)
+
+    async def go():
+        transport = httpx.ASGITransport(app=openapi_wrapper.create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadgen.local") as http:
+            await asyncio.gather(*(loadgen._session(loadgen.RestClient(http, stats), flow, rng, 0) for _ in range(n)))
+    asyncio.run(go())
+    return stats
+
+
+def test_rest_sessions_replay_the_lite_flow():
+    stats = _run_sessions("lite", 5)
+    assert set(stats.outcomes) == {"log_events", "store_archetype", "get_user_snapshot"}
+    assert all(dict(o) == {"ok": 5} for o in stats.outcomes.values())
+
+
+def test_rest_dateops_feedback_references_the_stored_plan():
+    before = len(openapi_wrapper.svc.db.feedback)
+    stats = _run_sessions("dateops", 3)
+    assert all(dict(o) == {"ok": 3} for o in stats.outcomes.values())
+    rows = openapi_wrapper.svc.db.feedback[before:]
+    assert len(rows) == 3 and all(r["date_plan_id"] for r in rows)
+
+
+def test_mix_and_percentiles():
+    assert loadgen._parse_mix("lite=3,dateops,bogus=9") == [("lite", 3.0), ("dateops", 1.0)]
+    assert loadgen._parse_mix("") == [("lite", 1.0)]
+    p = loadgen._percentiles([float(i) for i in range(1, 101)])
+    assert (p["n"], p["p50_ms"], p["p99_ms"], p["max_ms"]) == (100, 51.0, 100.0, 100.0)
+    assert loadgen._percentiles([]) == {"n": 0}
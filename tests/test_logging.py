@@ -0,0 +1,23 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+from luna.logqueue import JsonRecordFormatter
+
+
+def test_formatter_serializes_dict_records():
+    record = logging.LogRecord("luna", logging.INFO, __file__, 1, {"event": "x", "n": 1}, None, None)
+    line = JsonRecordFormatter().format(record)
+    assert json.loads(line)["event"] == "x"
+
+
+def test_sync_logging_path_emits_json(tmp_path):
+    env = {**os.environ, "LUNA_LOG_ASYNC": "false", "LUNA_DB_BACKEND": "memory", "LUNA_SPOOL_DIR": str(tmp_path)}
+    code = "import server; server._log_json('probe_event', user_ref='u1')"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    lines = [json.loads(l) for l in out.stderr.splitlines() if l.startswith("{") and "probe_event" in l]
+    assert lines and lines[0]["user_ref"] == "u1" and "ts" in lines[0]
@@ -0,0 +1,85 @@
+import os
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+import openapi_wrapper
+from conftest import archetype, make_service
+from luna.errors import LunaError
+
+TOKEN = "admin-secret"
+
+
+def _code(fn, *args, **kwargs):
+    with pytest.raises(LunaError) as e:
+        fn(*args, **kwargs)
+    return e.value.code
+
+
+def test_profiling_is_off_and_unknown_without_configuration(tmp_path):
+    svc = make_service(tmp_path)
+    assert svc.profiler is None
+    assert "store_archetype" not in vars(svc)  # nothing wrapped
+    assert _code(svc.profile_status, TOKEN) == "NOT_FOUND"
+
+
+def test_admin_token_is_required(tmp_path):
+    svc = make_service(tmp_path, admin_token=TOKEN, profile_dir=str(tmp_path / "prof"))
+    assert _code(svc.profile_status, None) == "FORBIDDEN"
+    assert _code(svc.profile_status, "admin-secreT") == "FORBIDDEN"
+    assert svc.profile_status(TOKEN).body["type"] == "luna_profile"
+
+
+def test_listed_tools_are_timed_and_armed_calls_profiled(tmp_path):
+    out = tmp_path / "prof"
+    svc = make_service(tmp_path, admin_token=TOKEN, profile_dir=str(out), profile_tools=("store_archetype",))
+    svc.store_archetype("u1", archetype())
+    svc.arm_tool_profile(TOKEN, "store_archetype", calls=1)
+    svc.store_archetype("u1", archetype(tagline="A second take"))
+    svc.store_archetype("u1", archetype(tagline="A third take"))
+
+    status = svc.profile_status(TOKEN).body
+    assert status["tools"]["store_archetype"]["calls"] == 3
+    assert status["armed"] == {}
+    assert len(list(out.glob("tool-store_archetype-*.prof"))) == 1
+    assert _code(svc.arm_tool_profile, TOKEN, "get_latest_archetype") == "PROFILE_TOOL_NOT_WRAPPED"
+
+    with pytest.raises(ValueError):
+        make_service(tmp_path, profile_tools=("no_such_tool",))
+
+
+def test_sampling_profile_writes_collapsed_stacks(tmp_path):
+    svc = make_service(tmp_path, admin_token=TOKEN, profile_dir=str(tmp_path / "prof"))
+    started = svc.start_profile(TOKEN, seconds=0.2, interval_ms=5).body
+    assert started["status"] == "running"
+    assert _code(svc.start_profile, TOKEN, seconds=1) == "PROFILE_BUSY"
+    svc.profiler._sample_thread.join(5)
+
+    sample = svc.profile_status(TOKEN).body["sample"]
+    assert sample["status"] == "done" and sample["samples"] > 0
+    with open(started["file"], encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_memory_snapshot_starts_tracing_and_reports_growth(tmp_path):
+    was_tracing = tracemalloc.is_tracing()
+    svc = make_service(tmp_path, admin_token=TOKEN, profile_dir=str(tmp_path / "prof"))
+    try:
+        first = svc.memory_snapshot(TOKEN).body
+        assert first["tracing_started"] is not was_tracing
+        assert first["growth"] == []
+        keep = [bytearray(1024) for _ in range(2000)]  # noqa: F841
+        second = svc.memory_snapshot(TOKEN).body
+        assert second["growth"] and second["growth"][0]["size_diff_kb"] > 0
+        assert all(os.path.exists(path) for path in first["files"] + second["files"])
+    finally:
+        if not was_tracing:
+            svc.profiler.stop_tracemalloc()
+
+
+def test_admin_routes_are_hidden():
+    client = TestClient(openapi_wrapper.create_app())
+    assert client.get("/api/admin/profile", headers={"X-Luna-Admin-Token": TOKEN}).status_code == 404
+    assert not any(path.startswith("/api/admin") for path in client.get("/openapi.json").json()["paths"])
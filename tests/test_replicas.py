@@ -0,0 +1,71 @@
+from luna.replicas import ReplicaRouter
+
+
+class FakeDB:
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.calls = []
+
+    def ping(self):
+        return not self.fail
+
+    def _call(self, method, *args, **kwargs):
+        self.calls.append(method)
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        return self.name
+
+    def get_latest(self, *, user_id):
+        return self._call("get_latest", user_id=user_id)
+
+    def get_user_gate(self, user_id):
+        return self._call("get_user_gate", user_id)
+
+    def insert_event(self, *, user_id, **kwargs):
+        return self._call("insert_event", user_id=user_id)
+
+    def set_opt_out(self, user_id, opt_out):
+        return self._call("set_opt_out", user_id)
+
+
+def _router(*replicas, pin_seconds=30.0):
+    router = ReplicaRouter(FakeDB("primary"), list(replicas), pin_seconds=pin_seconds)
+    for p in router.probers:
+        p.record(True, 1)
+    return router
+
+
+def test_reads_go_to_a_healthy_replica_and_gates_stay_on_primary():
+    router = _router(FakeDB("replica"))
+    assert router.get_latest(user_id="u1") == "replica"
+    assert router.get_user_gate("u1") == "primary"
+    assert router.stats()["reads"]["replica"] == 1
+
+
+def test_failed_replica_read_falls_back_and_drops_the_replica():
+    replica = FakeDB("replica", fail=True)
+    router = _router(replica)
+    assert router.get_latest(user_id="u1") == "primary"
+    assert router.stats()["reads"]["replica_errors"] == 1
+    assert router.probers[0].db_ok is False
+
+    assert router.get_latest(user_id="u2") == "primary"
+    assert replica.calls == ["get_latest"]  # not retried until a probe succeeds
+    assert router.stats()["reads"]["primary_fallback"] == 1
+
+
+def test_write_pins_user_to_primary():
+    router = _router(FakeDB("replica"))
+    router.insert_event(user_id="u1", event_name="x")
+    router.set_opt_out("u2", True)
+    assert router.get_latest(user_id="u1") == "primary"
+    assert router.get_latest(user_id="u2") == "primary"
+    assert router.get_latest(user_id="u3") == "replica"
+    assert router.stats()["reads"]["primary_pinned"] == 2
+
+
+def test_no_pin_when_window_is_zero():
+    router = _router(FakeDB("replica"), pin_seconds=0)
+    router.insert_event(user_id="u1", event_name="x")
+    assert router.get_latest(user_id="u1") == "replica"
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import openapi_wrapper
+
+ORIGIN = "https://chatgpt.com"
+
+
+@pytest.fixture
+def client():
+    return TestClient(openapi_wrapper.create_app())
+
+
+def test_unknown_top_level_fields_use_the_error_envelope(client):
+    res = client.post("/api/opt-out", json={"user_ref": "u1", "opt_out": True, "optout": True, "x": 1})
+    assert res.status_code == 422
+    error = res.json()["error"]
+    assert (error["code"], error["details"]["fields"], error["retryable"]) == ("UNKNOWN_FIELDS", ["optout", "x"], False)
+
+
+def test_other_validation_errors_keep_fastapi_shape(client):
+    res = client.post("/api/opt-out", json={"user_ref": "u1"})
+    assert res.status_code == 422
+    assert "detail" in res.json()
+
+
+def test_oversized_body_gets_cors_headers(client):
+    body = b'{"user_ref": "' + b"x" * (openapi_wrapper.LUNA_MAX_BODY_BYTES + 1) + b'"}'
+    res = client.post("/api/opt-out", content=body, headers={"Origin": ORIGIN, "Content-Type": "application/json"})
+    assert res.status_code == 413
+    assert res.json()["error"]["code"] == "PAYLOAD_TOO_LARGE"
+    assert res.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_export_streams_through_the_service(client):
+    res = client.get("/api/export/rest-export-nobody")
+    assert res.status_code == 200
+    types = [json.loads(line)["type"] for line in res.text.splitlines()]
+    assert types == ["luna_export", "luna_export_end"]
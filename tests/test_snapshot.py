@@ -0,0 +1,35 @@
+from luna.snapshot import WarmState
+
+
+def _worker(path, state):
+    ws = WarmState(str(path))
+    restored = {}
+    ws.register("users", lambda: state, lambda s, age: restored.update(s))
+    return ws, restored
+
+
+def test_workers_sharing_a_path_keep_separate_snapshots(tmp_path):
+    path = tmp_path / "warm.bin"
+    a, _ = _worker(path, {"u1": "id-1"})
+    b, _ = _worker(path, {"u2": "id-2"})
+    assert a.save() and b.save()
+    assert a.file != b.file
+    a.stop()
+    b.stop()
+
+    c, from_c = _worker(path, {})
+    d, from_d = _worker(path, {})
+    c.restore()
+    d.restore()
+    assert [from_c, from_d] == [{"u1": "id-1"}, {"u2": "id-2"}]
+
+
+def test_slot_is_reused_after_stop(tmp_path):
+    path = tmp_path / "warm.bin"
+    a, _ = _worker(path, {})
+    a.save()
+    first = a.file
+    a.stop()
+    b, _ = _worker(path, {})
+    b.save()
+    assert b.file == first
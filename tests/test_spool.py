@@ -0,0 +1,59 @@
+import threading
+from collections import Counter
+
+from luna.spool import Spooler
+
+
+def test_two_spoolers_share_a_directory_without_loss_or_replays(tmp_path):
+    a = Spooler(str(tmp_path), segment_bytes=2_000)
+    b = Spooler(str(tmp_path), segment_bytes=2_000)
+    applied = Counter()
+    lock = threading.Lock()
+
+    def apply(kind, payload):
+        with lock:
+            applied[payload["id"]] += 1
+
+    def writer(spool, name):
+        for i in range(300):
+            spool.enqueue("event", {"id": f"{name}-{i}"})
+            if i % 25 == 0:
+                spool.drain(apply, max_records=50)
+
+    def drainer(spool, stop):
+        while not stop.is_set():
+            spool.drain(apply, max_records=40, force=True)
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=writer, args=(s, n)) for s, n in ((a, "a"), (b, "b"))]
+    threads += [threading.Thread(target=drainer, args=(s, stop)) for s in (a, b)]
+    for t in threads:
+        t.start()
+    for t in threads[:2]:
+        t.join()
+    stop.set()
+    for t in threads[2:]:
+        t.join()
+    while a.drain(apply, max_records=1000, force=True) + b.drain(apply, max_records=1000, force=True):
+        pass
+
+    assert len(applied) == 600
+    assert set(applied.values()) == {1}
+    assert a.stats()["records"] == 0
+
+
+def test_drain_is_cheap_when_nothing_was_spooled(tmp_path):
+    spool = Spooler(str(tmp_path), scan_seconds=60)
+    scans = []
+    segments = spool.segments
+    spool.segments = lambda: (scans.append(1), segments())[1]
+
+    spool.drain(lambda kind, payload: None)  # first call scans for leftovers
+    for _ in range(10):
+        assert spool.drain(lambda kind, payload: None) == 0
+    assert len(scans) == 1
+    assert not list(tmp_path.glob("seg-*"))
+
+    spool.enqueue("event", {"id": 1})
+    assert spool.drain(lambda kind, payload: None) == 1
+    assert len(scans) == 2
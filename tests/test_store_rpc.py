@@ -0,0 +1,91 @@
+import pytest
+
+from conftest import archetype, make_service, plan
+from luna.errors import LunaError
+
+
+def _fail_once(monkeypatch, db, method):
+    real = getattr(db, method)
+    calls = []
+
+    def flaky(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise LunaError("DB_STORE_FAILED", "injected", retryable=True)
+        return real(**kwargs)
+    monkeypatch.setattr(db, method, flaky)
+    return calls
+
+
+def test_archetype_tx_is_spooled_and_replayed(tmp_path, monkeypatch):
+    svc = make_service(tmp_path, store_rpc=True)
+    _fail_once(monkeypatch, svc.db, "store_archetype_tx")
+    result = svc.store_archetype("u1", archetype())
+    assert result.warnings == ["spooled_write"]
+    assert not svc.db.archetypes
+
+    assert svc.drain_spool(force=True) == 1
+    (row,) = svc.db.archetypes.values()
+    assert row["source_hash"] == result.body["source_hash"]
+    assert [e["event_name"] for e in svc.db.events.values()] == ["archetype_stored"]
+    assert svc.drain_spool(force=True) == 0  # replayed once
+
+
+def test_dateplan_tx_is_spooled_and_replayed(tmp_path, monkeypatch):
+    svc = make_service(tmp_path, store_rpc=True, plan_dedup_distance=6, city_keys=True)
+    _fail_once(monkeypatch, svc.db, "store_date_plan_tx")
+    result = svc.store_dateops_plan("u1", "NYC", plan())
+    assert result.warnings == ["spooled_write"]
+
+    assert svc.drain_spool(force=True) == 1
+    (row,) = svc.db.date_plans.values()
+    assert (row["source_hash"], row["city_key"]) == (result.body["source_hash"], "new-york")
+    assert row["simhash"] is not None
+
+
+def test_dateplan_replace_is_spooled_and_replayed(tmp_path, monkeypatch):
+    svc = make_service(tmp_path, plan_dedup_distance=6)
+    first = svc.store_dateops_plan("u1", "nyc", plan(invite="want to grab a drink this friday")).body
+    _fail_once(monkeypatch, svc.db, "replace_date_plan")
+    second = svc.store_dateops_plan("u1", "nyc", plan(invite="want to grab a drink this friday night"))
+    assert second.warnings == ["spooled_write"]
+
+    assert svc.drain_spool(force=True) == 1
+    (row,) = svc.db.date_plans.values()
+    assert (row["id"], row["source_hash"]) == (first["plan_id"], second.body["source_hash"])
+
+
+@pytest.mark.parametrize("kind", ["archetype", "dateplan"])
+def test_replay_after_opt_out_stores_nothing(tmp_path, monkeypatch, kind):
+    svc = make_service(tmp_path, store_rpc=True)
+    method = "store_archetype_tx" if kind == "archetype" else "store_date_plan_tx"
+    _fail_once(monkeypatch, svc.db, method)
+    if kind == "archetype":
+        svc.store_archetype("u1", archetype())
+    else:
+        svc.store_dateops_plan("u1", "nyc", plan())
+    # The opt-out lands first, then drains the spool: the replay hits the gate in the transaction.
+    assert svc.set_opt_out("u1", True).drained == 1
+    assert not svc.db.archetypes and not svc.db.date_plans and not svc.db.events
+
+
+@pytest.mark.parametrize("kind", ["archetype", "dateplan"])
+def test_tx_path_reports_the_gate(tmp_path, kind):
+    def store(svc, user_ref):
+        if kind == "archetype":
+            return svc.store_archetype(user_ref, archetype())
+        return svc.store_dateops_plan(user_ref, "nyc", plan())
+
+    svc = make_service(tmp_path, store_rpc=True, require_consent=True)
+    blocked = store(svc, "u1")
+    assert (blocked.body["stored"], blocked.body["reason"]) == (False, "consent_required")
+    assert blocked.warnings == ["consent_required"]
+
+    svc.accept_consent("u1", "v1")
+    assert store(svc, "u1").body["stored"] is True
+
+    svc.set_opt_out("u1", True)
+    opted_out = store(svc, "u1")
+    assert (opted_out.body["stored"], opted_out.body["reason"]) == (False, "opted_out")
+    assert opted_out.warnings == []
+    assert len(svc.db.events) == 1  # only the consented store logged an event
@@ -0,0 +1,96 @@
+import pytest
+
+import luna.users
+from conftest import make_service
+from luna.models import LunaEvent
+from luna.memorydb import MemoryDB
+from luna.users import UserDirectory
+
+
+class CountingDB(MemoryDB):
+    def __init__(self):
+        super().__init__()
+        self.upserts = 0
+        self.touches = []
+        self.fail_touch = False
+
+    def upsert_user(self, user_ref):
+        self.upserts += 1
+        return super().upsert_user(user_ref)
+
+    def touch_users(self, rows):
+        if self.fail_touch:
+            raise RuntimeError("down")
+        self.touches.append(rows)
+        super().touch_users(rows)
+
+
+@pytest.fixture
+def minute(monkeypatch):
+    now = ["2026-10-19T10:00:00+00:00"]
+    monkeypatch.setattr(luna.users, "_minute_iso", lambda: now[0])
+    return now
+
+
+def test_visits_within_a_minute_write_nothing(minute):
+    db = CountingDB()
+    users = UserDirectory(db)
+    user_id = users.resolve("u1")
+    assert all(users.resolve("u1") == user_id for _ in range(50))
+    assert db.upserts == 1
+    assert users.pending() == 0
+    assert users.flush() == 0 and db.touches == []
+
+
+def test_later_visits_are_flushed_in_one_batch(minute):
+    db = CountingDB()
+    users = UserDirectory(db)
+    for ref in ("u1", "u2", "u3"):
+        users.resolve(ref)
+    minute[0] = "2026-10-19T10:01:00+00:00"
+    for _ in range(10):
+        for ref in ("u1", "u2"):
+            users.resolve(ref)
+    assert db.upserts == 3
+    assert users.flush() == 2
+    assert db.touches == [[
+        {"chatgpt_user_ref": "u1", "last_seen_at": "2026-10-19T10:01:00+00:00"},
+        {"chatgpt_user_ref": "u2", "last_seen_at": "2026-10-19T10:01:00+00:00"},
+    ]]
+    assert db.users["u1"]["last_seen_at"] == "2026-10-19T10:01:00+00:00"
+    users.resolve("u1")
+    assert users.flush() == 0  # already written for this minute
+
+
+def test_failed_flush_keeps_the_newest_stamp(minute):
+    db = CountingDB()
+    users = UserDirectory(db)
+    users.resolve("u1")
+    minute[0] = "2026-10-19T10:01:00+00:00"
+    users.touch("u1")
+    db.fail_touch = True
+    assert users.flush() == 0
+    minute[0] = "2026-10-19T10:02:00+00:00"
+    users.touch("u1")
+    db.fail_touch = False
+    assert users.flush() == 1
+    assert db.touches == [[{"chatgpt_user_ref": "u1", "last_seen_at": "2026-10-19T10:02:00+00:00"}]]
+
+
+def test_stop_flushes_pending_visits(minute):
+    db = CountingDB()
+    users = UserDirectory(db)
+    users.resolve("u1")
+    minute[0] = "2026-10-19T10:01:00+00:00"
+    users.touch("u1")
+    users.stop()
+    assert len(db.touches) == 1
+
+
+def test_service_resolves_each_user_once(tmp_path):
+    db = CountingDB()
+    svc = make_service(tmp_path, db=db)
+    for i in range(20):
+        svc.log_event("u1", LunaEvent(event_name="app_open", event_id=f"event-{i:04d}"))
+        svc.get_latest_archetype("u1")
+    assert db.upserts == 1
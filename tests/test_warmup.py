@@ -0,0 +1,58 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+import openapi_wrapper
+from conftest import make_service
+from luna.db import SupabaseDB
+
+
+def test_supabase_client_is_built_on_first_use():
+    built = []
+    db = SupabaseDB("http://fake.local", "key")
+    db.client_factory = lambda url, key: built.append(url) or object()
+    assert built == []
+    client = db.sb
+    assert db.sb is client
+    assert built == ["http://fake.local"]
+
+
+def test_spool_dir_is_created_on_first_enqueue(tmp_path):
+    svc = make_service(tmp_path)
+    spool_dir = tmp_path / "spool"
+    assert not spool_dir.exists()
+    svc.spool.enqueue("event", {"id": 1})
+    assert spool_dir.is_dir()
+
+
+def test_ready_once_warm_up_finishes(tmp_path):
+    svc = make_service(tmp_path, warmup_timeout_seconds=60)
+    release = threading.Event()
+    svc.prober._ping = lambda: release.wait(5)
+    assert svc.readiness()["ready"] is False
+    assert svc.liveness()["ok"] is True
+
+    svc.start_warmup()
+    svc.start_warmup()  # idempotent
+    assert svc.readiness()["ready"] is False
+    release.set()
+    assert svc._warm_done.wait(5)
+    body = svc.readiness()
+    assert (body["ready"], body["warmed"], body["db_ok"]) == (True, True, True)
+    assert body["warmup_ms"] is not None
+    svc.shutdown()
+
+
+def test_ready_after_the_warm_up_timeout_even_if_still_warming(tmp_path):
+    svc = make_service(tmp_path, warmup_timeout_seconds=0)
+    body = svc.readiness()
+    assert (body["ready"], body["warmed"]) == (True, False)
+
+
+def test_ready_endpoint_is_503_until_ready(monkeypatch):
+    client = TestClient(openapi_wrapper.create_app())
+    monkeypatch.setattr(openapi_wrapper.svc, "readiness", lambda: {"type": "luna_ready", "ready": False})
+    assert client.get("/api/ready").status_code == 503
+    assert client.get("/api/live").status_code == 200
+    monkeypatch.setattr(openapi_wrapper.svc, "readiness", lambda: {"type": "luna_ready", "ready": True})
+    assert client.get("/api/ready").status_code == 200